@@ -30,7 +30,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'Inventoryapp.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -68,9 +70,33 @@ DATABASES = {
         'PASSWORD': config('DB_PASSWORD'),
         'HOST': config('DB_HOST'),
         'PORT': '3306',
+        # Keep connections open across requests (seconds, 0 = close after each
+        # request, None = unlimited) and check them before reuse
+        'CONN_MAX_AGE': config(
+            'DB_CONN_MAX_AGE', default='60', cast=lambda value: None if value == 'None' else int(value)
+        ),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# ASN/BSN number blocks are reserved in autocommit on a connection of their own,
+# so a reservation never waits on or rolls back with a request transaction
+DATABASES['sequences'] = dict(DATABASES['default'])
+ASN_SEQUENCE_DATABASE = 'sequences'
+
+# Numbers reserved per NEXTUPNUMBER round trip and kept in the process pool
+ASN_SEQUENCE_BLOCK_SIZE = config('ASN_SEQUENCE_BLOCK_SIZE', default=1, cast=int)
+
+# ASN generation sums pending captures of the same owner, location, case, SKU
+# and UOM into one ASN line (also per request with ?consolidate=1); the source
+# capture ids of each line are kept in ASNLINESOURCE
+ASN_CONSOLIDATE_CAPTURES = config('ASN_CONSOLIDATE_CAPTURES', default=False, cast=bool)
+
+# Order pending captures before ASN allocation so each owner's lines fill
+# whole ASNs: '' keeps capture order, 'owner' groups by owner, 'owner_location'
+# also orders by location within each owner (also per request with ?pack=)
+ASN_PACKING = config('ASN_PACKING', default='')
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -98,6 +124,129 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "static"),
 ]
+# collectstatic target, served by WhiteNoise straight from the app server
+STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
+# collectstatic writes content-hashed names (served with a one year, immutable
+# cache header) plus gzip and Brotli copies. DEBUG keeps the plain names, so
+# development and tests need no collectstatic run.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage" if DEBUG
+        else "whitenoise.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+
+# Excel export: stream write-only workbooks built from chunked reads instead of
+# rendering the whole export in memory (also available per request with ?mode=stream)
+EXCEL_EXPORT_STREAMING = config('EXCEL_EXPORT_STREAMING', default=False, cast=bool)
+EXCEL_EXPORT_CHUNK_SIZE = config('EXCEL_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Exports (download_excel, generate-asn-download) rendering at the same time in
+# one server process. Further export requests wait: on the event loop under
+# the ASGI worker, holding their worker thread under WSGI (gthread)
+EXPORT_CONCURRENCY = config('EXPORT_CONCURRENCY', default=2, cast=int)
+
+# Background export jobs: "Generate ASN & Download" queues a job for the
+# run_export_jobs worker instead of doing the work inside the request
+EXPORT_JOBS_ENABLED = config('EXPORT_JOBS_ENABLED', default=False, cast=bool)
+EXPORT_JOB_DIR = config('EXPORT_JOB_DIR', default=os.path.join(BASE_DIR, 'exports'))
+# A job still running this many seconds after it started is failed as
+# abandoned by its worker (keep it above the longest export)
+EXPORT_JOB_TIMEOUT = config('EXPORT_JOB_TIMEOUT', default=3600, cast=int)
+
+# Incremental exports (Inventoryapp.export_runs): export only the rows added
+# since the last run by id watermark instead of the DOWNLOADSTATUS scan, also
+# available per request with ?mode=incremental. Rows newer than
+# EXPORT_WATERMARK_LAG seconds wait for the next run; run workbooks are kept in
+# EXPORT_RUN_DIR for re-download. When on, "Generate ASN & Download" leaves
+# its lines for the next run as well
+EXCEL_EXPORT_INCREMENTAL = config('EXCEL_EXPORT_INCREMENTAL', default=False, cast=bool)
+EXPORT_WATERMARK_LAG = config('EXPORT_WATERMARK_LAG', default=5, cast=int)
+EXPORT_RUN_DIR = config('EXPORT_RUN_DIR', default=os.path.join(BASE_DIR, 'exports', 'runs'))
+
+# Export cache (Inventoryapp.export_cache): finished export files, kept by
+# export batch and content hash for re-download. Entries unused for
+# EXPORT_CACHE_MAX_AGE seconds are dropped, then the least recently used ones
+# until the cache fits in EXPORT_CACHE_MAX_BYTES
+EXPORT_CACHE_DIR = config('EXPORT_CACHE_DIR', default=os.path.join(BASE_DIR, 'exports', 'cache'))
+EXPORT_CACHE_MAX_BYTES = config('EXPORT_CACHE_MAX_BYTES', default=1024 * 1024 * 1024, cast=int)
+EXPORT_CACHE_MAX_AGE = config('EXPORT_CACHE_MAX_AGE', default=7 * 24 * 3600, cast=int)
+
+# Maximum capture lines accepted in one scanner batch upload
+CAPTURE_BATCH_MAX_LINES = config('CAPTURE_BATCH_MAX_LINES', default=500, cast=int)
+
+# download-inventory/ JSON: largest page size and NDJSON streaming chunk size
+DOWNLOAD_INVENTORY_MAX_PAGE = config('DOWNLOAD_INVENTORY_MAX_PAGE', default=5000, cast=int)
+DOWNLOAD_INVENTORY_CHUNK_SIZE = config('DOWNLOAD_INVENTORY_CHUNK_SIZE', default=2000, cast=int)
+
+# Seconds to coalesce USERMASTER last-login writes; queued logins are upserted
+# together by a timer once the interval has passed and when a worker exits
+# (0 = write at login)
+LAST_LOGIN_FLUSH_INTERVAL = config('LAST_LOGIN_FLUSH_INTERVAL', default=5, cast=float)
+
+# Sessions: cached_db reads sessions from the cache and writes through to the
+# database, so a scan request no longer reads the session row from MySQL.
+# The default file cache is shared by every worker process on the host; the
+# in-process locmem cache is only safe with a single worker process, since
+# other workers would keep serving a stale copy of a changed session.
+SESSION_ENGINE = config('SESSION_ENGINE', default='django.contrib.sessions.backends.cached_db')
+SESSION_CACHE_ALIAS = 'sessions'
+SESSION_SAVE_EVERY_REQUEST = False  # unchanged sessions are never re-saved
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sessions': {
+        'BACKEND': config('SESSION_CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('SESSION_CACHE_LOCATION', default=os.path.join(BASE_DIR, 'cache', 'sessions')),
+        'TIMEOUT': None,  # sessions expire through SESSION_COOKIE_AGE
+    },
+    # Holds the master data version stamp; must be shared by every process
+    # that imports or validates against masters (the file cache covers one host)
+    'masters': {
+        'BACKEND': config('MASTER_CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('MASTER_CACHE_LOCATION', default=os.path.join(BASE_DIR, 'cache', 'masters')),
+        'TIMEOUT': None,
+    },
+}
+
+# Seconds a process keeps its in-memory copy of the owner/SKU/location/UOM
+# masters before reloading it. Imports and edits from any process reload it
+# at once through the version stamp in the 'masters' cache.
+MASTER_CACHE_TTL = config('MASTER_CACHE_TTL', default=300, cast=int)
+
+# Per-request instrumentation (Inventoryapp.middleware.RequestMetricsMiddleware):
+# requests issuing more than QUERY_LIMIT queries (per view overrides in
+# VIEW_QUERY_LIMITS) or repeating one statement more than REPEATED_QUERY_LIMIT
+# times are logged as warnings on the Inventoryapp.requests logger
+REQUEST_METRICS = {
+    'QUERY_LIMIT': config('REQUEST_QUERY_LIMIT', default=50, cast=int),
+    'REPEATED_QUERY_LIMIT': config('REQUEST_REPEATED_QUERY_LIMIT', default=10, cast=int),
+    'VIEW_QUERY_LIMITS': {
+        'generate_asn_download': 25,
+        'login': 10,
+        'inventory': 10,
+    },
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'Inventoryapp.requests': {
+            'handlers': ['console'],
+            'level': config('REQUEST_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+    },
+}
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -18,6 +18,9 @@ urlpatterns = [
     # URL for inventory capture page
     path('inventory/', views.inventory_view, name='inventory'),
 
+    # JSON API for scanners uploading batches of captured lines
+    path('api/captures/', views.capture_batch_view, name='capture_batch'),
+
     # URL to handle user logout
     path('logout/', views.logout_view, name='logout'),
 
@@ -35,4 +38,25 @@ urlpatterns = [
 
     # URL to generate ASN number and download inventory Excel (actual flow)
     path('generate-asn-download/', views.generate_asn_and_download, name='generate_asn_download'),
+
+    # URLs to queue background ASN generation / export jobs, poll them and fetch the finished file
+    path('jobs/', views.export_job_create_view, name='export_job_create'),
+    path('jobs/<int:job_id>/', views.export_job_status_view, name='export_job_status'),
+    path('jobs/<int:job_id>/download/', views.export_job_download_view, name='export_job_download'),
+
+    # URLs to list incremental export runs and download an earlier run again
+    path('exports/runs/', views.export_run_list_view, name='export_run_list'),
+    path('exports/runs/<int:run_id>/download/', views.export_run_download_view, name='export_run_download'),
+
+    # URL to download an earlier export batch again from the export cache
+    path('exports/batches/<str:batch>/download/', views.export_batch_download_view, name='export_batch_download'),
+
+    # URL for supervisor capture/ASN totals from the hourly rollup tables
+    path('reports/rollups/', views.rollup_report_view, name='rollup_report'),
+
+    # URL for database connection reuse metrics of the serving process
+    path('metrics/connections/', views.connection_metrics_view, name='connection_metrics'),
+
+    # URL for per-view request/query metrics in Prometheus text format
+    path('metrics/', views.prometheus_metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import InventoryCapture, UserMaster, NextupNumber, DownloadInventory
+from .models import (
+    InventoryCapture, UserMaster, NextupNumber, DownloadInventory, ExportJob, ExportRun,
+    OwnerMaster, SkuMaster, LocationMaster, UomMaster, CaptureRollup, AsnRollup, AsnLineSource
+)
 from .forms import UserMasterForm
 
 # Show password as dots in admin
@@ -11,3 +14,12 @@ admin.site.register(InventoryCapture)
 admin.site.register(UserMaster, UserMasterAdmin)
 admin.site.register(NextupNumber)
 admin.site.register(DownloadInventory)
+admin.site.register(ExportJob)
+admin.site.register(ExportRun)
+admin.site.register(OwnerMaster)
+admin.site.register(SkuMaster)
+admin.site.register(LocationMaster)
+admin.site.register(UomMaster)
+admin.site.register(CaptureRollup)
+admin.site.register(AsnRollup)
+admin.site.register(AsnLineSource)
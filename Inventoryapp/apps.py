@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class InventoryappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Inventoryapp'
+
+    def ready(self):
+        from . import logins, masters, metrics
+        metrics.connect_signals()
+        logins.connect_signals()
+        masters.connect_signals()
@@ -0,0 +1,250 @@
+"""
+Benchmarks for the capture, ASN generation and export hot paths.
+
+Run with ``python manage.py run_benchmarks``. The suite builds throwaway test
+databases the same way ``manage.py test`` does (so it runs against SQLite or
+a local MySQL, whatever DATABASES points at, and never touches real data),
+seeds synthetic captures and measures:
+
+* ``scan``           -- POSTs to ``inventory_view``, one capture per request
+* ``generate_asns``  -- ``generate_pending_asns`` over N pending captures
+* ``export``         -- ``download_excel_view`` (pandas workbook) over N lines
+* ``export_stream``  -- ``download_excel_view?mode=stream`` over N lines
+* ``redownload``     -- the ``export_stream`` file again, from the export cache
+* ``export_csv``, ``export_ndjson``, ``export_parquet`` -- the same export
+  with ``?format=csv|ndjson|parquet``
+* ``generate_and_download`` -- the whole ``generate_asn_and_download`` POST
+
+Each result records rows/sec, SQL query count and the process peak RSS after
+the case, and export cases the size of the file in bytes. Peak RSS is a process high watermark, so cases run smallest first
+and only growth between sizes is meaningful.
+"""
+import json
+import logging
+import platform
+import resource
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import django
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+)
+from django.utils import timezone
+
+from .export_formats import EXPORT_FORMATS
+from .middleware import QueryRecorder, record_queries
+from .models import InventoryCapture, DownloadInventory, NextupNumber, STATUS_NEW
+from .utils import generate_pending_asns
+
+SIZES = (1000, 10000, 100000)
+SCANS = 500
+OWNERS = 7
+SEED_BATCH_SIZE = 5000
+BENCHMARK_USER = "benchmark"
+
+# A case regresses when its throughput drops by more than this share of the
+# baseline, or when it issues more queries than the baseline did.
+DEFAULT_TOLERANCE = 0.25
+
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes everywhere else
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+# Yields a dict the case can add figures of its own to (such as "bytes")
+@contextmanager
+def measure(results, name, rows):
+    recorder = QueryRecorder()
+    extra = {}
+    with record_queries(recorder):
+        started = time.perf_counter()
+        yield extra
+        seconds = time.perf_counter() - started
+
+    results.append({
+        "name": name,
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(rows / seconds, 1) if seconds else None,
+        "queries": recorder.count,
+        "peak_rss_kb": peak_rss_kb(),
+        **extra,
+    })
+
+
+def reset_data():
+    InventoryCapture.objects.all().delete()
+    DownloadInventory.objects.all().delete()
+    NextupNumber.objects.all().delete()
+
+
+def seed_captures(count):
+    now = timezone.now().replace(microsecond=0)
+    for start in range(0, count, SEED_BATCH_SIZE):
+        InventoryCapture.objects.bulk_create([
+            InventoryCapture(
+                owner=f"OWNER{i % OWNERS}",
+                location=f"LOC{i % 250:03d}",
+                case=f"CASE{i:07d}",
+                sku=f"SKU{i % 4000:05d}",
+                uom="EA",
+                quantity=i % 24 + 1,
+                username=BENCHMARK_USER,
+                status=STATUS_NEW,
+                created_date=now,
+            )
+            for i in range(start, min(start + SEED_BATCH_SIZE, count))
+        ])
+
+
+def mark_pending():
+    DownloadInventory.objects.update(download_status='no', export_batch=None)
+
+
+def drain(response):
+    """Consume a (possibly streamed) response and return its body size."""
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    response.close()
+    return size
+
+
+def scanner_client():
+    user = User.objects.get_or_create(username=BENCHMARK_USER)[0]
+    client = Client()
+    client.force_login(user)
+    client.post('/owner/', {'owner': 'OWNER0'})
+    return client
+
+
+def bench_scans(results, client, scans):
+    with measure(results, "scan", scans):
+        for i in range(scans):
+            client.post('/inventory/', {
+                'location': f"LOC{i % 250:03d}", 'sku': f"SKU{i:05d}", 'uom': 'EA',
+                'case': f"CASE{i:07d}", 'quantity': '1',
+            })
+    reset_data()
+
+
+def bench_size(results, client, size):
+    seed_captures(size)
+    with measure(results, "generate_asns", size):
+        generate_pending_asns(BENCHMARK_USER)
+
+    with measure(results, "export", size) as extra:
+        extra["bytes"] = drain(client.get('/download_excel/'))
+    mark_pending()
+    with measure(results, "export_stream", size) as extra:
+        response = client.get('/download_excel/', {'mode': 'stream'})
+        extra["bytes"] = drain(response)
+    with measure(results, "redownload", size) as extra:
+        extra["bytes"] = drain(client.get(f"/exports/batches/{response['X-Export-Batch']}/download/"))
+    for export_format in EXPORT_FORMATS:
+        if export_format == 'xlsx':
+            continue
+        mark_pending()
+        with measure(results, f"export_{export_format}", size) as extra:
+            extra["bytes"] = drain(client.get('/download_excel/', {'format': export_format}))
+
+    reset_data()
+    seed_captures(size)
+    with measure(results, "generate_and_download", size):
+        drain(client.post('/generate-asn-download/'))
+    reset_data()
+
+
+def run_suite(sizes=SIZES, scans=SCANS, log=None):
+    """Run every case against fresh test databases and return the report."""
+    log = log or (lambda message: None)
+    results = []
+
+    # One JSON log line per request would swamp the terminal and the timings
+    request_logger = logging.getLogger('Inventoryapp.requests')
+    previous_level = request_logger.level
+    request_logger.setLevel(logging.WARNING)
+
+    # Keep the exported files out of the real export cache
+    cache_dir = tempfile.TemporaryDirectory()
+    cache_settings = override_settings(EXPORT_CACHE_DIR=cache_dir.name)
+    cache_settings.enable()
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        client = scanner_client()
+        if scans:
+            log(f"scan x{scans}")
+            bench_scans(results, client, scans)
+        for size in sorted(sizes):
+            log(f"{size} captures")
+            bench_size(results, client, size)
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+        cache_settings.disable()
+        cache_dir.cleanup()
+        request_logger.setLevel(previous_level)
+
+    return {
+        "created": timezone.now().isoformat(timespec='seconds'),
+        "environment": {
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Pair each result with the baseline run of the same case and size.
+
+    Returns ``(rows, regressions)`` where every row is a dict with the
+    current and baseline figures and the throughput change.
+    """
+    previous = {(item["name"], item["rows"]): item for item in baseline.get("results", [])}
+    rows, regressions = [], []
+    for item in report["results"]:
+        base = previous.get((item["name"], item["rows"]))
+        if base is None:
+            continue
+        change = None
+        if item["rows_per_sec"] and base["rows_per_sec"]:
+            change = item["rows_per_sec"] / base["rows_per_sec"] - 1
+        row = {
+            "name": item["name"],
+            "rows": item["rows"],
+            "rows_per_sec": item["rows_per_sec"],
+            "baseline_rows_per_sec": base["rows_per_sec"],
+            "change": change,
+            "queries": item["queries"],
+            "baseline_queries": base["queries"],
+        }
+        row["regressed"] = (change is not None and change < -tolerance) or item["queries"] > base["queries"]
+        rows.append(row)
+        if row["regressed"]:
+            regressions.append(row)
+    return rows, regressions
+
+
+def load_report(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_report(report, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
@@ -0,0 +1,257 @@
+"""
+Content-addressed disk cache of generated export files.
+
+Layout under EXPORT_CACHE_DIR:
+
+* ``objects/<sha256>.<format>`` -- rendered files, named by a hash of the
+  format and of the Detail rows they contain (``SourceHash``)
+* ``refs/<key>.<format>``       -- one small file per export, holding the
+  hash of its object. ``key`` is the export batch (EXPORTBATCH) of a
+  DOWNLOADSTATUS or generate-and-export download, or ``run<id>`` for an
+  incremental export run.
+* ``tmp/``                      -- files being rendered
+
+An export renders into ``tmp/`` while its rows stream through the hash, then
+``publish`` moves the file to its object (or drops it when an identical
+object exists) and points the ref at it. A re-download (``lookup``) reads
+only the ref: no query and no render. When a ref is gone, the rows are read
+and hashed first, and the file is rendered only if no object has that hash.
+
+The cache never fails an export whose rows are already claimed:
+``publish_and_open`` and ``store`` log a cache error and hand back the
+rendered file (or nothing, for a file sent from memory) instead of raising.
+
+``evict`` runs after every publish (its errors are only logged), and from
+``python manage.py prune_export_cache``. It drops refs unused for EXPORT_CACHE_MAX_AGE seconds,
+then the least recently used objects until the cache fits in
+EXPORT_CACHE_MAX_BYTES. Objects no ref points to are deleted. Every step
+tolerates files removed by another process, and an open file keeps being
+served after its object is deleted.
+"""
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Part of every hash: bump it when writers change what they render
+CACHE_VERSION = 1
+
+# Files left in tmp/ longer than this belong to a crashed render
+STALE_TEMP_AGE = 3600
+
+# Objects no ref points to yet are kept this long, which covers a parallel
+# publish between moving its object in and writing its ref
+ORPHAN_GRACE = 60
+
+KEY_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
+
+
+def cache_dir(*parts):
+    path = os.path.join(
+        getattr(settings, 'EXPORT_CACHE_DIR', os.path.join(settings.BASE_DIR, 'exports', 'cache')), *parts
+    )
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def ref_path(key, name):
+    if not KEY_PATTERN.fullmatch(key) or not KEY_PATTERN.fullmatch(name):
+        raise ValueError(f"Invalid export cache key: {key}.{name}")
+    return os.path.join(cache_dir('refs'), f"{key}.{name}")
+
+
+def object_path(digest, name):
+    return os.path.join(cache_dir('objects'), f"{digest}.{name}")
+
+
+class SourceHash:
+    """sha256 of an export format and the Detail rows written in it."""
+
+    def __init__(self, name):
+        self.name = name
+        self.hasher = hashlib.sha256(f"{CACHE_VERSION}\n{name}\n".encode())
+        self.row_count = 0
+
+    # repr keeps 1 and '1' apart and is several times cheaper than JSON
+    def add(self, row):
+        self.hasher.update(repr(tuple(row)).encode() + b"\n")
+        self.row_count += 1
+
+    # Passes ``details`` through, hashing every row on the way
+    def rows(self, details):
+        for row in details:
+            self.add(row)
+            yield row
+
+    # Wraps an export writer so the rows it writes are hashed
+    def wrap(self, writer):
+        def write(output, receipts, details):
+            return writer(output, receipts, self.rows(details))
+        return write
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+
+# Open file in tmp/ to render into, then hand to publish() or discard()
+def render_file():
+    return tempfile.NamedTemporaryFile(dir=cache_dir('tmp'), delete=False)
+
+
+def discard(output):
+    output.close()
+    try:
+        os.remove(output.name)
+    except FileNotFoundError:
+        pass
+
+
+# Path of the cached ``name`` file of ``key``, or None. A hit marks the entry
+# used, for eviction.
+def lookup(key, name):
+    path = ref_path(key, name)
+    try:
+        with open(path, encoding='ascii') as ref:
+            digest = ref.read().strip()
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    target = object_path(digest, name)
+    return target if os.path.exists(target) else None
+
+
+# Points ``key`` at the object ``digest`` (which must exist) and returns its path
+def link(key, name, digest):
+    path = ref_path(key, name)
+    with tempfile.NamedTemporaryFile('w', dir=cache_dir('tmp'), delete=False, encoding='ascii') as ref:
+        ref.write(digest)
+    os.replace(ref.name, path)
+    return object_path(digest, name)
+
+
+# Stores the rendered ``output`` (from render_file) as the object ``digest``
+# and points ``key`` at it. Returns the object path.
+def publish(key, name, digest, output):
+    output.close()
+    target = object_path(digest, name)
+    if os.path.exists(target):
+        os.remove(output.name)
+    else:
+        os.replace(output.name, target)
+    path = link(key, name, digest)
+    try:
+        evict(keep={target})
+    except Exception:
+        logger.exception("Export cache eviction failed")
+    return path
+
+
+# publish() for an export whose rows are already claimed, returning the file
+# to send opened for reading. When caching fails the error is logged and the
+# rendered file itself is sent (unlinked once open), so the export still
+# reaches the user. Raises only when the rendered file is lost or incomplete.
+def publish_and_open(key, name, digest, output):
+    try:
+        return open(publish(key, name, digest, output), 'rb')
+    except OSError:
+        if not output.closed:
+            # Closing (flushing) the rendered file failed: it is incomplete
+            raise
+        logger.exception("Could not cache export %s.%s, sending it uncached", key, name)
+    try:
+        file = open(output.name, 'rb')
+    except FileNotFoundError:
+        # Moved in as the object before the failure
+        return open(object_path(digest, name), 'rb')
+    remove(output.name)
+    return file
+
+
+# Caches a copy of an export sent from memory. Errors are logged, not raised;
+# returns the object path, or None when the copy could not be cached.
+def store(key, name, digest, data):
+    output = None
+    try:
+        output = render_file()
+        output.write(data)
+        return publish(key, name, digest, output)
+    except OSError:
+        logger.exception("Could not cache export %s.%s", key, name)
+        if output:
+            discard(output)
+        return None
+
+
+# Removes a file another process may have removed already; returns its size
+def remove(path):
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+# Applies the age and size limits (settings by default). ``keep`` holds
+# object paths that must survive this pass. Returns the bytes freed.
+def evict(max_bytes=None, max_age=None, keep=()):
+    max_bytes = max_bytes if max_bytes is not None else getattr(settings, 'EXPORT_CACHE_MAX_BYTES', 1 << 30)
+    max_age = max_age if max_age is not None else getattr(settings, 'EXPORT_CACHE_MAX_AGE', 7 * 24 * 3600)
+    now = time.time()
+    freed = 0
+
+    for entry in os.scandir(cache_dir('tmp')):
+        try:
+            if now - entry.stat().st_mtime > STALE_TEMP_AGE:
+                freed += remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+    # Object path -> (refs pointing at it, last use)
+    used = {}
+    expired = set()
+    for entry in os.scandir(cache_dir('refs')):
+        try:
+            last_use = entry.stat().st_mtime
+            with open(entry.path, encoding='ascii') as ref:
+                target = object_path(ref.read().strip(), entry.name.rsplit('.', 1)[1])
+        except FileNotFoundError:
+            continue
+        if now - last_use > max_age and target not in keep:
+            remove(entry.path)
+            expired.add(target)
+            continue
+        refs, previous = used.get(target, ([], 0))
+        refs.append(entry.path)
+        used[target] = (refs, max(previous, last_use))
+
+    sizes = {}
+    for entry in os.scandir(cache_dir('objects')):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        if entry.path not in used and entry.path not in keep:
+            if entry.path in expired or now - stat.st_mtime > ORPHAN_GRACE:
+                freed += remove(entry.path)
+            continue
+        sizes[entry.path] = stat.st_size
+
+    total = sum(sizes.values())
+    for target in sorted(used, key=lambda path: used[path][1]):
+        if total <= max_bytes:
+            break
+        if target in keep:
+            continue
+        for ref in used[target][0]:
+            remove(ref)
+        removed = remove(target)
+        freed += removed
+        total -= removed
+    return freed
@@ -1,123 +1,331 @@
 # Required libraries
+import uuid
 import pandas as pd
-import mysql.connector
 from io import BytesIO
 from django.shortcuts import redirect
 from django.contrib import messages
-from django.http import HttpResponse
 from datetime import datetime
-from decouple import config
-from .models import NextupNumber
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Max, Min
+from django.http import FileResponse, HttpResponse
+from openpyxl import Workbook
+from . import export_cache
+from .models import DownloadInventory
+from .utils import allocate_pending_asns
 
-def export_datas_to_excel(request):
-    mydb = None
-    cursor = None
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
 
-    try:
-        mydb = mysql.connector.connect(
-            host=config('DB_HOST'),
-            user=config('DB_USER'),
-            password=config('DB_PASSWORD'),
-            database=config('DB_NAME'),
-        )
-        cursor = mydb.cursor()
+# Description and header rows of the Data sheet
+DATA_DESC = ['Column Name', 'GenericKey', 'RECEIPTKEY', 'STORERKEY', 'STATUS']
+DATA_HEADERS = ['Messages', 'GenericKey', 'ASN/Receipt', 'Owner', 'Receipt Status']
 
-        query = """
-        SELECT id, ASNNUMBER, SKU, OWNER, LINENUMBER, QUANTITY, UOM, `CASE` AS TOID, LOCATION 
-        FROM DOWNLOADINVENTORY 
-        WHERE DOWNLOADSTATUS = 'no'
-        """
-        df = pd.read_sql(query, con=mydb)
+# Description and header rows of the Detail sheet
+DETAIL_DESC = ['Column Name', 'GenericKey', 'RECEIPTKEY', 'SKU', 'STORERKEY',
+               'RECEIPTLINENUMBER', 'QTYEXPECTED', 'UOM', 'TOID', 'TOLOC']
+DETAIL_HEADERS = ['Messages', 'GenericKey', 'ASN/Receipt', 'Item', 'Owner',
+                  'Line #', 'Expected Qty', 'UOM', 'LPN', 'Location']
+
+# Validations sheet
+VALIDATION_ROWS = [
+    ['Date Format', 'M/d/yy h:mm a', 'MM=Month, dd=Day, yy=Year, mm=Minute, hh=Hour'],
+    ['Time Zone', '(GMT-05:00) Eastern Time (US & Canada)', 'America/New_York'],
+    ['Empty Fields', '[blank]', 'Put [blank] to remove existing values']
+]
+
+# DownloadInventory fields in Detail sheet column order
+DETAIL_FIELDS = ['asn_number', 'sku', 'owner', 'line_number', 'quantity', 'uom', 'case', 'location']
+
+# Export frame columns, named after the DOWNLOADINVENTORY columns they come from
+EXPORT_COLUMNS = ['id', 'ASNNUMBER', 'SKU', 'OWNER', 'LINENUMBER', 'QUANTITY', 'UOM', 'TOID', 'LOCATION']
+
+
+def export_filename(extension='xlsx'):
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return f'inventory_data_{timestamp}.{extension}'
+
+
+# Puts the description and header rows on top of the sheet body, with the
+# Messages/GenericKey columns left blank, column-wise instead of row by row.
+def build_sheet_frame(desc, headers, body):
+    body = body.set_axis(headers[2:], axis=1)
+    body.insert(0, headers[1], '')
+    body.insert(0, headers[0], '')
+    top = pd.DataFrame([desc, headers], columns=headers)
+    return pd.concat([top, body], ignore_index=True)
+
+
+def build_data_sheet(df):
+    df_data = df[['ASNNUMBER', 'OWNER']].drop_duplicates()
+    return build_sheet_frame(DATA_DESC, DATA_HEADERS, df_data.assign(STATUS=0))
+
+
+def build_detail_sheet(df):
+    df_detail = df[['ASNNUMBER', 'SKU', 'OWNER', 'LINENUMBER', 'QUANTITY', 'UOM', 'TOID', 'LOCATION']]
+    return build_sheet_frame(DETAIL_DESC, DETAIL_HEADERS, df_detail)
+
+
+# Picks the streaming export when asked for with ?mode=stream or enabled in settings
+def export_inventory_excel(request):
+    if request.GET.get('mode') == 'stream' or getattr(settings, 'EXCEL_EXPORT_STREAMING', False):
+        return stream_datas_to_excel(request)
+    return export_datas_to_excel(request)
 
-        if df.empty:
-            messages.warning(request, "Sorry, no data found to export!")
-            return redirect("inventory")
 
-        #  Prepare Data sheet
-        df_data = df[['ASNNUMBER', 'OWNER']].drop_duplicates()
-        df_data['STATUS'] = 0
-        df_data = df_data[['ASNNUMBER', 'OWNER', 'STATUS']]
-        data_desc = ['Column Name', 'GenericKey', 'RECEIPTKEY', 'STORERKEY', 'STATUS']
-        data_headers = ['Messages', 'GenericKey', 'ASN/Receipt', 'Owner', 'Receipt Status']
-        data_rows = [data_desc, data_headers]
-        for _, row in df_data.iterrows():
-            data_rows.append(['', ''] + row.tolist())
-        df_data_final = pd.DataFrame(data_rows, columns=data_headers)
-
-        # 📦 Prepare Detail sheet
-        df_detail = df[['ASNNUMBER', 'SKU', 'OWNER', 'LINENUMBER', 'QUANTITY', 'UOM', 'TOID', 'LOCATION']]
-        detail_desc = ['Column Name', 'GenericKey', 'RECEIPTKEY', 'SKU', 'STORERKEY',
-                       'RECEIPTLINENUMBER', 'QTYEXPECTED', 'UOM', 'TOID', 'TOLOC']
-        detail_headers = ['Messages', 'GenericKey', 'ASN/Receipt', 'Item', 'Owner',
-                          'Line #', 'Expected Qty', 'UOM', 'LPN', 'Location']
-        detail_rows = [detail_desc, detail_headers]
-        for _, row in df_detail.iterrows():
-            detail_rows.append(['', ''] + row.tolist())
-        df_detail_final = pd.DataFrame(detail_rows, columns=detail_headers)
-
-        # Validations sheet
-        validation_data = [
-            ['Date Format', 'M/d/yy h:mm a', 'MM=Month, dd=Day, yy=Year, mm=Minute, hh=Hour'],
-            ['Time Zone', '(GMT-05:00) Eastern Time (US & Canada)', 'America/New_York'],
-            ['Empty Fields', '[blank]', 'Put [blank] to remove existing values']
-        ]
-        df_validations = pd.DataFrame(validation_data)
-
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df_data_final.to_excel(writer, index=False, header=False, sheet_name='Data')
-            df_detail_final.to_excel(writer, index=False, header=False, sheet_name='Detail')
-            df_validations.to_excel(writer, index=False, header=False, sheet_name='Validations')
-
-        output.seek(0)
-        response = HttpResponse(
-            output.read(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# Marks every row pending download as downloaded and stamps it with ``batch``,
+# one set-based UPDATE per chunk of ids. The export then reads back exactly the
+# rows carrying its stamp: rows inserted (or committed) after their chunk was
+# claimed keep DOWNLOADSTATUS='no' and go out with the next export, and a
+# parallel export can never claim the same row twice. Callers either run this
+# in one transaction with the workbook, so the claim rolls back if the
+# workbook cannot be produced, or commit the claim first and release_batch()
+# on failure. Returns the number of rows claimed.
+def claim_pending_rows(batch, chunk_size=None):
+    chunk_size = chunk_size or getattr(settings, 'EXCEL_EXPORT_CHUNK_SIZE', 2000)
+
+    pending = DownloadInventory.objects.filter(download_status='no')
+    last_id = pending.aggregate(last_id=Max('pk'))['last_id']
+    if last_id is None:
+        return 0
+
+    # Stop at the rows that existed when the export started
+    pending = pending.filter(pk__lte=last_id)
+    claimed = 0
+    last_seen = 0
+    while True:
+        ids = list(pending.filter(pk__gt=last_seen).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            break
+        claimed += DownloadInventory.objects.filter(pk__in=ids, download_status='no').update(
+            download_status='yes', export_batch=batch
         )
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        response['Content-Disposition'] = f'attachment; filename=inventory_data_{timestamp}.xlsx'
-
-        # Mark as downloaded
-        ids = df['id'].tolist()
-        if ids:
-            update_query = """
-                UPDATE DOWNLOADINVENTORY 
-                SET DOWNLOADSTATUS = 'yes' 
-                WHERE id = %s
-            """
-            cursor.executemany(update_query, [(i,) for i in ids])
-            mydb.commit()
-
-        #Just increment ASN (no dummy data insert)
-        try:
-            nextup = NextupNumber.objects.first()
-            if nextup:
-                current_number = int(''.join(filter(str.isdigit, nextup.Current_Number)))
-                prefix = nextup.prefix or ""
-                current_number += 1
-                nextup.Current_Number = f"{prefix}{current_number:07d}"
-                nextup.Next_Number = f"{prefix}{current_number + 1:07d}"
-                nextup.updated_username = request.user.username
-                nextup.save()
-        except Exception as e:
-            print("Error updating ASN:", str(e))
+        last_seen = ids[-1]
+    return claimed
+
+
+def new_export_batch():
+    return uuid.uuid4().hex
+
+
+# Hands the rows of an export whose file could not be written back to the
+# next plain export
+def release_batch(batch):
+    return DownloadInventory.objects.filter(export_batch=batch).update(download_status='no', export_batch=None)
+
+
+# Sends an open workbook ``file`` of ``batch``, naming the batch so it can be
+# fetched again from export_batch_download_view
+def batch_workbook_response(file, batch):
+    response = workbook_response(file)
+    response['X-Export-Batch'] = batch
+    return response
+
+
+# Runs on Django's own (persistent, see CONN_MAX_AGE) database connection, so
+# the export shares the request's connection and transaction state
+def export_datas_to_excel(request):
+    batch = new_export_batch()
+    claimed = False
+    try:
+        with transaction.atomic():
+            if not claim_pending_rows(batch):
+                messages.warning(request, "Sorry, no data found to export!")
+                return redirect("inventory")
+
+            rows = list(
+                DownloadInventory.objects.filter(export_batch=batch).order_by('pk').values_list('pk', *DETAIL_FIELDS)
+            )
+            source = export_cache.SourceHash('xlsx')
+            for row in rows:
+                source.add(row[1:])
+            df = pd.DataFrame.from_records(rows, columns=EXPORT_COLUMNS)
+
+            df_data_final = build_data_sheet(df)
+            df_detail_final = build_detail_sheet(df)
+
+            # Validations sheet
+            df_validations = pd.DataFrame(VALIDATION_ROWS)
+
+            output = BytesIO()
+            with pd.ExcelWriter(output, engine='openpyxl') as writer:
+                df_data_final.to_excel(writer, index=False, header=False, sheet_name='Data')
+                df_detail_final.to_excel(writer, index=False, header=False, sheet_name='Detail')
+                df_validations.to_excel(writer, index=False, header=False, sheet_name='Validations')
+        claimed = True
+
+        # Keep a copy for re-download; this response is sent from memory
+        export_cache.store(batch, 'xlsx', source.hexdigest(), output.getbuffer())
 
+        response = HttpResponse(output.getvalue(), content_type=XLSX_CONTENT_TYPE)
+        response['Content-Disposition'] = f'attachment; filename={export_filename()}'
+        response['X-Export-Batch'] = batch
         return response
 
-    except mysql.connector.Error as err:
-        messages.error(request, f"MySQL Error: {err}")
+    except DatabaseError as db_err:
+        messages.error(request, f"Database Error: {db_err}")
         return redirect("inventory")
-    except pd.errors.DatabaseError as db_err:
-        messages.error(request, f"Pandas DB Error: {db_err}")
+    except Exception as e:
+        if claimed:
+            # Never sent: hand the rows back to the next export
+            release_batch(batch)
+        messages.error(request, f"Unexpected error: {str(e)}")
         return redirect("inventory")
+
+
+# Writes the Data, Detail and Validations sheets through openpyxl's
+# write-only workbook, which spools each sheet to disk. ``receipts`` yields
+# (asn_number, owner) pairs and ``details`` yields rows of DETAIL_FIELDS values.
+def write_workbook(output, receipts, details):
+    workbook = Workbook(write_only=True)
+    data_sheet = workbook.create_sheet('Data')
+    detail_sheet = workbook.create_sheet('Detail')
+    validations_sheet = workbook.create_sheet('Validations')
+
+    data_sheet.append(DATA_DESC)
+    data_sheet.append(DATA_HEADERS)
+    for asn_number, owner in receipts:
+        data_sheet.append(['', '', asn_number, owner, 0])
+
+    detail_sheet.append(DETAIL_DESC)
+    detail_sheet.append(DETAIL_HEADERS)
+    for row in details:
+        detail_sheet.append(['', ''] + list(row))
+
+    for row in VALIDATION_ROWS:
+        validations_sheet.append(row)
+
+    workbook.save(output)
+
+
+# (asn_number, owner) pairs of ``rows`` in order of each receipt's first line
+def iter_receipts(rows, chunk_size):
+    receipts = rows.values_list('asn_number', 'owner').annotate(first_id=Min('pk')).order_by('first_id')
+    for asn_number, owner, _ in receipts.iterator(chunk_size=chunk_size):
+        yield asn_number, owner
+
+
+# DETAIL_FIELDS values of ``rows``, read in primary-key ordered chunks.
+# ``progress(done, total)`` is called after every chunk.
+def iter_detail_rows(rows, chunk_size, progress=None, total=None):
+    written = 0
+    last_seen = 0
+    while True:
+        chunk = list(rows.filter(pk__gt=last_seen).order_by('pk').values_list('pk', *DETAIL_FIELDS)[:chunk_size])
+        if not chunk:
+            break
+        for row in chunk:
+            yield row[1:]
+        last_seen = chunk[-1][0]
+        written += len(chunk)
+
+        if progress:
+            progress(written, total)
+
+
+# Streaming export: rows are read in primary-key ordered chunks and written
+# through the write-only workbook, so memory stays flat regardless of row count.
+# The claim commits before the workbook is written, so no row lock is held
+# while it renders and ``progress`` runs outside any transaction (job progress
+# is visible to pollers as it happens); if writing fails the rows are released
+# again (release_batch) and the error is raised.
+#
+# Writes the workbook into ``output`` and marks the exported rows downloaded.
+# Returns the number of Detail rows written, 0 when nothing is pending (and
+# nothing is written). ``progress(done, total)`` is called after every chunk.
+# ``writer`` renders the file (see export_formats.EXPORT_FORMATS); the rows
+# are stamped with ``batch`` (a new one by default).
+def write_inventory_workbook(output, chunk_size=None, progress=None, writer=write_workbook, batch=None):
+    chunk_size = chunk_size or getattr(settings, 'EXCEL_EXPORT_CHUNK_SIZE', 2000)
+
+    batch = batch or new_export_batch()
+    with transaction.atomic():
+        total = claim_pending_rows(batch, chunk_size)
+    if not total:
+        return 0
+
+    exported = DownloadInventory.objects.filter(export_batch=batch)
+    try:
+        writer(
+            output,
+            iter_receipts(exported, chunk_size),
+            iter_detail_rows(exported, chunk_size, progress, total)
+        )
+    except Exception:
+        release_batch(batch)
+        raise
+    return total
+
+
+# Generate-and-export pipeline: allocates ASNs for the pending captures and
+# writes the new lines into the workbook straight from memory, never reading
+# them back. The lines are inserted already stamped downloaded with their own
+# export batch, so no status UPDATE follows. The insert and the capture claim
+# commit first and the workbook is written after, so no row lock is held
+# while it renders. If the workbook cannot be written, the lines are released
+# (DOWNLOADSTATUS='no', no export batch) for the next plain export and the
+# error is raised. Rows left pending by earlier runs are not included; they go
+# out with the next plain export. With EXCEL_EXPORT_INCREMENTAL the lines stay
+# DOWNLOADSTATUS='no' instead, for the next incremental run (see
+# export_runs.py).
+#
+# Returns the lines written ([] when there were no new captures); see
+# allocate_pending_asns for ``consolidate`` and ``packing``. ``writer`` and
+# ``batch`` are as in write_inventory_workbook.
+def generate_and_write_workbook(output, username, consolidate=None, packing=None, writer=write_workbook, batch=None):
+    batch = batch or new_export_batch()
+    lines = allocate_pending_asns(
+        username, consolidate=consolidate, packing=packing,
+        download_status='no' if getattr(settings, 'EXCEL_EXPORT_INCREMENTAL', False) else 'yes',
+        export_batch=batch
+    )
+    if not lines:
+        return lines
+
+    try:
+        writer(
+            output,
+            dict.fromkeys((line.asn_number, line.owner) for line in lines),
+            ([getattr(line, field) for field in DETAIL_FIELDS] for line in lines)
+        )
+    except Exception:
+        release_batch(batch)
+        raise
+    return lines
+
+
+def workbook_response(output):
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=export_filename(),
+        content_type=XLSX_CONTENT_TYPE
+    )
+
+
+# Streams the write-only workbook from the export cache
+def stream_datas_to_excel(request, chunk_size=None):
+    batch = new_export_batch()
+    output = None
+    claimed = False
+
+    try:
+        source = export_cache.SourceHash('xlsx')
+        output = export_cache.render_file()
+        claimed = write_inventory_workbook(output, chunk_size, writer=source.wrap(write_workbook), batch=batch)
+        if not claimed:
+            export_cache.discard(output)
+            messages.warning(request, "Sorry, no data found to export!")
+            return redirect("inventory")
+
+        file = export_cache.publish_and_open(batch, 'xlsx', source.hexdigest(), output)
+        return batch_workbook_response(file, batch)
+
     except Exception as e:
+        if output:
+            export_cache.discard(output)
+        if claimed:
+            # Never sent: hand the rows back to the next export
+            release_batch(batch)
         messages.error(request, f"Unexpected error: {str(e)}")
         return redirect("inventory")
-    finally:
-        try:
-            if cursor:
-                cursor.close()
-            if mydb and mydb.is_connected():
-                mydb.close()
-        except Exception:
-            pass
@@ -0,0 +1,181 @@
+"""
+Export file formats, selected with ?format=<name> on the export views.
+
+``xlsx`` is the Data/Detail/Validations workbook of export_excel.py. The flat
+formats carry the Detail sheet only, one record per ASN line, with the
+workbook's Detail column names (RECEIPTKEY, SKU, STORERKEY, RECEIPTLINENUMBER,
+QTYEXPECTED, UOM, TOID, TOLOC). The Data sheet is the distinct
+(RECEIPTKEY, STORERKEY) pairs of those records, so loaders derive it.
+
+Every writer takes ``(output, receipts, details)`` like
+``export_excel.write_workbook`` and streams ``details`` in one pass, so it
+plugs into the claim-based streaming export and the generate pipeline alike.
+Parquet needs the optional ``pyarrow`` package. Finished files are kept in the
+export cache (export_cache.py) under their export batch.
+"""
+import csv
+import io
+import json
+import os
+from itertools import islice
+
+from django.conf import settings
+from django.contrib import messages
+from django.http import FileResponse
+from django.shortcuts import redirect
+
+from . import export_cache
+from .export_excel import (
+    DETAIL_DESC, XLSX_CONTENT_TYPE, export_filename, iter_detail_rows, iter_receipts, new_export_batch,
+    release_batch, write_inventory_workbook, write_workbook
+)
+from .models import DownloadInventory
+
+# Flat record column names, in DETAIL_FIELDS order
+FLAT_COLUMNS = DETAIL_DESC[2:]
+QUANTITY_COLUMN = 'QTYEXPECTED'
+
+# Rows per Parquet row group (and per batch held in memory while writing)
+PARQUET_ROW_GROUP_SIZE = 50000
+
+
+def write_csv(output, receipts, details):
+    text = io.TextIOWrapper(output, encoding='utf-8', newline='', write_through=True)
+    try:
+        writer = csv.writer(text)
+        writer.writerow(FLAT_COLUMNS)
+        writer.writerows(details)
+    finally:
+        # Leave ``output`` open for the response
+        text.detach()
+
+
+def write_ndjson(output, receipts, details):
+    for row in details:
+        output.write(json.dumps(dict(zip(FLAT_COLUMNS, row))).encode() + b"\n")
+
+
+def write_parquet(output, receipts, details):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        (column, pa.int64() if column == QUANTITY_COLUMN else pa.string()) for column in FLAT_COLUMNS
+    ])
+    details = iter(details)
+    with pq.ParquetWriter(output, schema, compression='snappy') as writer:
+        while True:
+            rows = list(islice(details, PARQUET_ROW_GROUP_SIZE))
+            if not rows:
+                break
+            columns = [list(values) for values in zip(*rows)]
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+
+
+# name -> (content type, writer); the name is also the file extension
+EXPORT_FORMATS = {
+    'xlsx': (XLSX_CONTENT_TYPE, write_workbook),
+    'csv': ('text/csv; charset=utf-8', write_csv),
+    'ndjson': ('application/x-ndjson', write_ndjson),
+    'parquet': ('application/vnd.apache.parquet', write_parquet),
+}
+
+
+def get_writer(name):
+    if name not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    return EXPORT_FORMATS[name][1]
+
+
+# Sends a finished export file, rewound, as an attachment named for the format
+def export_response(output, name):
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=export_filename(name),
+        content_type=EXPORT_FORMATS[name][0]
+    )
+
+
+# Streams every pending row in ``name`` format from the export cache, like
+# export_excel.stream_datas_to_excel does for the workbook
+def stream_export(request, name, chunk_size=None):
+    writer = get_writer(name)
+    batch = new_export_batch()
+    output = None
+    claimed = False
+
+    try:
+        source = export_cache.SourceHash(name)
+        output = export_cache.render_file()
+        claimed = write_inventory_workbook(output, chunk_size, writer=source.wrap(writer), batch=batch)
+        if not claimed:
+            export_cache.discard(output)
+            messages.warning(request, "Sorry, no data found to export!")
+            return redirect("inventory")
+
+        file = export_cache.publish_and_open(batch, name, source.hexdigest(), output)
+        return batch_file_response(file, name, batch)
+
+    except Exception as e:
+        if output:
+            export_cache.discard(output)
+        if claimed:
+            # Never sent: hand the rows back to the next export
+            release_batch(batch)
+        messages.error(request, f"Unexpected error: {str(e)}")
+        return redirect("inventory")
+
+
+# Sends an open export ``file`` of ``batch``, naming the batch so it can be
+# fetched again from export_batch_download_view
+def batch_file_response(file, name, batch):
+    response = export_response(file, name)
+    response['X-Export-Batch'] = batch
+    return response
+
+
+def cached_export_response(path, name, batch):
+    return batch_file_response(open(path, 'rb'), name, batch)
+
+
+# Cached ``name`` file of the exported ``rows`` under ``key``, rendering it
+# only when no cached file has the same content. Returns None for no rows.
+def cached_rows_export(key, name, rows, chunk_size=None):
+    path = export_cache.lookup(key, name)
+    if path:
+        return path
+
+    writer = get_writer(name)
+    chunk_size = chunk_size or getattr(settings, 'EXCEL_EXPORT_CHUNK_SIZE', 2000)
+    # Hash first: an identical file may be cached under another key
+    source = export_cache.SourceHash(name)
+    for row in iter_detail_rows(rows, chunk_size):
+        source.add(row)
+    if not source.row_count:
+        return None
+    if os.path.exists(export_cache.object_path(source.hexdigest(), name)):
+        return export_cache.link(key, name, source.hexdigest())
+
+    # Hashed again while rendering, so the file is stored under what it holds
+    source = export_cache.SourceHash(name)
+    output = export_cache.render_file()
+    try:
+        source.wrap(writer)(output, iter_receipts(rows, chunk_size), iter_detail_rows(rows, chunk_size))
+    except Exception:
+        export_cache.discard(output)
+        raise
+    return export_cache.publish(key, name, source.hexdigest(), output)
+
+
+# Sends the ``name`` file of an earlier export batch again: straight from the
+# cache when present, else rebuilt (read only) from the rows stamped with the
+# batch. Returns None when no row carries the batch.
+def batch_export_response(batch, name):
+    path = export_cache.lookup(batch, name)
+    if path is None:
+        path = cached_rows_export(batch, name, DownloadInventory.objects.filter(export_batch=batch))
+    if path is None:
+        return None
+    return cached_export_response(path, name, batch)
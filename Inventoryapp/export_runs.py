@@ -0,0 +1,129 @@
+"""
+Incremental (watermark) exports.
+
+Every run exports the DOWNLOADINVENTORY rows with an id above the highest
+``last_id`` recorded in EXPORTRUN and stores the workbook under
+EXPORT_RUN_DIR. Rows are read by primary-key range and never written back:
+DOWNLOADSTATUS is left alone, so the export no longer competes with
+concurrent inserts, and any run can be downloaded again by id as a plain file
+send. A range with no rows to export is not recorded, so the watermark only
+moves past rows that went out in a run.
+
+Runs take the rows with DOWNLOADSTATUS='no'. Rows already handed out by the
+DOWNLOADSTATUS based exports are 'yes' and skipped. With
+EXCEL_EXPORT_INCREMENTAL on, the generate-and-export pipeline inserts its
+lines as 'no' (still stamped with their EXPORTBATCH), so they go out with the
+next run as well. Use one export style per deployment: the status based
+export does not know about runs. A run asked for in a flat format
+(export_formats.py) still records its workbook; the flat file is rendered
+from the run's range into the export cache.
+
+Two runs starting together read the same watermark; EXPORTRUN.FIRSTID is
+unique, so only one of them can record its range. The upper bound only takes
+rows written at least EXPORT_WATERMARK_LAG seconds ago, which gives
+transactions that allocated lower ids time to commit before the watermark
+moves past them. allocate_pending_asns stamps the lines when its insert
+transaction starts, and that transaction holds only the insert and the
+capture claim, so the lag has to exceed the longest such insert.
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Q
+from django.http import FileResponse
+from django.utils import timezone
+
+from .export_excel import export_filename, iter_detail_rows, iter_receipts, write_workbook
+from .export_formats import EXPORT_FORMATS, cached_rows_export
+from .models import DownloadInventory, ExportRun
+
+
+class ExportRunConflict(Exception):
+    """Raised when a parallel run recorded the same id range first."""
+
+
+def run_dir():
+    path = getattr(settings, 'EXPORT_RUN_DIR', os.path.join(settings.BASE_DIR, 'exports', 'runs'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def run_path(run):
+    return os.path.join(run_dir(), run.artifact)
+
+
+def current_watermark():
+    return ExportRun.objects.aggregate(last_id=Max('last_id'))['last_id'] or 0
+
+
+def run_rows(first_id, last_id):
+    return DownloadInventory.objects.filter(pk__gte=first_id, pk__lte=last_id, download_status='no')
+
+
+# Writes the workbook of a run's id range into ``output``; returns the Detail row count
+def write_run_workbook(output, first_id, last_id, chunk_size=None):
+    chunk_size = chunk_size or getattr(settings, 'EXCEL_EXPORT_CHUNK_SIZE', 2000)
+    rows = run_rows(first_id, last_id)
+    written = [0]
+
+    def details():
+        for row in iter_detail_rows(rows, chunk_size):
+            written[0] += 1
+            yield row
+
+    write_workbook(output, iter_receipts(rows, chunk_size), details())
+    return written[0]
+
+
+# Exports every row above the watermark. Returns the new ExportRun, or None
+# when no settled rows were added since the last run (no run is recorded then).
+def create_export_run(username, chunk_size=None):
+    first_id = current_watermark() + 1
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'EXPORT_WATERMARK_LAG', 5))
+    last_id = DownloadInventory.objects.filter(pk__gte=first_id).filter(
+        Q(updated_datetime__lte=cutoff) | Q(updated_datetime__isnull=True)
+    ).aggregate(last_id=Max('pk'))['last_id']
+    if last_id is None:
+        return None
+
+    try:
+        with transaction.atomic():
+            run = ExportRun.objects.create(first_id=first_id, last_id=last_id, username=username)
+            run.artifact = f"run{run.pk}_{export_filename()}"
+            with open(run_path(run), 'wb') as output:
+                run.row_count = write_run_workbook(output, first_id, last_id, chunk_size)
+            if not run.row_count:
+                # Recording the range would move the watermark past it
+                os.remove(run_path(run))
+                transaction.set_rollback(True)
+                return None
+            run.save(update_fields=['row_count', 'artifact'])
+    except IntegrityError:
+        raise ExportRunConflict("Another export is running, please retry.")
+    return run
+
+
+# Sends a run's file in the ``name`` export format. The workbook is the run's
+# own file; other formats, and a workbook whose file is gone, come from the
+# export cache, rendered there from the run's id range (read only) at most
+# once. Returns None for runs that exported no rows.
+def run_response(run, name='xlsx'):
+    if not run.row_count:
+        return None
+
+    path = run_path(run)
+    if name != 'xlsx' or not os.path.exists(path):
+        path = cached_rows_export(f"run{run.pk}", name, run_rows(run.first_id, run.last_id))
+        if path is None:
+            return None
+
+    response = FileResponse(
+        open(path, 'rb'),
+        as_attachment=True,
+        filename=f"{os.path.splitext(run.artifact.split('_', 1)[1])[0]}.{name}",
+        content_type=EXPORT_FORMATS[name][0]
+    )
+    response['X-Export-Run'] = str(run.pk)
+    return response
@@ -0,0 +1,148 @@
+import logging
+import os
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .export_excel import generate_and_write_workbook, release_batch, write_inventory_workbook, export_filename
+from .export_formats import get_writer
+from .models import ExportJob
+from .sequences import get_sequence
+from .utils import AsnGenerationError, allocation_summary
+
+logger = logging.getLogger(__name__)
+
+
+def job_dir():
+    path = getattr(settings, 'EXPORT_JOB_DIR', os.path.join(settings.BASE_DIR, 'exports'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def artifact_path(job):
+    return os.path.join(job_dir(), job.artifact)
+
+
+# Export batch a job stamps its rows with, derived from the job id so that a
+# job abandoned by a dead worker can still be released (recover_stale_jobs)
+def job_batch(job):
+    return uuid.uuid5(uuid.NAMESPACE_OID, f"EXPORTJOB:{job.pk}").hex
+
+
+# ``options`` are ExportJob fields: export_format, packing, consolidate
+def enqueue_job(kind, username, **options):
+    return ExportJob.objects.create(kind=kind, username=username, **options)
+
+
+# Moves a queued job to running; False if another worker already took it
+def claim_job(job):
+    now = timezone.now().replace(microsecond=0)
+    claimed = ExportJob.objects.filter(pk=job.pk, status=ExportJob.STATUS_QUEUED).update(
+        status=ExportJob.STATUS_RUNNING, started_datetime=now
+    )
+    return bool(claimed)
+
+
+# Only a running job is finished: one failed by recover_stale_jobs stays failed
+def finish_job(job, status, message, **fields):
+    ExportJob.objects.filter(pk=job.pk, status=ExportJob.STATUS_RUNNING).update(
+        status=status,
+        message=message[:255],
+        finished_datetime=timezone.now().replace(microsecond=0),
+        **fields
+    )
+
+
+def run_job(job):
+    if not claim_job(job):
+        return False
+
+    def report(done, total):
+        ExportJob.objects.filter(pk=job.pk).update(progress=min(99, done * 100 // max(total, 1)))
+
+    try:
+        writer = get_writer(job.export_format)
+        filename = f"job{job.pk}_{export_filename(job.export_format)}"
+        path = os.path.join(job_dir(), filename)
+        with open(path, 'wb') as output:
+            if job.kind == ExportJob.KIND_GENERATE:
+                lines = generate_and_write_workbook(
+                    output, job.username, consolidate=job.consolidate, packing=job.packing,
+                    writer=writer, batch=job_batch(job)
+                )
+                rows = len(lines)
+                if lines:
+                    summary = allocation_summary(lines, get_sequence("ASN").get_row().NUMBEROFLINES)
+                empty_message = "No new records to generate ASN."
+            else:
+                rows = write_inventory_workbook(output, progress=report, writer=writer, batch=job_batch(job))
+                empty_message = "Sorry, no data found to export!"
+
+        if not rows:
+            os.remove(path)
+            finish_job(job, ExportJob.STATUS_DONE, empty_message, progress=100)
+        else:
+            message = f"Exported {rows} lines."
+            if job.kind == ExportJob.KIND_GENERATE:
+                message = (
+                    f"Exported {rows} lines from {summary['captures']} captures "
+                    f"on {summary['asns']} ASNs ({summary['fill_ratio']:.0%} full)."
+                )
+            finish_job(
+                job, ExportJob.STATUS_DONE, message,
+                progress=100, row_count=rows, artifact=filename
+            )
+
+    except AsnGenerationError as e:
+        finish_job(job, ExportJob.STATUS_FAILED, str(e))
+    except Exception as e:
+        logger.exception("Export job %s failed", job.pk)
+        finish_job(job, ExportJob.STATUS_FAILED, f"Unexpected error: {e}")
+
+    return True
+
+
+# Fails the jobs still 'running' EXPORT_JOB_TIMEOUT seconds after they
+# started: their worker was killed or crashed. Rows such a job had claimed or
+# generated go back to the next plain export. Returns how many were failed.
+def recover_stale_jobs(timeout=None):
+    timeout = timeout if timeout is not None else getattr(settings, 'EXPORT_JOB_TIMEOUT', 3600)
+    now = timezone.now().replace(microsecond=0)
+    stale = ExportJob.objects.filter(
+        status=ExportJob.STATUS_RUNNING, started_datetime__lt=now - timedelta(seconds=timeout)
+    )
+    recovered = 0
+    for job in stale:
+        failed = ExportJob.objects.filter(pk=job.pk, status=ExportJob.STATUS_RUNNING).update(
+            status=ExportJob.STATUS_FAILED,
+            message="The export worker stopped before the job finished, please retry.",
+            finished_datetime=now
+        )
+        if failed:
+            released = release_batch(job_batch(job))
+            logger.warning("Export job %s abandoned by its worker; released %s rows", job.pk, released)
+            recovered += 1
+    return recovered
+
+
+# Runs queued jobs oldest first, after failing abandoned ones; returns how
+# many this worker ran
+def run_pending_jobs():
+    recover_stale_jobs()
+    ran = 0
+    for job in ExportJob.objects.filter(status=ExportJob.STATUS_QUEUED).order_by('pk'):
+        if run_job(job):
+            ran += 1
+    return ran
+
+
+def run_worker(poll_interval=2.0, once=False):
+    while True:
+        ran = run_pending_jobs()
+        if once:
+            return ran
+        if not ran:
+            time.sleep(poll_interval)
@@ -0,0 +1,146 @@
+"""
+HTTP load test against a running server (runserver, gunicorn, ...).
+
+Each virtual scanner logs in, sets an owner and then posts captures to
+``inventory_view`` as fast as the server answers, exactly like a handheld
+working through the capture page (which posts with fetch and reads a JSON
+reply; ``json_captures=False`` replays the old post/redirect/full page flow). Optionally some clients keep downloading the
+streaming Excel export at the same time, to see how exports affect scan
+latency (see EXPORT_PATH). Run with ``python manage.py load_test``.
+"""
+import http.cookiejar
+import re
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+# Streaming export only does real work while rows are pending; point the
+# exporters at another long request (e.g. a large download-inventory page) to
+# keep them busy for the whole run
+EXPORT_PATH = '/download_excel/?mode=stream'
+
+
+class Session:
+    """A browser-like client: cookie jar, CSRF token from the last form seen."""
+
+    def __init__(self, base_url, timeout=600):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+        self.csrf_token = None
+
+    def request(self, path, data=None, headers=None):
+        if data is not None:
+            data = urllib.parse.urlencode(dict(data, csrfmiddlewaretoken=self.csrf_token)).encode()
+        request = urllib.request.Request(
+            self.base_url + path, data=data, headers={'Referer': self.base_url + path, **(headers or {})}
+        )
+        with self.opener.open(request, timeout=self.timeout) as response:
+            body = response.read()
+        match = CSRF_INPUT.search(body[:20000].decode('utf-8', 'ignore'))
+        if match:
+            self.csrf_token = match.group(1)
+        return body
+
+    def login(self, username, password, owner):
+        self.request('/')
+        self.request('/', {'username': username, 'password': password})
+        self.request('/owner/')
+        self.request('/owner/', {'owner': owner})
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def summarize(latencies):
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1) if latencies else None,
+    }
+
+
+def run_load_test(base_url, username, password, scanners=10, duration=30, exporters=0,
+                  export_path=EXPORT_PATH, owner="LOADTEST", json_captures=True):
+    """Drive the server for ``duration`` seconds and return the results."""
+    capture_headers = {'Accept': 'application/json'} if json_captures else None
+    stop = threading.Event()
+    lock = threading.Lock()
+    scans, exports, errors = [], [], []
+
+    def scanner(number, session):
+        sequence = 0
+        while not stop.is_set():
+            sequence += 1
+            started = time.perf_counter()
+            try:
+                session.request('/inventory/', {
+                    'location': f"LT{number:03d}", 'sku': f"SKU{sequence:06d}", 'uom': 'EA',
+                    'case': f"LT{number:03d}-{sequence}", 'quantity': '1',
+                }, headers=capture_headers)
+            except (urllib.error.URLError, OSError) as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                scans.append(time.perf_counter() - started)
+
+    def exporter(session):
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                session.request(export_path)
+            except (urllib.error.URLError, OSError) as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                exports.append(time.perf_counter() - started)
+
+    # Log every client in before the clock starts
+    sessions = []
+    for _ in range(scanners + exporters):
+        session = Session(base_url)
+        session.login(username, password, owner)
+        sessions.append(session)
+
+    threads = [
+        threading.Thread(target=scanner, args=(i, session), daemon=True)
+        for i, session in enumerate(sessions[:scanners])
+    ]
+    threads += [threading.Thread(target=exporter, args=(session,), daemon=True) for session in sessions[scanners:]]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=60)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "base_url": base_url,
+        "scanners": scanners,
+        "exporters": exporters,
+        "export_path": export_path if exporters else None,
+        "json_captures": json_captures,
+        "duration_s": round(elapsed, 1),
+        "scans_per_sec": round(len(scans) / elapsed, 1),
+        "scan_latency": summarize(scans),
+        "export_latency": summarize(exports),
+        "errors": len(errors),
+        "first_errors": errors[:5],
+    }
@@ -0,0 +1,105 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import UserMaster
+
+logger = logging.getLogger(__name__)
+
+# Logins waiting to be written to USERMASTER: username -> (password hash, login time)
+_pending = {}
+_lock = threading.Lock()
+# Timer that will flush _pending, while one is scheduled
+_timer = None
+
+
+def flush_interval():
+    return getattr(settings, 'LAST_LOGIN_FLUSH_INTERVAL', 0)
+
+
+# Mirrors a successful login into USERMASTER. The auth user's stored hash is
+# copied as-is (no second make_password), and with LAST_LOGIN_FLUSH_INTERVAL
+# set the write is queued so repeated logins collapse into one upsert, run by a
+# timer thread once the interval has passed and again when the process exits.
+# Queued logins are only bookkeeping: if the process is killed before a flush,
+# those LASTLOGIN values are lost.
+def record_login(user):
+    now = timezone.now().replace(microsecond=0)
+    interval = flush_interval()
+    with _lock:
+        _pending[user.get_username()] = (user.password, now)
+        if interval > 0:
+            schedule_flush()
+    if interval <= 0:
+        flush_logins()
+
+
+# Starts the flush timer unless one is already waiting; call with _lock held
+def schedule_flush():
+    global _timer
+    if _timer is None:
+        _timer = threading.Timer(flush_interval(), flush_on_timer)
+        _timer.daemon = True
+        _timer.start()
+
+
+# Writes every queued login with a single upsert: new users get a mirror row,
+# existing rows only have LASTLOGIN updated. Returns the number of rows written.
+def flush_logins():
+    global _timer
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        if _timer is not None:
+            # Nothing left for it to write
+            _timer.cancel()
+            _timer = None
+    if not pending:
+        return 0
+
+    rows = [
+        UserMaster(username=username, password=password, created_date=login_time, updated_datetime=login_time)
+        for username, (password, login_time) in pending.items()
+    ]
+    upsert = {"update_conflicts": True, "update_fields": ['updated_datetime']}
+    if connection.features.supports_update_conflicts_with_target:
+        upsert["unique_fields"] = ['username']
+    try:
+        UserMaster.objects.bulk_create(rows, **upsert)
+    except Exception:
+        # Keep the logins (unless newer ones arrived) for the next flush
+        with _lock:
+            for username, login in pending.items():
+                _pending.setdefault(username, login)
+        raise
+    return len(rows)
+
+
+# Flushes the queued logins from the timer or at exit. A failure is logged,
+# not raised, and the logins stay queued for another try.
+def flush_queued():
+    try:
+        flush_logins()
+    except Exception:
+        logger.exception("Could not write %d queued login(s) to USERMASTER", len(_pending))
+        with _lock:
+            if _pending and flush_interval() > 0:
+                schedule_flush()
+
+
+def flush_on_timer():
+    try:
+        flush_queued()
+    finally:
+        # The timer thread's own connection
+        connection.close()
+
+
+# Called once at startup; gunicorn workers also flush from the worker_exit
+# hook in gunicorn.conf.py
+def connect_signals():
+    atexit.register(flush_queued)
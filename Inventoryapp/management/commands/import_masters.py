@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Inventoryapp.masters import MASTERS, import_master
+
+
+class Command(BaseCommand):
+    help = "Bulk imports an owner, SKU, location or UOM master from a CSV or XLSX file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(MASTERS), help="Which master the file holds")
+        parser.add_argument('path', help="CSV or XLSX file with OWNER/SKU/LOCATION/UOM and DESCRIPTION columns")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as f:
+                count = import_master(options['kind'], f, options['path'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Imported {count} {options['kind']} master row(s)")
@@ -0,0 +1,41 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from Inventoryapp.loadtest import EXPORT_PATH, run_load_test
+
+
+class Command(BaseCommand):
+    help = "Load tests a running server with concurrent scanners (and optional exports) over HTTP"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Base URL of the server under test")
+        parser.add_argument('--username', default='loadtest', help="Account the virtual scanners log in with")
+        parser.add_argument('--password', default='loadtest-password')
+        parser.add_argument('--create-user', action='store_true',
+                            help="Create the account in this project's database first")
+        parser.add_argument('--scanners', type=int, default=10, help="Concurrent scanning clients")
+        parser.add_argument('--exporters', type=int, default=0,
+                            help="Clients downloading the streaming Excel export in a loop")
+        parser.add_argument('--export-path', default=EXPORT_PATH, help="Request the exporters repeat")
+        parser.add_argument('--duration', type=int, default=30, help="Seconds to run")
+        parser.add_argument('--form-posts', action='store_true',
+                            help="Post captures as plain form submits (redirect and full page) instead of JSON")
+        parser.add_argument('--output', help="Also write the results to this JSON file")
+
+    def handle(self, *args, **options):
+        if options['create_user'] and not User.objects.filter(username=options['username']).exists():
+            User.objects.create_user(username=options['username'], password=options['password'])
+
+        results = run_load_test(
+            options['url'], options['username'], options['password'],
+            scanners=options['scanners'], duration=options['duration'],
+            exporters=options['exporters'], export_path=options['export_path'],
+            json_captures=not options['form_posts']
+        )
+        report = json.dumps(results, indent=2)
+        self.stdout.write(report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(report + "\n")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from Inventoryapp.export_cache import evict
+
+
+class Command(BaseCommand):
+    help = "Drops export cache files past EXPORT_CACHE_MAX_AGE or beyond EXPORT_CACHE_MAX_BYTES"
+
+    def handle(self, *args, **options):
+        freed = evict()
+        self.stdout.write(f"Freed {freed / 1024 / 1024:.1f} MB from the export cache")
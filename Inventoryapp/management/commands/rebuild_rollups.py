@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from Inventoryapp.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recomputes the hourly capture/ASN reporting rollups from INVENTORYCAPTURE and DOWNLOADINVENTORY (run off shift)"
+
+    def handle(self, *args, **options):
+        captures, asns = rebuild_rollups()
+        self.stdout.write(f"Rebuilt {captures} capture rollup row(s) and {asns} ASN rollup row(s)")
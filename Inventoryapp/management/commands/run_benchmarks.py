@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Inventoryapp.benchmarks import (
+    DEFAULT_TOLERANCE, SCANS, SIZES, compare, load_report, run_suite, save_report
+)
+
+
+class Command(BaseCommand):
+    help = "Benchmarks capture, ASN generation and export on synthetic data in a throwaway test database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default=','.join(map(str, SIZES)),
+                            help="Comma separated pending capture counts to run")
+        parser.add_argument('--scans', type=int, default=SCANS, help="Number of single scan requests (0 to skip)")
+        parser.add_argument('--output', default='benchmark-results.json', help="Where to write the JSON results")
+        parser.add_argument('--baseline', help="JSON results of an earlier run to compare against")
+        parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                            help="Allowed throughput drop against the baseline, as a fraction")
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help="Exit with an error when a case regressed against the baseline")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError("--sizes must be a comma separated list of numbers")
+
+        report = run_suite(sizes, options['scans'], log=lambda message: self.stdout.write(f"Running {message}..."))
+        save_report(report, options['output'])
+
+        self.stdout.write(f"\n{'case':<24}{'rows':>8}{'seconds':>10}{'rows/sec':>12}{'queries':>9}{'peak RSS MB':>13}{'MB written':>12}")
+        for item in report['results']:
+            self.stdout.write(
+                f"{item['name']:<24}{item['rows']:>8}{item['seconds']:>10.3f}{item['rows_per_sec'] or 0:>12.1f}"
+                f"{item['queries']:>9}{item['peak_rss_kb'] / 1024:>13.1f}"
+                + (f"{item['bytes'] / 1024 / 1024:>12.2f}" if 'bytes' in item else "")
+            )
+        self.stdout.write(f"\nResults written to {options['output']}")
+
+        if not options['baseline']:
+            return
+
+        rows, regressions = compare(report, load_report(options['baseline']), options['tolerance'])
+        self.stdout.write(f"\nCompared with {options['baseline']}:")
+        for row in rows:
+            change = f"{row['change']:+.1%}" if row['change'] is not None else "n/a"
+            line = (f"{row['name']:<24}{row['rows']:>8}  {change:>8} rows/sec"
+                    f"  queries {row['baseline_queries']} -> {row['queries']}")
+            self.stdout.write(self.style.ERROR(line) if row['regressed'] else line)
+
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{len(regressions)} benchmark case(s) regressed against the baseline")
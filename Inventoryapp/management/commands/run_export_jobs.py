@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from Inventoryapp.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = "Runs queued ASN generation / Excel export jobs (no external broker needed)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run the queued jobs and exit")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds between polls when idle")
+
+    def handle(self, *args, **options):
+        ran = run_worker(poll_interval=options['poll_interval'], once=options['once'])
+        if options['once']:
+            self.stdout.write(f"Ran {ran} job(s)")
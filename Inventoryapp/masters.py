@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+import uuid
+
+import pandas as pd
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .models import LocationMaster, OwnerMaster, SkuMaster, UomMaster
+
+# Master kind -> (model, key fields). Import files name their columns after the
+# key fields' DB columns (OWNER, SKU, LOCATION, UOM) plus an optional DESCRIPTION.
+MASTERS = {
+    'owner': (OwnerMaster, ('owner',)),
+    'sku': (SkuMaster, ('owner', 'sku')),
+    'location': (LocationMaster, ('location',)),
+    'uom': (UomMaster, ('uom',)),
+}
+
+IMPORT_BATCH_SIZE = 1000
+
+
+def cache_ttl():
+    return getattr(settings, 'MASTER_CACHE_TTL', 300)
+
+
+VERSION_KEY = 'inventory:masters:version'
+
+
+def version_cache():
+    return caches['masters' if 'masters' in settings.CACHES else 'default']
+
+
+# Stamp changed by every master import or edit, in any process
+def shared_version():
+    return version_cache().get(VERSION_KEY)
+
+
+def bump_shared_version():
+    version_cache().set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+# In-process copy of every master key set. Loading costs one query per master
+# table; after that each lookup is a set membership test plus a read of the
+# shared version stamp. The copy is reloaded when the stamp changes (a master
+# import or edit in any process) and after MASTER_CACHE_TTL seconds.
+class MasterCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keys = None
+        self.version = None
+        self.loaded_at = 0.0
+
+    def load(self):
+        keys = {}
+        for kind, (model, fields) in MASTERS.items():
+            rows = model.objects.values_list(*fields)
+            keys[kind] = frozenset(row if len(fields) > 1 else row[0] for row in rows)
+        return keys
+
+    def stale(self, version):
+        return (
+            self.keys is None or self.version != version
+            or time.monotonic() - self.loaded_at > cache_ttl()
+        )
+
+    def get(self):
+        version = shared_version()
+        keys = self.keys
+        if self.stale(version):
+            with self.lock:
+                if self.stale(version):
+                    # Stamp read before loading: a change made meanwhile reloads again
+                    self.keys = self.load()
+                    self.version = version
+                    self.loaded_at = time.monotonic()
+                keys = self.keys
+        return keys
+
+    # Drops this copy and, through the shared stamp, every other process's
+    def invalidate(self):
+        bump_shared_version()
+        with self.lock:
+            self.keys = None
+
+
+master_cache = MasterCache()
+
+
+# Checks one capture against the masters; returns {field: message} for every
+# field that is not on file. Fields whose master table is empty are not checked.
+def validate_capture(owner, location, sku, uom):
+    keys = master_cache.get()
+    errors = {}
+    if keys['owner'] and owner not in keys['owner']:
+        errors['owner'] = f"Unknown owner {owner}"
+    if keys['location'] and location not in keys['location']:
+        errors['location'] = f"Unknown location {location}"
+    if keys['sku'] and (owner, sku) not in keys['sku']:
+        errors['sku'] = f"Unknown SKU {sku} for owner {owner}"
+    if keys['uom'] and uom not in keys['uom']:
+        errors['uom'] = f"Unknown UOM {uom}"
+    return errors
+
+
+def read_master_file(file, filename):
+    if os.path.splitext(filename)[1].lower() in ('.xlsx', '.xls'):
+        df = pd.read_excel(file, dtype=str)
+    else:
+        df = pd.read_csv(file, dtype=str)
+    df.columns = [str(column).strip().upper() for column in df.columns]
+    return df
+
+
+# Bulk imports a CSV/XLSX master file, inserting new keys and updating the
+# description of existing ones. Returns the number of rows imported.
+def import_master(kind, file, filename=None):
+    if kind not in MASTERS:
+        raise ValueError(f"Unknown master '{kind}', expected one of: {', '.join(MASTERS)}")
+    model, fields = MASTERS[kind]
+
+    df = read_master_file(file, filename or getattr(file, 'name', ''))
+    columns = [model._meta.get_field(field).db_column for field in fields]
+    missing = [column for column in columns if column not in df.columns]
+    if missing:
+        raise ValueError(f"Missing column(s) {', '.join(missing)} in {kind} master file")
+
+    if 'DESCRIPTION' not in df.columns:
+        df['DESCRIPTION'] = ''
+    df = df[columns + ['DESCRIPTION']].fillna('')
+    df = df.apply(lambda column: column.str.strip())
+    df = df[(df[columns] != '').all(axis=1)].drop_duplicates(subset=columns, keep='last')
+
+    now = timezone.now().replace(microsecond=0)
+    rows = [
+        model(description=values[-1][:255], updated_datetime=now, **dict(zip(fields, values[:-1])))
+        for values in df.itertuples(index=False, name=None)
+    ]
+    upsert = {"update_conflicts": True, "update_fields": ['description', 'updated_datetime']}
+    if connection.features.supports_update_conflicts_with_target:
+        upsert["unique_fields"] = list(fields)
+    model.objects.bulk_create(rows, batch_size=IMPORT_BATCH_SIZE, **upsert)
+
+    master_cache.invalidate()
+    return len(rows)
+
+
+def on_master_changed(sender, **kwargs):
+    master_cache.invalidate()
+
+
+def connect_signals():
+    for kind, (model, _) in MASTERS.items():
+        post_save.connect(on_master_changed, sender=model, dispatch_uid=f"inventory_master_{kind}_saved")
+        post_delete.connect(on_master_changed, sender=model, dispatch_uid=f"inventory_master_{kind}_deleted")
@@ -0,0 +1,99 @@
+import threading
+
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+
+# Process-wide counters, read by the metrics views
+_lock = threading.Lock()
+_counters = {
+    "requests": 0,
+    "connections_opened": 0,
+}
+# Per-view request totals recorded by RequestMetricsMiddleware
+_views = {}
+VIEW_FIELDS = ("requests", "queries", "db_seconds", "seconds", "response_bytes", "query_alerts")
+
+
+def increment(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def snapshot():
+    with _lock:
+        return dict(_counters)
+
+
+def record_view(view, queries, db_seconds, seconds, response_bytes, query_alert):
+    with _lock:
+        totals = _views.setdefault(view, dict.fromkeys(VIEW_FIELDS, 0))
+        totals["requests"] += 1
+        totals["queries"] += queries
+        totals["db_seconds"] += db_seconds
+        totals["seconds"] += seconds
+        totals["response_bytes"] += response_bytes or 0
+        totals["query_alerts"] += int(query_alert)
+
+
+def view_snapshot():
+    with _lock:
+        return {view: dict(totals) for view, totals in _views.items()}
+
+
+PROMETHEUS_VIEW_METRICS = (
+    ("requests", "inventory_view_requests_total", "Requests handled per view"),
+    ("queries", "inventory_view_queries_total", "SQL queries issued per view"),
+    ("db_seconds", "inventory_view_db_seconds_total", "Time spent in SQL per view"),
+    ("seconds", "inventory_view_seconds_total", "Total request time per view"),
+    ("response_bytes", "inventory_view_response_bytes_total", "Response body bytes per view (streamed bodies excluded)"),
+    ("query_alerts", "inventory_view_query_alerts_total", "Requests over the query count or repeated-query thresholds"),
+)
+
+
+# Renders all counters in the Prometheus text exposition format
+def prometheus_text():
+    lines = []
+    stats = connection_stats()
+    for name, help_text in (
+        ("requests", "Requests finished by this process"),
+        ("connections_opened", "Database connections opened by this process"),
+    ):
+        lines += [f"# HELP inventory_{name}_total {help_text}", f"# TYPE inventory_{name}_total counter",
+                  f"inventory_{name}_total {stats[name]}"]
+    lines += ["# HELP inventory_connection_reuse_ratio Share of requests served on a reused connection",
+              "# TYPE inventory_connection_reuse_ratio gauge",
+              f"inventory_connection_reuse_ratio {stats['connection_reuse_ratio']}"]
+
+    views = view_snapshot()
+    for field, metric, help_text in PROMETHEUS_VIEW_METRICS:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        for view, totals in sorted(views.items()):
+            value = totals[field]
+            value = f"{value:.6f}" if isinstance(value, float) else value
+            lines.append(f'{metric}{{view="{view}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def connection_stats():
+    counters = snapshot()
+    requests = counters["requests"]
+    opened = counters["connections_opened"]
+    return {
+        "requests": requests,
+        "connections_opened": opened,
+        # Share of requests served on a connection opened by an earlier request
+        "connection_reuse_ratio": round(max(requests - opened, 0) / requests, 4) if requests else 0.0,
+    }
+
+
+def on_connection_created(sender, connection, **kwargs):
+    increment("connections_opened")
+
+
+def on_request_finished(sender, **kwargs):
+    increment("requests")
+
+
+def connect_signals():
+    connection_created.connect(on_connection_created, dispatch_uid="inventory_metrics_connection_created")
+    request_finished.connect(on_request_finished, dispatch_uid="inventory_metrics_request_finished")
@@ -0,0 +1,103 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import record_view
+
+logger = logging.getLogger('Inventoryapp.requests')
+
+
+class QueryRecorder:
+    """execute_wrapper that counts queries and the time spent running them."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+
+@contextmanager
+def record_queries(recorder):
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        yield
+
+
+# Records query count, DB time, total time and response size for every
+# request, logs them as one JSON line per request and feeds the /metrics/
+# counters. Requests over the configured query count, or repeating the same
+# SQL statement too often (the N+1 pattern), are logged as warnings.
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with record_queries(recorder):
+            response = self.get_response(request)
+        self.report(request, response, recorder, time.perf_counter() - started)
+        return response
+
+    # Async views run their ORM work through sync_to_async in this request's
+    # context, on the same connection objects, so their queries are counted too
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with record_queries(recorder):
+            response = await self.get_response(request)
+        self.report(request, response, recorder, time.perf_counter() - started)
+        return response
+
+    def report(self, request, response, recorder, seconds):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unresolved'
+        size = None if response.streaming else len(response.content)
+
+        thresholds = getattr(settings, 'REQUEST_METRICS', {})
+        max_queries = thresholds.get('VIEW_QUERY_LIMITS', {}).get(view, thresholds.get('QUERY_LIMIT', 50))
+        max_repeats = thresholds.get('REPEATED_QUERY_LIMIT', 10)
+        repeated = max(recorder.statements.values(), default=0)
+        alert = recorder.count > max_queries or repeated > max_repeats
+
+        record_view(view, recorder.count, recorder.seconds, seconds, size, alert)
+        line = json.dumps({
+            "view": view,
+            "method": request.method,
+            "status": response.status_code,
+            "queries": recorder.count,
+            "repeated_query_max": repeated,
+            "db_ms": round(recorder.seconds * 1000, 2),
+            "total_ms": round(seconds * 1000, 2),
+            "response_bytes": size,
+        })
+        if alert:
+            logger.warning("query threshold exceeded %s", line)
+        else:
+            logger.info(line)
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Inventoryapp', '0008_alter_nextupnumber_prefix'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('generate', 'Generate ASN & Export'), ('export', 'Export')], db_column='KIND', default='generate', max_length=20)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_column='STATUS', default='queued', max_length=10)),
+                ('progress', models.IntegerField(db_column='PROGRESS', default=0)),
+                ('message', models.CharField(blank=True, db_column='MESSAGE', default='', max_length=255)),
+                ('row_count', models.IntegerField(db_column='ROWCOUNT', default=0)),
+                ('artifact', models.CharField(blank=True, db_column='ARTIFACT', default='', max_length=255)),
+                ('username', models.CharField(blank=True, db_column='USERNAME', max_length=100, null=True)),
+                ('created_date', models.DateTimeField(blank=True, db_column='ADDDATE', null=True)),
+                ('started_datetime', models.DateTimeField(blank=True, db_column='STARTDATE', null=True)),
+                ('finished_datetime', models.DateTimeField(blank=True, db_column='ENDDATE', null=True)),
+            ],
+            options={
+                'db_table': 'EXPORTJOB',
+            },
+        ),
+    ]
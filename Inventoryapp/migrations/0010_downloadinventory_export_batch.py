@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Inventoryapp', '0009_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='downloadinventory',
+            name='export_batch',
+            field=models.CharField(blank=True, db_column='EXPORTBATCH', db_index=True, max_length=32, null=True),
+        ),
+    ]
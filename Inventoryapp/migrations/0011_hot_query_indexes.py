@@ -0,0 +1,39 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:48
+
+from django.db import migrations, models
+
+LINE_NUMBER_WIDTH = 5
+
+
+# Zero-pads line numbers written without padding, so they sort numerically
+def pad_line_numbers(apps, schema_editor):
+    DownloadInventory = apps.get_model('Inventoryapp', 'DownloadInventory')
+    unpadded = DownloadInventory.objects.exclude(line_number__regex=rf'^[0-9]{{{LINE_NUMBER_WIDTH},}}$')
+    for row in unpadded.only('pk', 'line_number').iterator():
+        digits = ''.join(filter(str.isdigit, row.line_number or '')) or '0'
+        DownloadInventory.objects.filter(pk=row.pk).update(
+            line_number=f"{int(digits):0{LINE_NUMBER_WIDTH}d}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Inventoryapp', '0010_downloadinventory_export_batch'),
+    ]
+
+    operations = [
+        migrations.RunPython(pad_line_numbers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='downloadinventory',
+            index=models.Index(fields=['download_status', 'id'], name='downinv_status_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='downloadinventory',
+            index=models.Index(fields=['asn_number', 'line_number'], name='downinv_asn_line_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorycapture',
+            index=models.Index(fields=['status', 'id'], name='invcapture_status_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Inventoryapp', '0011_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventorycapture',
+            name='capture_key',
+            field=models.CharField(blank=True, db_column='CAPTUREKEY', max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Inventoryapp', '0012_inventorycapture_capture_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationMaster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(db_column='LOCATION', max_length=100, unique=True)),
+                ('description', models.CharField(blank=True, db_column='DESCRIPTION', default='', max_length=255)),
+                ('updated_datetime', models.DateTimeField(blank=True, db_column='EDITDATE', null=True)),
+            ],
+            options={
+                'db_table': 'LOCATIONMASTER',
+            },
+        ),
+        migrations.CreateModel(
+            name='OwnerMaster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(db_column='OWNER', max_length=100, unique=True)),
+                ('description', models.CharField(blank=True, db_column='DESCRIPTION', default='', max_length=255)),
+                ('updated_datetime', models.DateTimeField(blank=True, db_column='EDITDATE', null=True)),
+            ],
+            options={
+                'db_table': 'OWNERMASTER',
+            },
+        ),
+        migrations.CreateModel(
+            name='UomMaster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uom', models.CharField(db_column='UOM', max_length=20, unique=True)),
+                ('description', models.CharField(blank=True, db_column='DESCRIPTION', default='', max_length=255)),
+                ('updated_datetime', models.DateTimeField(blank=True, db_column='EDITDATE', null=True)),
+            ],
+            options={
+                'db_table': 'UOMMASTER',
+            },
+        ),
+        migrations.CreateModel(
+            name='SkuMaster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(db_column='OWNER', max_length=100)),
+                ('sku', models.CharField(db_column='SKU', max_length=100)),
+                ('description', models.CharField(blank=True, db_column='DESCRIPTION', default='', max_length=255)),
+                ('updated_datetime', models.DateTimeField(blank=True, db_column='EDITDATE', null=True)),
+            ],
+            options={
+                'db_table': 'SKUMASTER',
+                'constraints': [models.UniqueConstraint(fields=('owner', 'sku'), name='skumaster_owner_sku_uniq')],
+            },
+        ),
+    ]
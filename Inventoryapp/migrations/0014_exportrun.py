@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Inventoryapp', '0013_master_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_id', models.BigIntegerField(db_column='FIRSTID', unique=True)),
+                ('last_id', models.BigIntegerField(db_column='LASTID', db_index=True)),
+                ('row_count', models.IntegerField(db_column='ROWCOUNT', default=0)),
+                ('artifact', models.CharField(blank=True, db_column='ARTIFACT', default='', max_length=255)),
+                ('username', models.CharField(blank=True, db_column='USERNAME', max_length=100, null=True)),
+                ('created_date', models.DateTimeField(blank=True, db_column='ADDDATE', null=True)),
+            ],
+            options={
+                'db_table': 'EXPORTRUN',
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Inventoryapp', '0014_exportrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AsnRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(db_column='HOUR')),
+                ('owner', models.CharField(db_column='OWNER', max_length=100)),
+                ('username', models.CharField(db_column='USERNAME', max_length=100)),
+                ('status', models.IntegerField(db_column='STATUS')),
+                ('asns', models.IntegerField(db_column='ASNCOUNT', default=0)),
+                ('lines', models.IntegerField(db_column='LINECOUNT', default=0)),
+                ('quantity', models.BigIntegerField(db_column='QUANTITY', default=0)),
+            ],
+            options={
+                'db_table': 'ASNROLLUP',
+                'constraints': [models.UniqueConstraint(fields=('hour', 'owner', 'username', 'status'), name='asnrollup_key_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CaptureRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(db_column='HOUR')),
+                ('owner', models.CharField(db_column='OWNER', max_length=100)),
+                ('sku', models.CharField(db_column='SKU', max_length=100)),
+                ('username', models.CharField(db_column='USERNAME', max_length=100)),
+                ('lines', models.IntegerField(db_column='LINECOUNT', default=0)),
+                ('quantity', models.BigIntegerField(db_column='QUANTITY', default=0)),
+                ('processed_lines', models.IntegerField(db_column='PROCESSEDLINES', default=0)),
+                ('processed_quantity', models.BigIntegerField(db_column='PROCESSEDQUANTITY', default=0)),
+            ],
+            options={
+                'db_table': 'CAPTUREROLLUP',
+                'constraints': [models.UniqueConstraint(fields=('hour', 'owner', 'sku', 'username'), name='capturerollup_key_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Inventoryapp', '0015_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AsnLineSource',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('capture_id', models.BigIntegerField(db_column='CAPTUREID', unique=True)),
+                ('asn_number', models.CharField(db_column='ASNNUMBER', max_length=20)),
+                ('line_number', models.CharField(db_column='LINENUMBER', max_length=6)),
+            ],
+            options={
+                'db_table': 'ASNLINESOURCE',
+                'indexes': [models.Index(fields=['asn_number', 'line_number'], name='asnlinesource_line_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Inventoryapp', '0016_asn_line_sources'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='consolidate',
+            field=models.BooleanField(db_column='CONSOLIDATE', null=True),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='export_format',
+            field=models.CharField(db_column='FORMAT', default='xlsx', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='packing',
+            field=models.CharField(blank=True, db_column='PACKING', max_length=20, null=True),
+        ),
+    ]
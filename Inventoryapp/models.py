@@ -1,6 +1,11 @@
 from django.db import models
 from django.utils import timezone
 
+# Status constants for tracking inventory processing
+STATUS_NEW = 0
+STATUS_PENDING = 1
+STATUS_PROCESSED = 2
+
 # Model to store captured inventory data entered by users
 class InventoryCapture(models.Model):
     owner = models.CharField(max_length=100, db_column='OWNER')  # Name of the inventory owner
@@ -12,9 +17,14 @@ class InventoryCapture(models.Model):
     username = models.CharField(max_length=100, default='default_user', db_column='USERNAME')  # Capturing user's name
     created_date = models.DateTimeField(blank=True, null=True, db_column='ADDDATE')  # Record creation time
     status = models.IntegerField(default=0, db_column='STATUS')  # Status (custom logic can apply)
+    capture_key = models.CharField(max_length=64, unique=True, blank=True, null=True, db_column='CAPTUREKEY')  # Scanner idempotency key
 
     class Meta:
         db_table = 'INVENTORYCAPTURE'  # Table name in the database
+        indexes = [
+            # New captures picked up by ASN generation, in id order
+            models.Index(fields=['status', 'id'], name='invcapture_status_id_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         # Set created_date automatically if not provided
@@ -75,6 +85,10 @@ class NextupNumber(models.Model):
         super().save(*args, **kwargs)
 
 
+# Line numbers are stored zero-padded to this width so they sort numerically
+LINE_NUMBER_WIDTH = 5
+
+
 # Model to store final records ready for download or export
 class DownloadInventory(models.Model):
     owner = models.CharField(max_length=100, db_column='OWNER')  # Owner of the item
@@ -84,7 +98,7 @@ class DownloadInventory(models.Model):
     uom = models.CharField(max_length=20, db_column='UOM')  # Unit of Measure
     quantity = models.IntegerField(default=1, db_column='QUANTITY')  # Quantity of the item
     asn_number = models.CharField(max_length=20, db_column='ASNNUMBER')  # ASN number assigned
-    line_number = models.CharField(max_length=6, db_column='LINENUMBER')  # Line number under ASN
+    line_number = models.CharField(max_length=6, db_column='LINENUMBER')  # Line number under ASN, zero-padded to LINE_NUMBER_WIDTH
     status = models.IntegerField(default=1, db_column='STATUS')  # Item status (active, processed, etc.)
 
     download_status = models.CharField(
@@ -93,12 +107,194 @@ class DownloadInventory(models.Model):
         default='no',
         db_column='DOWNLOADSTATUS'
     )  # Whether the data is downloaded
+    export_batch = models.CharField(max_length=32, blank=True, null=True, db_index=True, db_column='EXPORTBATCH')  # Export that claimed the row
 
     updated_username = models.CharField(max_length=100, blank=True, null=True, db_column='UPDATEDUSERNAME')  # Updated by
     updated_datetime = models.DateTimeField(blank=True, null=True, db_column='LASTLOGIN')  # Last update timestamp
 
     class Meta:
         db_table = 'DOWNLOADINVENTORY'
+        indexes = [
+            # Rows pending download, claimed by exports in id order
+            models.Index(fields=['download_status', 'id'], name='downinv_status_id_idx'),
+            # Last line of an ASN (line numbers are zero-padded, so they sort numerically)
+            models.Index(fields=['asn_number', 'line_number'], name='downinv_asn_line_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.asn_number} - {self.line_number}"
+
+# Audit trail of consolidated ASN generation: the capture rows summed into
+# each DOWNLOADINVENTORY line (see utils.consolidate_captures)
+class AsnLineSource(models.Model):
+    capture_id = models.BigIntegerField(unique=True, db_column='CAPTUREID')  # INVENTORYCAPTURE id
+    asn_number = models.CharField(max_length=20, db_column='ASNNUMBER')  # ASN of the consolidated line
+    line_number = models.CharField(max_length=6, db_column='LINENUMBER')  # Line number under that ASN
+
+    class Meta:
+        db_table = 'ASNLINESOURCE'
+        indexes = [
+            models.Index(fields=['asn_number', 'line_number'], name='asnlinesource_line_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.asn_number} - {self.line_number} <- capture {self.capture_id}"
+
+# Model to track background ASN generation / Excel export jobs
+class ExportJob(models.Model):
+    KIND_GENERATE = 'generate'
+    KIND_EXPORT = 'export'
+    KIND_CHOICES = [(KIND_GENERATE, 'Generate ASN & Export'), (KIND_EXPORT, 'Export')]
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default=KIND_GENERATE, db_column='KIND')  # What the job does
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_column='STATUS')  # Job state
+    progress = models.IntegerField(default=0, db_column='PROGRESS')  # Percent complete (0-100)
+    message = models.CharField(max_length=255, blank=True, default='', db_column='MESSAGE')  # Result or error message
+    row_count = models.IntegerField(default=0, db_column='ROWCOUNT')  # Detail rows exported
+    artifact = models.CharField(max_length=255, blank=True, default='', db_column='ARTIFACT')  # File name under EXPORT_JOB_DIR
+    username = models.CharField(max_length=100, blank=True, null=True, db_column='USERNAME')  # Requested by
+    export_format = models.CharField(max_length=10, default='xlsx', db_column='FORMAT')  # File format (export_formats.py)
+    packing = models.CharField(max_length=20, blank=True, null=True, db_column='PACKING')  # ASN packing mode, None = ASN_PACKING
+    consolidate = models.BooleanField(null=True, db_column='CONSOLIDATE')  # Consolidate captures, None = setting
+    created_date = models.DateTimeField(blank=True, null=True, db_column='ADDDATE')  # Queued at
+    started_datetime = models.DateTimeField(blank=True, null=True, db_column='STARTDATE')  # Picked up by a worker at
+    finished_datetime = models.DateTimeField(blank=True, null=True, db_column='ENDDATE')  # Finished at
+
+    class Meta:
+        db_table = 'EXPORTJOB'
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+    def save(self, *args, **kwargs):
+        if not self.created_date:
+            self.created_date = timezone.now().replace(microsecond=0)
+        super().save(*args, **kwargs)
+
+
+
+# One incremental (watermark) export: the DOWNLOADINVENTORY id range it
+# covered and the workbook it produced (see export_runs.py)
+class ExportRun(models.Model):
+    first_id = models.BigIntegerField(unique=True, db_column='FIRSTID')  # First DOWNLOADINVENTORY id in range
+    last_id = models.BigIntegerField(db_index=True, db_column='LASTID')  # Last DOWNLOADINVENTORY id in range (the watermark)
+    row_count = models.IntegerField(default=0, db_column='ROWCOUNT')  # Detail rows exported
+    artifact = models.CharField(max_length=255, blank=True, default='', db_column='ARTIFACT')  # File name under EXPORT_RUN_DIR
+    username = models.CharField(max_length=100, blank=True, null=True, db_column='USERNAME')  # Exported by
+    created_date = models.DateTimeField(blank=True, null=True, db_column='ADDDATE')  # Export time
+
+    class Meta:
+        db_table = 'EXPORTRUN'
+
+    def __str__(self):
+        return f"Run #{self.pk} ({self.first_id}-{self.last_id})"
+
+    def save(self, *args, **kwargs):
+        if not self.created_date:
+            self.created_date = timezone.now().replace(microsecond=0)
+        super().save(*args, **kwargs)
+
+# Master data that captures are validated against (see masters.py).
+# A master table with no rows does not restrict its field.
+class OwnerMaster(models.Model):
+    owner = models.CharField(max_length=100, unique=True, db_column='OWNER')  # Owner / storer key
+    description = models.CharField(max_length=255, blank=True, default='', db_column='DESCRIPTION')  # Owner name
+    updated_datetime = models.DateTimeField(blank=True, null=True, db_column='EDITDATE')  # Last import or edit
+
+    class Meta:
+        db_table = 'OWNERMASTER'
+
+    def __str__(self):
+        return self.owner
+
+
+class SkuMaster(models.Model):
+    owner = models.CharField(max_length=100, db_column='OWNER')  # Owner the SKU belongs to
+    sku = models.CharField(max_length=100, db_column='SKU')  # Stock Keeping Unit
+    description = models.CharField(max_length=255, blank=True, default='', db_column='DESCRIPTION')  # Item description
+    updated_datetime = models.DateTimeField(blank=True, null=True, db_column='EDITDATE')  # Last import or edit
+
+    class Meta:
+        db_table = 'SKUMASTER'
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'sku'], name='skumaster_owner_sku_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner} - {self.sku}"
+
+
+class LocationMaster(models.Model):
+    location = models.CharField(max_length=100, unique=True, db_column='LOCATION')  # Warehouse location
+    description = models.CharField(max_length=255, blank=True, default='', db_column='DESCRIPTION')  # Location description
+    updated_datetime = models.DateTimeField(blank=True, null=True, db_column='EDITDATE')  # Last import or edit
+
+    class Meta:
+        db_table = 'LOCATIONMASTER'
+
+    def __str__(self):
+        return self.location
+
+
+class UomMaster(models.Model):
+    uom = models.CharField(max_length=20, unique=True, db_column='UOM')  # Unit of Measure
+    description = models.CharField(max_length=255, blank=True, default='', db_column='DESCRIPTION')  # UOM description
+    updated_datetime = models.DateTimeField(blank=True, null=True, db_column='EDITDATE')  # Last import or edit
+
+    class Meta:
+        db_table = 'UOMMASTER'
+
+    def __str__(self):
+        return self.uom
+
+
+# Supervisor reporting rollups, kept up to date as captures are saved and
+# ASNs generated (see rollups.py). Each row adds up one hour of activity.
+class CaptureRollup(models.Model):
+    hour = models.DateTimeField(db_column='HOUR')  # Capture hour (ADDDATE truncated to the hour)
+    owner = models.CharField(max_length=100, db_column='OWNER')  # Owner of the captured lines
+    sku = models.CharField(max_length=100, db_column='SKU')  # Stock Keeping Unit
+    username = models.CharField(max_length=100, db_column='USERNAME')  # Capturing user's name
+    lines = models.IntegerField(default=0, db_column='LINECOUNT')  # Lines captured
+    quantity = models.BigIntegerField(default=0, db_column='QUANTITY')  # Quantity captured
+    processed_lines = models.IntegerField(default=0, db_column='PROCESSEDLINES')  # Of those, lines put on an ASN
+    processed_quantity = models.BigIntegerField(default=0, db_column='PROCESSEDQUANTITY')  # Of those, quantity put on an ASN
+
+    class Meta:
+        db_table = 'CAPTUREROLLUP'
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'owner', 'sku', 'username'], name='capturerollup_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H}:00 {self.owner} - {self.sku} ({self.username})"
+
+
+class AsnRollup(models.Model):
+    hour = models.DateTimeField(db_column='HOUR')  # Generation hour
+    owner = models.CharField(max_length=100, db_column='OWNER')  # Owner of the ASNs
+    username = models.CharField(max_length=100, db_column='USERNAME')  # User who generated them
+    status = models.IntegerField(db_column='STATUS')  # DOWNLOADINVENTORY status of the lines
+    asns = models.IntegerField(default=0, db_column='ASNCOUNT')  # ASN numbers generated
+    lines = models.IntegerField(default=0, db_column='LINECOUNT')  # ASN lines generated
+    quantity = models.BigIntegerField(default=0, db_column='QUANTITY')  # Quantity on those lines
+
+    class Meta:
+        db_table = 'ASNROLLUP'
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'owner', 'username', 'status'], name='asnrollup_key_uniq'),
+        ]
 
     def __str__(self):
-        return f"{self.asn_number} - {self.line_number}"
\ No newline at end of file
+        return f"{self.hour:%Y-%m-%d %H}:00 {self.owner} ({self.username})"
@@ -0,0 +1,237 @@
+"""
+Hourly rollups of capture and ASN activity for supervisor reporting.
+
+CAPTUREROLLUP holds, per hour / owner / SKU / capturing user, the lines and
+quantity captured and how much of it has since been put on an ASN.
+ASNROLLUP holds, per hour / owner / generating user / line status, the ASN
+numbers, lines and quantity generated.
+
+The rows are maintained incrementally:
+
+* ``record_captures``   -- by ``inventory_view`` and ``save_capture_batch``, in
+  the same transaction as the captures
+* ``record_allocation`` -- by ``allocate_pending_asns``, in its own short
+  transaction once the allocation has committed. Scans upsert the same
+  current-hour rows, so they must not stay locked while the allocation
+  inserts its lines. A failure there is logged and leaves the rollups short
+  until the next ``rebuild_rollups``.
+
+Each call adds its totals with one multi-row upsert per table
+(``INSERT ... ON DUPLICATE KEY UPDATE col = col + VALUES(col)`` on MySQL,
+``ON CONFLICT ... DO UPDATE`` on SQLite/PostgreSQL), so concurrent writers
+never lose each other's increments. Reports (``rollup_report``) then read only
+the rollup rows inside the requested time window, however large
+INVENTORYCAPTURE and DOWNLOADINVENTORY grow.
+
+Captures without an ADDDATE are not counted. Rows changed outside these paths
+(admin edits, deletes, SQL run by hand) are not tracked either: ``python
+manage.py rebuild_rollups`` recomputes both tables from the base tables.
+"""
+from django.db import connections, router, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncHour
+
+from .models import AsnRollup, CaptureRollup, DownloadInventory, InventoryCapture, STATUS_PROCESSED
+
+CAPTURE_KEY = ('hour', 'owner', 'sku', 'username')
+ASN_KEY = ('hour', 'owner', 'username', 'status')
+
+UPSERT_BATCH_SIZE = 500
+
+# Dimensions a report can be grouped by, and the subset ASNROLLUP carries
+REPORT_DIMENSIONS = CAPTURE_KEY
+ASN_REPORT_DIMENSIONS = ('hour', 'owner', 'username')
+
+
+def hour_of(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def counter_fields(model, key_fields):
+    return [
+        field.name for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in key_fields
+    ]
+
+
+# INSERT of ``row_count`` rows of key and counter columns that adds the
+# ``added`` counters onto rows whose key already exists. Returns None for
+# backends without a known upsert syntax.
+def upsert_sql(connection, model, key_fields, added, row_count):
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+
+    def column(name):
+        return qn(model._meta.get_field(name).column)
+
+    columns = [column(name) for name in (*key_fields, *counter_fields(model, key_fields))]
+    row = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    insert = f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([row] * row_count)}"
+
+    if connection.vendor == 'mysql':
+        update = ", ".join(f"{column(name)} = {column(name)} + VALUES({column(name)})" for name in added)
+        return f"{insert} ON DUPLICATE KEY UPDATE {update}"
+    if connection.vendor in ('sqlite', 'postgresql'):
+        update = ", ".join(f"{column(name)} = {table}.{column(name)} + excluded.{column(name)}" for name in added)
+        keys = ", ".join(column(name) for name in key_fields)
+        return f"{insert} ON CONFLICT ({keys}) DO UPDATE SET {update}"
+    return None
+
+
+# Adds ``totals`` ({key tuple: {field: amount}}, the same fields for every
+# key) onto the rollup rows with those keys, creating missing rows with every
+# other counter at 0. Keys are written in sorted order so two writers always
+# lock shared rows in the same order.
+def add_totals(model, key_fields, totals):
+    if not totals:
+        return
+    using = router.db_for_write(model)
+    connection = connections[using]
+    added = list(next(iter(totals.values())))
+    counters = counter_fields(model, key_fields)
+    rows = [
+        (*key, *(amounts.get(name, 0) for name in counters))
+        for key, amounts in sorted(totals.items())
+    ]
+
+    if upsert_sql(connection, model, key_fields, added, 1) is None:
+        # No upsert syntax known for this backend: update, then insert on a miss
+        with transaction.atomic(using=using):
+            for key, amounts in sorted(totals.items()):
+                lookup = dict(zip(key_fields, key))
+                updated = model.objects.using(using).filter(**lookup).update(
+                    **{name: F(name) + amount for name, amount in amounts.items()}
+                )
+                if not updated:
+                    model.objects.using(using).create(**lookup, **amounts)
+        return
+
+    fields = [model._meta.get_field(name) for name in (*key_fields, *counters)]
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            params = [
+                field.get_db_prep_save(value, connection)
+                for row in batch for field, value in zip(fields, row)
+            ]
+            cursor.execute(upsert_sql(connection, model, key_fields, added, len(batch)), params)
+
+
+# Counts newly saved InventoryCapture rows
+def record_captures(captures):
+    totals = {}
+    for capture in captures:
+        if not capture.created_date:
+            continue
+        key = (hour_of(capture.created_date), capture.owner or '', capture.sku or '', capture.username or '')
+        amounts = totals.setdefault(key, {'lines': 0, 'quantity': 0})
+        amounts['lines'] += 1
+        amounts['quantity'] += capture.quantity
+    add_totals(CaptureRollup, CAPTURE_KEY, totals)
+
+
+# Counts one ASN allocation: ``records`` are the captures that were
+# processed and ``lines`` the DownloadInventory lines created for them
+@transaction.atomic
+def record_allocation(records, lines):
+    processed = {}
+    for capture in records:
+        if not capture.created_date:
+            continue
+        key = (hour_of(capture.created_date), capture.owner or '', capture.sku or '', capture.username or '')
+        amounts = processed.setdefault(key, {'processed_lines': 0, 'processed_quantity': 0})
+        amounts['processed_lines'] += 1
+        amounts['processed_quantity'] += capture.quantity
+
+    asns = {}
+    for line in lines:
+        key = (hour_of(line.updated_datetime), line.owner or '', line.updated_username or '', line.status)
+        numbers, amounts = asns.setdefault(key, (set(), {'lines': 0, 'quantity': 0}))
+        numbers.add(line.asn_number)
+        amounts['lines'] += 1
+        amounts['quantity'] += line.quantity
+
+    add_totals(CaptureRollup, CAPTURE_KEY, processed)
+    add_totals(AsnRollup, ASN_KEY, {
+        key: {'asns': len(numbers), **amounts} for key, (numbers, amounts) in asns.items()
+    })
+
+
+# Recomputes both rollup tables from INVENTORYCAPTURE and DOWNLOADINVENTORY.
+# This scans both tables in full and replaces every rollup row, so run it off
+# shift: activity committed while it runs may be counted twice or not at all.
+# Returns the number of (capture, ASN) rollup rows written.
+def rebuild_rollups(batch_size=1000):
+    processed = Q(status=STATUS_PROCESSED)
+    captures = (
+        InventoryCapture.objects.filter(created_date__isnull=False)
+        .annotate(hour=TruncHour('created_date'))
+        .values(*CAPTURE_KEY)
+        .annotate(
+            lines=Count('pk'),
+            processed_lines=Count('pk', filter=processed),
+            processed_quantity=Coalesce(Sum('quantity', filter=processed), 0),
+            quantity=Sum('quantity'),  # last: the name shadows the column from here on
+        )
+        .order_by()
+    )
+    asns = (
+        DownloadInventory.objects.filter(updated_datetime__isnull=False)
+        .annotate(hour=TruncHour('updated_datetime'), username=Coalesce('updated_username', Value('')))
+        .values(*ASN_KEY)
+        .annotate(asns=Count('asn_number', distinct=True), lines=Count('pk'), quantity=Sum('quantity'))
+        .order_by()
+    )
+
+    with transaction.atomic():
+        CaptureRollup.objects.all().delete()
+        AsnRollup.objects.all().delete()
+        capture_rows = CaptureRollup.objects.bulk_create(
+            [CaptureRollup(**row) for row in captures], batch_size=batch_size
+        )
+        asn_rows = AsnRollup.objects.bulk_create([AsnRollup(**row) for row in asns], batch_size=batch_size)
+    return len(capture_rows), len(asn_rows)
+
+
+# Sums the rollups in [start, end) by ``group_by`` (any of REPORT_DIMENSIONS).
+# ASN figures are not kept per SKU, so they are grouped by the other
+# dimensions only, plus the line status.
+def rollup_report(start, end, group_by=('owner',), owner=None, username=None):
+    group_by = list(group_by)
+    unknown = set(group_by) - set(REPORT_DIMENSIONS)
+    if unknown:
+        raise ValueError(f"group_by must be among {', '.join(REPORT_DIMENSIONS)}")
+
+    filters = {'hour__gte': start, 'hour__lt': end}
+    if owner:
+        filters['owner'] = owner
+    if username:
+        filters['username'] = username
+
+    captures = (
+        CaptureRollup.objects.filter(**filters).values(*group_by)
+        .annotate(
+            lines=Sum('lines'),
+            quantity=Sum('quantity'),
+            processed_lines=Sum('processed_lines'),
+            processed_quantity=Sum('processed_quantity'),
+        )
+        .order_by(*group_by)
+    )
+    asn_group_by = [name for name in group_by if name in ASN_REPORT_DIMENSIONS] + ['status']
+    asns = (
+        AsnRollup.objects.filter(**filters).values(*asn_group_by)
+        .annotate(asns=Sum('asns'), lines=Sum('lines'), quantity=Sum('quantity'))
+        .order_by(*asn_group_by)
+    )
+
+    capture_rows = list(captures)
+    for row in capture_rows:
+        row['pending_lines'] = row['lines'] - row['processed_lines']
+    return {
+        "from": start,
+        "to": end,
+        "group_by": group_by,
+        "captures": capture_rows,
+        "asns": list(asns),
+    }
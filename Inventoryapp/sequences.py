@@ -0,0 +1,125 @@
+"""
+Number sequences (ASN, BSN, ...) backed by the NEXTUPNUMBER table.
+
+Numbers are reserved from the database in blocks and handed out from a
+per-process pool, so a busy worker touches NEXTUPNUMBER once per block
+instead of once per number.
+
+No-duplicate guarantee
+----------------------
+A block is reserved with a single compare-and-swap UPDATE::
+
+    UPDATE NEXTUPNUMBER SET CURRENTNUMBER = <start + size>
+    WHERE id = <row> AND CURRENTNUMBER = <start>
+
+Of all workers that read the same ``start`` only one UPDATE matches; the
+others see zero affected rows and retry with the fresh value. The
+reservation runs in autocommit mode on its own connection
+(``settings.ASN_SEQUENCE_DATABASE``), so it is never held open or rolled back
+by the caller's transaction, and no row lock outlives the single statement.
+Every number therefore belongs to exactly one block and every block to
+exactly one process, no matter how many workers run in parallel.
+
+Numbers still sitting in a pool when a process exits, or reserved for a
+transaction that later rolls back, are never reused: sequences may have gaps,
+never duplicates. ``Current_Number`` always holds the first unreserved number.
+"""
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from .models import NextupNumber
+
+MAX_RESERVE_ATTEMPTS = 50
+
+
+class SequenceExhausted(Exception):
+    """Raised when a sequence has no numbers left before its Ending_Number."""
+
+
+def parse_number(value):
+    return int(''.join(filter(str.isdigit, value or '')) or 0)
+
+
+class NumberSequence:
+    def __init__(self, seq_type="ASN", block_size=None, using=None):
+        self.seq_type = seq_type
+        self.block_size = block_size or getattr(settings, 'ASN_SEQUENCE_BLOCK_SIZE', 1)
+        self.using = using or self.default_alias()
+        self.pool = []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def default_alias():
+        alias = getattr(settings, 'ASN_SEQUENCE_DATABASE', DEFAULT_DB_ALIAS)
+        return alias if alias in connections.settings else DEFAULT_DB_ALIAS
+
+    def get_row(self, username=None):
+        rows = NextupNumber.objects.using(self.using).filter(type=self.seq_type).order_by('pk')
+        nextup = rows.first()
+        if nextup is None:
+            # Creation can race; every worker then settles on the lowest pk.
+            prefix = self.seq_type
+            NextupNumber.objects.using(self.using).create(
+                Starting_Number=f"{prefix}0000001",
+                Ending_Number=f"{prefix}9999999",
+                Current_Number=f"{prefix}0000001",
+                Next_Number=f"{prefix}0000002",
+                prefix=prefix,
+                NUMBEROFLINES=3,
+                created_username=username,
+                updated_username=username,
+                type=self.seq_type
+            )
+            nextup = rows.first()
+        return nextup
+
+    def reserve_block(self, size, username=None):
+        """Atomically reserve up to ``size`` numbers and return them formatted."""
+        for _ in range(MAX_RESERVE_ATTEMPTS):
+            nextup = self.get_row(username)
+            prefix = nextup.prefix or ""
+            start = parse_number(nextup.Current_Number)
+            end = parse_number(nextup.Ending_Number)
+            size = min(size, end - start + 1)
+            if size < 1:
+                raise SequenceExhausted(f"{self.seq_type} sequence reached {nextup.Ending_Number}")
+
+            stop = start + size
+            reserved = NextupNumber.objects.using(self.using).filter(
+                pk=nextup.pk, Current_Number=nextup.Current_Number
+            ).update(
+                Current_Number=f"{prefix}{stop:07d}",
+                Next_Number=f"{prefix}{stop + 1:07d}",
+                updated_username=username,
+                updated_datetime=timezone.now().replace(microsecond=0),
+            )
+            if reserved:
+                return [f"{prefix}{number:07d}" for number in range(start, stop)]
+
+        raise RuntimeError(f"Could not reserve {self.seq_type} numbers after {MAX_RESERVE_ATTEMPTS} attempts")
+
+    def take(self, count=1, username=None):
+        """Return ``count`` formatted numbers, refilling the pool as needed."""
+        with self.lock:
+            numbers = []
+            while len(numbers) < count:
+                if not self.pool:
+                    self.pool = self.reserve_block(max(count - len(numbers), self.block_size), username)
+                    self.pool.reverse()
+                numbers.append(self.pool.pop())
+            return numbers
+
+
+_sequences = {}
+_sequences_lock = threading.Lock()
+
+
+def get_sequence(seq_type="ASN"):
+    """Return this process's shared sequence for ``seq_type``."""
+    with _sequences_lock:
+        if seq_type not in _sequences:
+            _sequences[seq_type] = NumberSequence(seq_type)
+        return _sequences[seq_type]
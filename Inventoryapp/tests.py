@@ -1,3 +1,1535 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+from datetime import datetime, timedelta
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from unittest import SkipTest, mock, skipUnless
 
-# Create your tests here.
+import pandas as pd
+import pyarrow.parquet as pq
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.db import DatabaseError, connection, connections
+from django.db.models import QuerySet
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.management import call_command
+from django.test import (
+    Client, LiveServerTestCase, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from . import benchmarks, export_cache, export_excel, export_formats, logins, views
+from .export_excel import (
+    DATA_DESC, DATA_HEADERS, DETAIL_DESC, DETAIL_HEADERS, VALIDATION_ROWS,
+    build_data_sheet, build_detail_sheet, stream_datas_to_excel, write_inventory_workbook
+)
+from .export_formats import EXPORT_FORMATS, FLAT_COLUMNS
+from .jobs import job_batch, run_pending_jobs
+from .loadtest import run_load_test
+from .logins import flush_logins, record_login
+from .masters import MasterCache, import_master, master_cache, validate_capture
+from .metrics import connection_stats
+from .models import (
+    InventoryCapture, NextupNumber, DownloadInventory, ExportJob, ExportRun, UserMaster,
+    OwnerMaster, SkuMaster, LocationMaster, UomMaster, CaptureRollup, AsnRollup, AsnLineSource
+)
+from .rollups import rollup_report
+from .sequences import NumberSequence, SequenceExhausted
+from .utils import generate_pending_asns, plan_asn_lines, save_capture_batch
+
+
+# Exports go through the export cache: keep it out of the project directory
+def setUpModule():
+    global export_cache_dir, export_cache_settings
+    export_cache_dir = tempfile.TemporaryDirectory()
+    export_cache_settings = override_settings(EXPORT_CACHE_DIR=export_cache_dir.name)
+    export_cache_settings.enable()
+
+
+def tearDownModule():
+    export_cache_settings.disable()
+    export_cache_dir.cleanup()
+
+
+def make_nextup(number_of_lines=3, current="ASN0000001"):
+    return NextupNumber.objects.create(
+        Starting_Number="ASN0000001",
+        Ending_Number="ASN9999999",
+        Current_Number=current,
+        Next_Number="ASN0000002",
+        prefix="ASN",
+        NUMBEROFLINES=number_of_lines,
+        type="ASN",
+    )
+
+
+def make_captures(owners):
+    return [
+        InventoryCapture.objects.create(
+            owner=owner, location=f"LOC{i}", case=f"C{i}", sku=f"SKU{i}", uom="EA", quantity=i + 1
+        )
+        for i, owner in enumerate(owners)
+    ]
+
+
+def allocated_lines():
+    return list(
+        DownloadInventory.objects.order_by('pk').values_list(
+            'owner', 'sku', 'quantity', 'asn_number', 'line_number'
+        )
+    )
+
+
+class AsnPlanTests(SimpleTestCase):
+    def plan(self, owners, max_lines):
+        return plan_asn_lines([InventoryCapture(owner=owner) for owner in owners], max_lines)
+
+    def test_new_asn_on_owner_change_or_full_asn(self):
+        self.assertEqual(
+            self.plan(["A", "A", "A", "A", "B", "A"], 3),
+            [(0, 1), (0, 2), (0, 3), (1, 1), (2, 1), (3, 1)]
+        )
+        self.assertEqual(self.plan(["A", "A"], 1), [(0, 1), (1, 1)])
+        with self.assertRaises(ValueError):
+            self.plan(["A"], 0)
+
+
+def take_numbers(seq_type, block_size, rounds, queue):
+    # Runs in a forked worker: drop the parent's connections and draw numbers.
+    connections.close_all()
+    sequence = NumberSequence(seq_type, block_size=block_size)
+    taken = []
+    for i in range(rounds):
+        taken.extend(sequence.take(1 + i % 3, username="worker"))
+    connections.close_all()
+    queue.put(taken)
+
+
+class NumberSequenceTests(TransactionTestCase):
+    databases = {'default', 'sequences'}
+
+    def test_takes_numbers_from_reserved_blocks(self):
+        make_nextup()
+        sequence = NumberSequence("ASN", block_size=5)
+        self.assertEqual(sequence.take(2), ["ASN0000001", "ASN0000002"])
+        self.assertEqual(NextupNumber.objects.get().Current_Number, "ASN0000006")
+        self.assertEqual(sequence.take(4), ["ASN0000003", "ASN0000004", "ASN0000005", "ASN0000006"])
+        self.assertEqual(NextupNumber.objects.get().Current_Number, "ASN0000011")
+
+    def test_sequences_are_kept_per_type(self):
+        make_nextup()
+        NumberSequence("BSN").take(3)
+        self.assertEqual(NumberSequence("ASN").take(1), ["ASN0000001"])
+        self.assertEqual(NextupNumber.objects.get(type="BSN").Current_Number, "BSN0000004")
+
+    def test_respects_ending_number(self):
+        make_nextup()
+        NextupNumber.objects.update(Current_Number="ASN9999998")
+        sequence = NumberSequence("ASN", block_size=10)
+        self.assertEqual(sequence.take(2), ["ASN9999998", "ASN9999999"])
+        with self.assertRaises(SequenceExhausted):
+            sequence.take(1)
+
+    def test_no_duplicates_across_parallel_workers(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("worker processes need a database file to share")
+        make_nextup()
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        connections.close_all()
+        workers = [
+            context.Process(target=take_numbers, args=("ASN", block_size, 40, queue))
+            for block_size in (1, 1, 4, 4, 16, 16)
+        ]
+        for worker in workers:
+            worker.start()
+        taken = [number for _ in workers for number in queue.get(timeout=120)]
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+
+        self.assertEqual(len(taken), 6 * sum(1 + i % 3 for i in range(40)))
+        self.assertEqual(len(set(taken)), len(taken))
+
+
+def make_download_lines(count, owners=("A", "B")):
+    DownloadInventory.objects.bulk_create([
+        DownloadInventory(
+            owner=owners[i % len(owners)], location=f"LOC{i}", case=f"C{i}", sku=f"SKU{i}", uom="EA",
+            quantity=i + 1, asn_number=f"ASN{i // 2 + 1:07d}", line_number=f"{i % 2 + 1:05d}"
+        )
+        for i in range(count)
+    ], batch_size=500)
+
+
+class StreamingExportTests(TestCase):
+    def export(self, **kwargs):
+        response = self.client.get('/download_excel/', {'mode': 'stream'}, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return load_workbook(BytesIO(b''.join(response.streaming_content)))
+
+    def test_writes_data_detail_and_validation_sheets(self):
+        make_download_lines(3)
+        workbook = self.export()
+        self.assertEqual(workbook.sheetnames, ['Data', 'Detail', 'Validations'])
+
+        data = [list(row) for row in workbook['Data'].iter_rows(values_only=True)]
+        self.assertEqual(data[:2], [DATA_DESC, DATA_HEADERS])
+        self.assertEqual(data[2:], [
+            [None, None, 'ASN0000001', 'A', 0],
+            [None, None, 'ASN0000001', 'B', 0],
+            [None, None, 'ASN0000002', 'A', 0],
+        ])
+
+        detail = [list(row) for row in workbook['Detail'].iter_rows(values_only=True)]
+        self.assertEqual(detail[:2], [DETAIL_DESC, DETAIL_HEADERS])
+        self.assertEqual(detail[2], [None, None, 'ASN0000001', 'SKU0', 'A', '00001', 1, 'EA', 'C0', 'LOC0'])
+        self.assertEqual(len(detail), 5)
+
+        self.assertEqual(
+            [list(row) for row in workbook['Validations'].iter_rows(values_only=True)], VALIDATION_ROWS
+        )
+        self.assertFalse(DownloadInventory.objects.filter(download_status='no').exists())
+
+    def test_redirects_when_nothing_to_export(self):
+        response = self.client.get('/download_excel/', {'mode': 'stream'})
+        self.assertRedirects(response, '/inventory/', fetch_redirect_response=False)
+
+    def test_peak_memory_does_not_grow_with_row_count(self):
+        def peak_for(count):
+            DownloadInventory.objects.all().delete()
+            make_download_lines(count)
+            request = RequestFactory().get('/download_excel/')
+            request._messages = CookieStorage(request)
+            tracemalloc.start()
+            response = stream_datas_to_excel(request, chunk_size=100)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            response.file_to_stream.close()
+            return peak
+
+        small, large = peak_for(200), peak_for(2000)
+        self.assertLess(large, small * 2)
+
+
+class ExcelExportTests(TestCase):
+    def test_export_runs_on_the_django_connection(self):
+        make_download_lines(3)
+        response = self.client.get('/download_excel/')
+        self.assertEqual(response.status_code, 200)
+        workbook = load_workbook(BytesIO(response.content))
+        self.assertEqual(workbook.sheetnames, ['Data', 'Detail', 'Validations'])
+        detail = [list(row) for row in workbook['Detail'].iter_rows(values_only=True)]
+        self.assertEqual(detail[2], [None, None, 'ASN0000001', 'SKU0', 'A', '00001', 1, 'EA', 'C0', 'LOC0'])
+        self.assertFalse(DownloadInventory.objects.filter(download_status='no').exists())
+
+    def test_connection_metrics_count_requests_and_new_connections(self):
+        before = connection_stats()
+        self.client.get('/nextup/')
+        after = self.client.get('/metrics/connections/').json()
+        self.assertEqual(after['requests'], before['requests'] + 1)
+        self.assertEqual(after['connections_opened'], before['connections_opened'])
+
+
+class ExportMarkingTests(TestCase):
+    def insert_during_export(self, count):
+        start = DownloadInventory.objects.count()
+        DownloadInventory.objects.bulk_create([
+            DownloadInventory(owner="LATE", location="L", case=f"LATE{i}", sku="S", uom="EA",
+                              asn_number="ASN0000999", line_number=f"{i + 1:05d}")
+            for i in range(start, start + count)
+        ])
+
+    def assert_only_exported_rows_marked(self, workbook):
+        exported = [row[8] for row in workbook['Detail'].iter_rows(min_row=3, values_only=True)]
+        marked = list(
+            DownloadInventory.objects.filter(download_status='yes').order_by('pk').values_list('case', flat=True)
+        )
+        self.assertEqual(exported, marked)
+        self.assertEqual(len(exported), 7)
+        self.assertEqual(DownloadInventory.objects.filter(download_status='no', owner="LATE").count(), 6)
+        self.assertEqual(DownloadInventory.objects.filter(download_status='no').exclude(owner="LATE").count(), 0)
+
+    def test_rows_inserted_during_claim_are_left_for_the_next_export(self):
+        make_download_lines(7)
+        claim = export_excel.claim_pending_rows
+        update = QuerySet.update
+
+        # Another request commits a row right after each chunk is claimed
+        def update_then_insert(queryset, **kwargs):
+            updated = update(queryset, **kwargs)
+            if 'export_batch' in kwargs:
+                self.insert_during_export(2)
+            return updated
+
+        def claim_with_concurrent_inserts(batch, chunk_size=None):
+            with mock.patch.object(QuerySet, 'update', update_then_insert):
+                return claim(batch, chunk_size=3)
+
+        with mock.patch.object(export_excel, 'claim_pending_rows', side_effect=claim_with_concurrent_inserts):
+            response = self.client.get('/download_excel/')
+        self.assert_only_exported_rows_marked(load_workbook(BytesIO(response.content)))
+
+        response = self.client.get('/download_excel/')
+        self.assertEqual(load_workbook(BytesIO(response.content))['Detail'].max_row, 8)
+
+    def test_rows_inserted_while_streaming_are_not_marked(self):
+        make_download_lines(7)
+        output = BytesIO()
+        written = write_inventory_workbook(
+            output, chunk_size=3, progress=lambda done, total: self.insert_during_export(2)
+        )
+        self.assertEqual(written, 7)
+        self.assert_only_exported_rows_marked(load_workbook(output))
+
+    def test_claims_are_set_based_per_chunk(self):
+        make_download_lines(10)
+        # aggregate + 4 id chunks (the last one empty) + 3 updates
+        with self.assertNumQueries(8):
+            self.assertEqual(export_excel.claim_pending_rows("batch", chunk_size=4), 10)
+        self.assertEqual(DownloadInventory.objects.filter(export_batch="batch", download_status='yes').count(), 10)
+
+
+# Tables a query reads with a full table scan, per the database's query plan
+def full_scans(queryset):
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        plan = queryset.explain()
+        return re.findall(r'\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)', plan)
+    if vendor == 'mysql':
+        plan = queryset.explain(format='json')
+        return re.findall(r'"table_name": "(\w+)",\s*"access_type": "ALL"', plan)
+    if vendor == 'postgresql':
+        return re.findall(r'Seq Scan on "?(\w+)"?', queryset.explain())
+    raise SkipTest(f"no query plan check for {vendor}")
+
+
+class QueryPlanTests(TestCase):
+    def setUp(self):
+        make_download_lines(50)
+        make_captures(["A"] * 20)
+
+    def assert_no_full_scans(self, queryset):
+        self.assertEqual(full_scans(queryset), [], queryset.explain())
+
+    def test_export_claim_uses_status_index(self):
+        self.assert_no_full_scans(
+            DownloadInventory.objects.filter(download_status='no', pk__gt=10, pk__lte=40)
+            .order_by('pk').values_list('pk', flat=True)[:20]
+        )
+
+    def test_pending_export_lookup_uses_status_index(self):
+        self.assert_no_full_scans(
+            DownloadInventory.objects.filter(download_status='no').order_by('-pk').values_list('pk', flat=True)[:1]
+        )
+
+    def test_export_batch_read_uses_batch_index(self):
+        self.assert_no_full_scans(DownloadInventory.objects.filter(export_batch='batch').order_by('pk'))
+
+    def test_last_asn_line_uses_asn_index(self):
+        self.assert_no_full_scans(
+            DownloadInventory.objects.filter(asn_number='ASN0000001').order_by('-line_number')[:1]
+        )
+
+    def test_new_captures_use_status_index(self):
+        self.assert_no_full_scans(InventoryCapture.objects.filter(status=0).order_by('pk'))
+
+
+def export_frame(count):
+    return pd.DataFrame({
+        'id': range(1, count + 1),
+        'ASNNUMBER': [f"ASN{i // 3 + 1:07d}" for i in range(count)],
+        'SKU': [f"SKU{i % 97}" for i in range(count)],
+        'OWNER': [("A", "B")[i // 3 % 2] for i in range(count)],
+        'LINENUMBER': [f"{i % 3 + 1:05d}" for i in range(count)],
+        'QUANTITY': [i % 11 + 1 for i in range(count)],
+        'UOM': "EA",
+        'TOID': [f"C{i}" for i in range(count)],
+        'LOCATION': [f"LOC{i % 13}" for i in range(count)],
+    })
+
+
+# Row-by-row construction the export used before build_data_sheet/build_detail_sheet
+def iterrows_sheets(df):
+    df_data = df[['ASNNUMBER', 'OWNER']].drop_duplicates()
+    df_data['STATUS'] = 0
+    data_rows = [DATA_DESC, DATA_HEADERS]
+    for _, row in df_data[['ASNNUMBER', 'OWNER', 'STATUS']].iterrows():
+        data_rows.append(['', ''] + row.tolist())
+
+    df_detail = df[['ASNNUMBER', 'SKU', 'OWNER', 'LINENUMBER', 'QUANTITY', 'UOM', 'TOID', 'LOCATION']]
+    detail_rows = [DETAIL_DESC, DETAIL_HEADERS]
+    for _, row in df_detail.iterrows():
+        detail_rows.append(['', ''] + row.tolist())
+
+    return pd.DataFrame(data_rows, columns=DATA_HEADERS), pd.DataFrame(detail_rows, columns=DETAIL_HEADERS)
+
+
+def written_cells(frame):
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        frame.to_excel(writer, index=False, header=False, sheet_name='Sheet')
+    output.seek(0)
+    return [[(cell.value, cell.data_type) for cell in row] for row in load_workbook(output)['Sheet'].iter_rows()]
+
+
+class ExportSheetTests(SimpleTestCase):
+    def test_sheets_match_row_by_row_construction(self):
+        df = export_frame(50)
+        expected_data, expected_detail = iterrows_sheets(df)
+        self.assertEqual(written_cells(build_data_sheet(df)), written_cells(expected_data))
+        self.assertEqual(written_cells(build_detail_sheet(df)), written_cells(expected_detail))
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), "set RUN_BENCHMARKS=1 to run benchmarks")
+class ExportSheetBenchmark(SimpleTestCase):
+    SIZES = (10_000, 100_000, 1_000_000)
+
+    def test_sheet_construction_rows_per_second(self):
+        for count in self.SIZES:
+            df = export_frame(count)
+
+            started = time.perf_counter()
+            iterrows_sheets(df)
+            before = count / (time.perf_counter() - started)
+
+            started = time.perf_counter()
+            build_data_sheet(df)
+            build_detail_sheet(df)
+            after = count / (time.perf_counter() - started)
+
+            print(f"\n{count:>9} rows: iterrows {before:>12,.0f} rows/s, vectorized {after:>12,.0f} rows/s")
+
+
+class ExportJobTests(TransactionTestCase):
+    databases = {'default', 'sequences'}
+
+    def setUp(self):
+        self.job_dir = tempfile.TemporaryDirectory()
+        self.enterContext(override_settings(EXPORT_JOB_DIR=self.job_dir.name))
+        self.addCleanup(self.job_dir.cleanup)
+        User.objects.create_user(username="tester", password="secret")
+        self.client.login(username="tester", password="secret")
+
+    def test_generate_job_runs_off_the_request_and_serves_the_workbook(self):
+        make_nextup()
+        make_captures(["A", "A", "B"])
+
+        response = self.client.post('/jobs/', {'kind': 'generate'})
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(job['status'], 'queued')
+        self.assertFalse(DownloadInventory.objects.exists())
+
+        self.assertEqual(run_pending_jobs(), 1)
+
+        job = self.client.get(job['status_url']).json()
+        self.assertEqual((job['status'], job['progress'], job['row_count']), ('done', 100, 3))
+        response = self.client.get(job['download_url'])
+        workbook = load_workbook(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(workbook['Detail'].max_row, 5)
+        self.assertFalse(InventoryCapture.objects.filter(status=0).exists())
+
+    def test_generate_view_queues_a_job_when_enabled(self):
+        with override_settings(EXPORT_JOBS_ENABLED=True):
+            response = self.client.post('/generate-asn-download/')
+        self.assertContains(response, 'id="jobStatus"')
+        self.assertEqual(ExportJob.objects.get().status, ExportJob.STATUS_QUEUED)
+
+    @override_settings(EXPORT_JOBS_ENABLED=True)
+    def test_queued_jobs_keep_the_requested_options(self):
+        for query in ('format=bogus', 'pack=sku'):
+            response = self.client.post(f'/generate-asn-download/?{query}')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post('/jobs/', {'kind': 'export', 'format': 'xls'}).status_code, 400)
+        self.assertFalse(ExportJob.objects.exists())
+
+        make_nextup()
+        make_captures(["A", "B", "A"])
+        self.client.post('/generate-asn-download/?format=csv&pack=owner&consolidate=0')
+        job = ExportJob.objects.get()
+        self.assertEqual((job.export_format, job.packing, job.consolidate), ('csv', 'owner', False))
+
+        run_pending_jobs()
+        job = ExportJob.objects.get()
+        self.assertTrue(job.artifact.endswith('.csv'))
+        response = self.client.get(views.job_payload(job)['download_url'])
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([row.split(',')[2] for row in rows[1:]], ['A', 'A', 'B'])
+
+    @override_settings(EXCEL_EXPORT_CHUNK_SIZE=2)
+    def test_export_job_progress_is_committed_while_it_runs(self):
+        make_download_lines(5)
+        job = ExportJob.objects.create(kind=ExportJob.KIND_EXPORT, username="tester")
+        seen = []
+        iter_rows = export_excel.iter_detail_rows
+
+        def detail_rows(*args, **kwargs):
+            for row in iter_rows(*args, **kwargs):
+                seen.append((connection.in_atomic_block, ExportJob.objects.get(pk=job.pk).progress))
+                yield row
+
+        with mock.patch.object(export_excel, 'iter_detail_rows', detail_rows):
+            run_pending_jobs()
+        self.assertEqual(seen, [(False, 0), (False, 0), (False, 40), (False, 40), (False, 80)])
+
+    def test_failed_export_releases_the_claimed_rows(self):
+        make_download_lines(3)
+        with self.assertRaises(OSError):
+            write_inventory_workbook(BytesIO(), writer=mock.Mock(side_effect=OSError("disk full")))
+        self.assertEqual(
+            list(DownloadInventory.objects.values_list('download_status', 'export_batch')), [('no', None)] * 3
+        )
+
+    def test_job_status_and_file_need_a_login(self):
+        job = ExportJob.objects.create(kind=ExportJob.KIND_EXPORT, username="tester")
+        self.client.logout()
+        self.assertEqual(self.client.get(f'/jobs/{job.pk}/').status_code, 401)
+        self.assertEqual(self.client.get(f'/jobs/{job.pk}/download/').status_code, 401)
+
+    def test_jobs_abandoned_by_a_dead_worker_are_failed_and_their_rows_released(self):
+        make_download_lines(3)
+        started = timezone.now() - timedelta(hours=2)
+        stale = ExportJob.objects.create(
+            kind=ExportJob.KIND_EXPORT, username="tester", status=ExportJob.STATUS_RUNNING, started_datetime=started
+        )
+        live = ExportJob.objects.create(
+            kind=ExportJob.KIND_EXPORT, username="tester", status=ExportJob.STATUS_RUNNING,
+            started_datetime=timezone.now()
+        )
+        DownloadInventory.objects.update(download_status='yes', export_batch=job_batch(stale))
+
+        self.assertEqual(run_pending_jobs(), 0)
+        self.assertEqual(
+            [ExportJob.objects.get(pk=job.pk).status for job in (stale, live)],
+            [ExportJob.STATUS_FAILED, ExportJob.STATUS_RUNNING]
+        )
+        self.assertEqual(DownloadInventory.objects.filter(download_status='no', export_batch=None).count(), 3)
+
+    def test_job_with_nothing_to_export_has_no_file(self):
+        job = ExportJob.objects.create(kind=ExportJob.KIND_EXPORT, username="tester")
+        run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.artifact), (ExportJob.STATUS_DONE, ''))
+        self.assertEqual(self.client.get(f'/jobs/{job.pk}/download/').status_code, 404)
+
+
+class GenerateExportPipelineTests(TransactionTestCase):
+    databases = {'default', 'sequences'}
+
+    def setUp(self):
+        User.objects.create_user(username="tester", password="secret")
+        self.client.login(username="tester", password="secret")
+        make_nextup()
+
+    def generate(self):
+        response = self.client.post('/generate-asn-download/')
+        return load_workbook(BytesIO(b''.join(response.streaming_content)))
+
+    def test_exports_exactly_the_new_lines_already_marked_downloaded(self):
+        make_download_lines(2)
+        make_captures(["A", "A", "B", "B", "B"])
+
+        workbook = self.generate()
+        details = [row[2:] for row in workbook['Detail'].iter_rows(min_row=3, values_only=True)]
+        receipts = [row[2:4] for row in workbook['Data'].iter_rows(min_row=3, values_only=True)]
+
+        new_lines = DownloadInventory.objects.exclude(export_batch=None)
+        self.assertEqual(details, list(new_lines.order_by('pk').values_list(*export_excel.DETAIL_FIELDS)))
+        self.assertEqual(len(details), 5)
+        self.assertEqual(receipts, list(dict.fromkeys(new_lines.order_by('pk').values_list('asn_number', 'owner'))))
+        self.assertEqual(set(new_lines.values_list('download_status', flat=True)), {'yes'})
+        self.assertEqual(new_lines.values('export_batch').distinct().count(), 1)
+        self.assertEqual(DownloadInventory.objects.filter(download_status='no').count(), 2)
+        self.assertFalse(InventoryCapture.objects.filter(status=0).exists())
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        counts = []
+        for captures in (3, 40):
+            make_captures(["A"] * captures)
+            with CaptureQueriesContext(connection) as queries:
+                self.generate()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_failed_workbook_releases_the_lines_for_the_next_export(self):
+        make_captures(["A", "B"])
+        failing = mock.Mock(side_effect=OSError("disk full"))
+        with mock.patch.dict(EXPORT_FORMATS, xlsx=(export_excel.XLSX_CONTENT_TYPE, failing)):
+            response = self.client.post('/generate-asn-download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(DownloadInventory.objects.values_list('download_status', 'export_batch')), [('no', None)] * 2
+        )
+        self.assertFalse(InventoryCapture.objects.filter(status=0).exists())
+
+        response = self.client.get('/download_excel/', {'mode': 'stream'})
+        self.assertEqual(load_workbook(BytesIO(b''.join(response.streaming_content)))['Detail'].max_row, 4)
+
+    def test_generated_file_is_sent_when_it_cannot_be_cached(self):
+        make_captures(["A", "B"])
+        with mock.patch('Inventoryapp.export_cache.os.replace', side_effect=OSError("No space left")), \
+                self.assertLogs('Inventoryapp.export_cache', level='ERROR'):
+            response = self.client.post('/generate-asn-download/')
+        self.assertEqual(load_workbook(BytesIO(b''.join(response.streaming_content)))['Detail'].max_row, 4)
+        self.assertEqual(
+            DownloadInventory.objects.filter(export_batch=response['X-Export-Batch'], download_status='yes').count(), 2
+        )
+
+    def test_lines_never_sent_are_released_for_the_next_export(self):
+        make_captures(["A", "B"])
+        with mock.patch.object(export_cache, 'publish_and_open', side_effect=RuntimeError("gone")), \
+                self.assertLogs('Inventoryapp.views', level='ERROR'):
+            response = self.client.post('/generate-asn-download/')
+        self.assertContains(response, "Failed: gone")
+        self.assertEqual(
+            list(DownloadInventory.objects.values_list('download_status', 'export_batch')), [('no', None)] * 2
+        )
+        self.assertFalse(InventoryCapture.objects.filter(status=0).exists())
+
+    def test_workbook_is_written_after_the_allocation_commits(self):
+        make_captures(["A", "B"])
+        in_transaction = []
+
+        def write(output, receipts, details):
+            in_transaction.append(connection.in_atomic_block)
+            export_excel.write_workbook(output, receipts, details)
+
+        with mock.patch.dict(EXPORT_FORMATS, xlsx=(export_excel.XLSX_CONTENT_TYPE, write)):
+            self.client.post('/generate-asn-download/')
+        self.assertEqual(in_transaction, [False])
+
+    def test_consolidation_sums_repeated_scans_and_keeps_their_ids(self):
+        scans = [("A", "L1", "C1", "S1")] * 4 + [("A", "L1", "C2", "S1"), ("B", "L1", "C1", "S1")] * 2
+        captures = [
+            InventoryCapture.objects.create(owner=owner, location=location, case=case, sku=sku, uom="EA", quantity=2)
+            for owner, location, case, sku in scans
+        ]
+
+        response = self.client.post('/generate-asn-download/?consolidate=1')
+        details = list(load_workbook(BytesIO(b''.join(response.streaming_content)))['Detail'].iter_rows(
+            min_row=3, values_only=True
+        ))
+        self.assertEqual(
+            [(response['X-Capture-Count'], response['X-Line-Count'], response['X-Line-Reduction'])],
+            [("8", "3", "0.625")]
+        )
+        self.assertEqual(len(details), 3)
+        self.assertEqual(
+            list(DownloadInventory.objects.order_by('pk').values_list('owner', 'case', 'quantity')),
+            [("A", "C1", 8), ("A", "C2", 4), ("B", "C1", 4)]
+        )
+
+        first_line = DownloadInventory.objects.order_by('pk').first()
+        self.assertEqual(
+            sorted(AsnLineSource.objects.filter(
+                asn_number=first_line.asn_number, line_number=first_line.line_number
+            ).values_list('capture_id', flat=True)),
+            [capture.pk for capture in captures[:4]]
+        )
+        self.assertEqual(AsnLineSource.objects.count(), len(captures))
+        self.assertFalse(InventoryCapture.objects.filter(status=0).exists())
+
+    def test_owner_packing_fills_whole_asns(self):
+        make_captures(["A", "B"] * 6)
+        response = self.client.post('/generate-asn-download/?pack=owner')
+        self.assertEqual((response['X-Asn-Count'], response['X-Asn-Fill-Ratio']), ("4", "1.0"))
+        self.assertEqual(
+            list(DownloadInventory.objects.order_by('pk').values_list('owner', 'line_number')),
+            [("A", f"{i:05d}") for i in (1, 2, 3)] * 2 + [("B", f"{i:05d}") for i in (1, 2, 3)] * 2
+        )
+
+        make_captures(["A", "B"] * 3)
+        response = self.client.post('/generate-asn-download/?pack=none')
+        self.assertEqual((response['X-Asn-Count'], response['X-Asn-Fill-Ratio']), ("6", "0.3333"))
+
+        make_captures(["A"])
+        with self.assertNoLogs('Inventoryapp.views', level='ERROR'):
+            response = self.client.post('/generate-asn-download/?pack=sku')
+        self.assertContains(response, "ASN packing must be one of", status_code=400)
+        self.assertEqual(InventoryCapture.objects.filter(status=0).count(), 1)
+
+    @override_settings(EXCEL_EXPORT_INCREMENTAL=True, EXPORT_WATERMARK_LAG=0)
+    def test_incremental_mode_leaves_generated_lines_for_the_next_run(self):
+        make_captures(["A", "A", "B"])
+        generated = [row[2:] for row in self.generate()['Detail'].iter_rows(min_row=3, values_only=True)]
+        self.assertEqual(set(DownloadInventory.objects.values_list('download_status', flat=True)), {'no'})
+
+        with tempfile.TemporaryDirectory() as run_dir, override_settings(EXPORT_RUN_DIR=run_dir):
+            response = self.client.get('/download_excel/')
+            workbook = load_workbook(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual([row[2:] for row in workbook['Detail'].iter_rows(min_row=3, values_only=True)], generated)
+        self.assertEqual(ExportRun.objects.get().row_count, 3)
+
+    def test_generates_straight_into_the_requested_format(self):
+        make_captures(["A", "A", "B"])
+        response = self.client.post('/generate-asn-download/?format=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(
+            [list(record.values()) for record in records],
+            [list(row) for row in DownloadInventory.objects.order_by('pk').values_list(*export_excel.DETAIL_FIELDS)]
+        )
+
+        make_captures(["A"])
+        with self.assertNoLogs('Inventoryapp.views', level='ERROR'):
+            response = self.client.post('/generate-asn-download/?format=xls')
+        self.assertContains(response, "format must be one of", status_code=400)
+        self.assertEqual(InventoryCapture.objects.filter(status=0).count(), 1)
+
+
+class ExportFormatTests(TestCase):
+    def export(self, export_format):
+        response = self.client.get('/download_excel/', {'format': export_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Disposition'].endswith(f'.{export_format}"'))
+        return b''.join(response.streaming_content)
+
+    def expected_rows(self):
+        return [list(row) for row in DownloadInventory.objects.order_by('pk').values_list(*export_excel.DETAIL_FIELDS)]
+
+    def test_csv_has_the_detail_columns(self):
+        make_download_lines(3)
+        rows = list(csv.reader(self.export('csv').decode().splitlines()))
+        self.assertEqual(rows[0], FLAT_COLUMNS)
+        self.assertEqual(rows[1], ['ASN0000001', 'SKU0', 'A', '00001', '1', 'EA', 'C0', 'LOC0'])
+        self.assertEqual(len(rows), 4)
+        self.assertFalse(DownloadInventory.objects.filter(download_status='no').exists())
+
+    def test_ndjson_has_one_record_per_line(self):
+        make_download_lines(3)
+        records = [json.loads(line) for line in self.export('ndjson').splitlines()]
+        self.assertEqual(list(records[0]), FLAT_COLUMNS)
+        self.assertEqual([list(record.values()) for record in records], self.expected_rows())
+
+    def test_parquet_keeps_quantity_numeric(self):
+        make_download_lines(5)
+        with mock.patch.object(export_formats, 'PARQUET_ROW_GROUP_SIZE', 2):
+            table = pq.read_table(BytesIO(self.export('parquet')))
+        self.assertEqual(table.column_names, FLAT_COLUMNS)
+        self.assertEqual(str(table.schema.field('QTYEXPECTED').type), 'int64')
+        self.assertEqual([list(row.values()) for row in table.to_pylist()], self.expected_rows())
+
+    def test_unknown_format_exports_nothing(self):
+        make_download_lines(1)
+        with self.assertNoLogs('Inventoryapp.views', level='ERROR'):
+            response = self.client.get('/download_excel/', {'format': 'xls'})
+        self.assertContains(response, "format must be one of", status_code=400)
+        self.assertTrue(DownloadInventory.objects.filter(download_status='no').exists())
+
+
+@override_settings(EXPORT_WATERMARK_LAG=0)
+class IncrementalExportTests(TestCase):
+    def setUp(self):
+        self.run_dir = tempfile.TemporaryDirectory()
+        self.enterContext(override_settings(EXPORT_RUN_DIR=self.run_dir.name))
+        self.addCleanup(self.run_dir.cleanup)
+        User.objects.create_user(username="tester", password="secret")
+        self.client.login(username="tester", password="secret")
+
+    def export(self):
+        response = self.client.get('/download_excel/', {'mode': 'incremental'})
+        if response.status_code != 200:
+            return None, None
+        return response['X-Export-Run'], b''.join(response.streaming_content)
+
+    def detail_skus(self, content):
+        return [row[3] for row in load_workbook(BytesIO(content))['Detail'].iter_rows(min_row=3, values_only=True)]
+
+    def test_each_run_exports_only_rows_above_the_watermark(self):
+        make_download_lines(4)
+        DownloadInventory.objects.filter(sku="SKU1").update(export_batch="pipeline", download_status='yes')
+
+        with CaptureQueriesContext(connection) as queries:
+            first_run, content = self.export()
+        self.assertEqual(self.detail_skus(content), ["SKU0", "SKU2", "SKU3"])
+        self.assertFalse(any(sql.startswith('UPDATE "DOWNLOADINVENTORY"') for sql in
+                             (query['sql'] for query in queries.captured_queries)))
+        self.assertEqual(DownloadInventory.objects.filter(download_status='no').count(), 3)
+
+        self.assertEqual(self.export(), (None, None))
+        make_download_lines(6)
+        second_run, content = self.export()
+        self.assertEqual(self.detail_skus(content), ["SKU0", "SKU1", "SKU2", "SKU3", "SKU4", "SKU5"])
+        run = ExportRun.objects.get(pk=second_run)
+        self.assertEqual((run.first_id, run.row_count), (ExportRun.objects.get(pk=first_run).last_id + 1, 6))
+
+    def test_rows_newer_than_the_lag_wait_for_the_next_run(self):
+        make_download_lines(2)
+        DownloadInventory.objects.update(updated_datetime=timezone.now())
+        with override_settings(EXPORT_WATERMARK_LAG=3600):
+            self.assertEqual(self.export(), (None, None))
+        self.assertEqual(len(self.detail_skus(self.export()[1])), 2)
+
+    def test_runs_are_re_downloaded_without_touching_inventory(self):
+        make_download_lines(3)
+        run_id, content = self.export()
+        DownloadInventory.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/exports/runs/{run_id}/download/')
+        self.assertEqual(b''.join(response.streaming_content), content)
+        self.assertFalse(any('DOWNLOADINVENTORY' in query['sql'] for query in queries.captured_queries))
+
+        runs = self.client.get('/exports/runs/').json()['runs']
+        self.assertEqual([(run['id'], run['row_count']) for run in runs], [(int(run_id), 3)])
+        self.assertEqual(self.client.get('/exports/runs/999/download/').status_code, 404)
+
+    def test_ranges_with_nothing_to_export_are_not_recorded(self):
+        make_download_lines(2)
+        DownloadInventory.objects.update(download_status='yes')
+        self.assertEqual(self.export(), (None, None))
+        self.assertFalse(ExportRun.objects.exists())
+
+        make_download_lines(1)
+        run_id, content = self.export()
+        self.assertEqual(self.detail_skus(content), ["SKU0"])
+        self.assertEqual(ExportRun.objects.get(pk=run_id).first_id, DownloadInventory.objects.order_by('pk')[0].pk)
+
+    def test_flat_formats_are_exported_as_runs(self):
+        make_download_lines(3)
+        response = self.client.get('/download_excel/', {'mode': 'incremental', 'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 4)
+        self.assertEqual(DownloadInventory.objects.filter(download_status='no').count(), 3)
+        run_id = response['X-Export-Run']
+        self.assertEqual(ExportRun.objects.get(pk=run_id).row_count, 3)
+        self.assertEqual(self.export(), (None, None))
+
+        response = self.client.get(f'/exports/runs/{run_id}/download/', {'format': 'ndjson'})
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 3)
+        self.assertEqual(self.client.get(f'/exports/runs/{run_id}/download/', {'format': 'xls'}).status_code, 400)
+
+    def test_runs_need_a_login(self):
+        make_download_lines(1)
+        run_id, _ = self.export()
+        self.client.logout()
+        self.assertEqual(self.client.get('/exports/runs/').status_code, 401)
+        self.assertEqual(self.client.get(f'/exports/runs/{run_id}/download/').status_code, 401)
+
+    def test_missing_run_file_is_rebuilt_from_its_id_range(self):
+        make_download_lines(3)
+        run_id, content = self.export()
+        run = ExportRun.objects.get(pk=run_id)
+        os.remove(os.path.join(self.run_dir.name, run.artifact))
+        response = self.client.get(f'/exports/runs/{run_id}/download/')
+        self.assertEqual(self.detail_skus(b''.join(response.streaming_content)), ["SKU0", "SKU1", "SKU2"])
+
+
+class ExportCacheTests(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.enterContext(override_settings(EXPORT_CACHE_DIR=self.cache_dir.name))
+        self.addCleanup(self.cache_dir.cleanup)
+        User.objects.create_user(username="tester", password="secret")
+        self.client.login(username="tester", password="secret")
+
+    def export(self, **params):
+        response = self.client.get('/download_excel/', params)
+        return response['X-Export-Batch'], response.getvalue()
+
+    def redownload(self, batch, **params):
+        return self.client.get(f'/exports/batches/{batch}/download/', params).getvalue()
+
+    def test_batches_are_re_downloaded_without_reading_inventory(self):
+        make_download_lines(3)
+        batch, content = self.export(mode='stream')
+        make_download_lines(2)
+        csv_batch, csv_content = self.export(format='csv')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.redownload(batch), content)
+            self.assertEqual(self.redownload(csv_batch, format='csv'), csv_content)
+        self.assertFalse(any('DOWNLOADINVENTORY' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(self.client.get('/exports/batches/0123abcd/download/').status_code, 404)
+        self.assertEqual(self.client.get('/exports/batches/run..1/download/').status_code, 400)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(f'/exports/batches/{batch}/download/').status_code, 401)
+
+    def test_cache_failures_never_fail_a_claimed_export(self):
+        make_download_lines(3)
+        with mock.patch('Inventoryapp.export_cache.os.replace', side_effect=OSError("No space left")), \
+                self.assertLogs('Inventoryapp.export_cache', level='ERROR'):
+            batch, content = self.export(mode='stream')
+            self.assertEqual(self.detail_rows(content), self.expected_rows())
+            self.assertEqual(os.listdir(export_cache.cache_dir('tmp')), [])
+
+            DownloadInventory.objects.update(download_status='no', export_batch=None)
+            batch, content = self.export()
+            self.assertEqual(self.detail_rows(content), self.expected_rows())
+
+        DownloadInventory.objects.update(download_status='no', export_batch=None)
+        with mock.patch.object(export_cache, 'link', side_effect=OSError("Permission denied")), \
+                self.assertLogs('Inventoryapp.export_cache', level='ERROR'):
+            batch, content = self.export(format='csv')
+        self.assertEqual(len(content.splitlines()), 4)
+        self.assertEqual(DownloadInventory.objects.filter(export_batch=batch, download_status='yes').count(), 3)
+
+    def test_eviction_errors_are_only_logged(self):
+        make_download_lines(2)
+        with mock.patch.object(export_cache, 'evict', side_effect=RuntimeError("gone")), \
+                self.assertLogs('Inventoryapp.export_cache', level='ERROR'):
+            batch, content = self.export(mode='stream')
+        self.assertEqual(self.redownload(batch), content)
+
+    def test_exports_that_fail_after_the_claim_release_their_rows(self):
+        make_download_lines(3)
+        with mock.patch.object(export_cache, 'publish_and_open', side_effect=RuntimeError("gone")):
+            for params in ({'mode': 'stream'}, {'format': 'csv'}):
+                response = self.client.get('/download_excel/', params)
+                self.assertEqual(response.status_code, 302)
+                self.assertEqual(DownloadInventory.objects.filter(download_status='no', export_batch=None).count(), 3)
+
+    def test_evicted_batch_is_rendered_again_only_for_new_content(self):
+        make_download_lines(3)
+        batch, _ = self.export()
+        render = mock.Mock(wraps=export_excel.write_workbook)
+        with mock.patch.dict(EXPORT_FORMATS, xlsx=(export_excel.XLSX_CONTENT_TYPE, render)):
+            os.remove(export_cache.ref_path(batch, 'xlsx'))
+            self.assertEqual(self.detail_rows(self.redownload(batch)), self.expected_rows())
+            self.assertEqual(render.call_count, 0)
+
+            export_cache.evict(max_bytes=0)
+            self.assertEqual(os.listdir(export_cache.cache_dir('objects')), [])
+            self.assertEqual(self.detail_rows(self.redownload(batch)), self.expected_rows())
+            self.assertEqual(render.call_count, 1)
+
+    def detail_rows(self, content):
+        return [list(row[2:]) for row in load_workbook(BytesIO(content))['Detail'].iter_rows(min_row=3, values_only=True)]
+
+    def expected_rows(self):
+        return [list(row) for row in DownloadInventory.objects.order_by('pk').values_list(*export_excel.DETAIL_FIELDS)]
+
+    def test_eviction_drops_stale_then_least_recently_used_entries(self):
+        now = time.time()
+        for key, age in (("old", 3600), ("used", 120), ("new", 60)):
+            output = export_cache.render_file()
+            output.write(b"x" * 100)
+            export_cache.publish(key, 'csv', key * 8, output)
+            os.utime(export_cache.ref_path(key, 'csv'), (now - age, now - age))
+
+        export_cache.evict(max_age=1800)
+        self.assertIsNone(export_cache.lookup("old", 'csv'))
+        self.assertIsNotNone(export_cache.lookup("used", 'csv'))
+
+        export_cache.evict(max_bytes=100)
+        self.assertEqual(
+            [export_cache.lookup(key, 'csv') is not None for key in ("used", "new")], [True, False]
+        )
+        self.assertEqual(len(os.listdir(export_cache.cache_dir('objects'))), 1)
+
+
+class AsyncExportViewTests(TestCase):
+    async def read(self, response):
+        self.assertTrue(response.is_async)
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    async def test_streams_the_workbook_asynchronously_under_asgi(self):
+        await sync_to_async(make_download_lines)(3)
+        with self.assertLogs('Inventoryapp.requests') as logs:
+            response = await self.async_client.get('/download_excel/', {'mode': 'stream'})
+            workbook = load_workbook(BytesIO(await self.read(response)))
+        self.assertEqual(workbook['Detail'].max_row, 5)
+        self.assertGreater(json.loads(logs.records[-1].getMessage())['queries'], 0)
+
+    async def test_streams_ndjson_asynchronously_under_asgi(self):
+        await sync_to_async(make_download_lines)(5)
+        with override_settings(DOWNLOAD_INVENTORY_CHUNK_SIZE=2):
+            response = await self.async_client.get('/download-inventory/', {'format': 'ndjson', 'owner': 'A'})
+            lines = (await self.read(response)).decode().splitlines()
+        self.assertEqual([json.loads(line)['case'] for line in lines], ['C0', 'C2', 'C4'])
+
+    @override_settings(EXPORT_CONCURRENCY=1)
+    async def test_exports_wait_for_a_free_slot(self):
+        calls = []
+        task = None
+        async with views.export_slots():
+            task = asyncio.ensure_future(views.run_export(calls.append, "request"))
+            await asyncio.sleep(0.05)
+            self.assertEqual(calls, [])
+        await task
+        self.assertEqual(calls, ["request"])
+
+    @override_settings(EXPORT_CONCURRENCY=1)
+    def test_limit_holds_when_every_request_has_its_own_loop(self):
+        running = []
+        overlaps = []
+
+        def export(request):
+            running.append(request)
+            overlaps.append(len(running))
+            time.sleep(0.05)
+            running.remove(request)
+
+        # As under WSGI: each request runs its async view on a loop of its own
+        threads = [
+            threading.Thread(target=async_to_sync(views.run_export), args=(export, i)) for i in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(overlaps, [1] * 4)
+
+
+class CaptureBatchTests(TestCase):
+    def setUp(self):
+        User.objects.create_user(username="scanner", password="secret")
+        self.client.login(username="scanner", password="secret")
+
+    def post(self, payload):
+        return self.client.post('/api/captures/', json.dumps(payload), content_type='application/json')
+
+    def line(self, key, **fields):
+        return {"key": key, "location": "L1", "sku": "S1", "uom": "EA", "quantity": 2, **fields}
+
+    def test_inserts_batch_and_reports_each_line(self):
+        response = self.post({"owner": "A", "lines": [
+            self.line("k1"), self.line("k2", owner="B"), self.line("k3", quantity="x"), self.line("k1"),
+        ]})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([r["status"] for r in body["results"]], ["created", "created", "invalid", "duplicate"])
+        self.assertEqual(body["results"][2]["errors"], {"quantity": "Please enter a valid quantity number"})
+        self.assertEqual(body["results"][3]["id"], body["results"][0]["id"])
+        self.assertEqual((body["created"], body["duplicate"], body["invalid"]), (2, 1, 1))
+        self.assertEqual(
+            list(InventoryCapture.objects.order_by('pk').values_list('owner', 'username', 'status')),
+            [("A", "scanner", 0), ("B", "scanner", 0)]
+        )
+
+    def test_replayed_batch_creates_no_duplicates(self):
+        lines = [self.line(f"k{i}") for i in range(20)]
+        self.post({"owner": "A", "lines": lines[:12]})
+        body = self.post({"owner": "A", "lines": lines}).json()
+        self.assertEqual((body["created"], body["duplicate"]), (8, 12))
+        self.assertEqual(InventoryCapture.objects.count(), 20)
+
+    def test_batch_is_written_in_fixed_number_of_queries(self):
+        master_cache.get()
+        # Existing keys, savepoint, insert, rollup upsert, release, ids
+        with self.assertNumQueries(6):
+            save_capture_batch([self.line(f"k{i}") for i in range(30)], "scanner", default_owner="A")
+
+    def test_reports_values_too_large_for_their_columns_as_invalid(self):
+        body = self.post({"owner": "A", "lines": [
+            self.line("k1", sku="S" * 101), self.line("k2", uom="U" * 21), self.line("k3", case="C" * 101),
+            self.line("k4", quantity=2147483648), self.line("k5", owner="O" * 101), self.line("k6"),
+        ]}).json()
+        self.assertEqual(
+            [(r["status"], list(r.get("errors", {}))) for r in body["results"]],
+            [("invalid", ["sku"]), ("invalid", ["uom"]), ("invalid", ["case"]),
+             ("invalid", ["quantity"]), ("invalid", ["owner"]), ("created", [])]
+        )
+        self.assertEqual(body["results"][1]["errors"]["uom"], "uom must be at most 20 characters")
+        self.assertEqual(InventoryCapture.objects.count(), 1)
+
+    def test_posts_need_the_csrf_token_handed_out_on_get(self):
+        client = Client(enforce_csrf_checks=True)
+        self.assertEqual(client.get('/api/captures/').status_code, 401)
+        client.login(username="scanner", password="secret")
+        body = json.dumps({"owner": "A", "lines": [self.line("k1")]})
+        self.assertEqual(client.post('/api/captures/', body, content_type='application/json').status_code, 403)
+
+        token = client.get('/api/captures/').json()["csrftoken"]
+        response = client.post('/api/captures/', body, content_type='application/json', HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.json()["created"], 1)
+
+    def test_rejects_bad_payloads(self):
+        self.assertEqual(self.post({"lines": []}).status_code, 400)
+        self.assertEqual(
+            self.client.post('/api/captures/', 'nope', content_type='application/json').status_code, 400
+        )
+        with override_settings(CAPTURE_BATCH_MAX_LINES=2):
+            self.assertEqual(self.post({"lines": [self.line("a")] * 3}).status_code, 400)
+
+
+class MasterValidationTests(TestCase):
+    def setUp(self):
+        master_cache.invalidate()
+        self.addCleanup(master_cache.invalidate)
+
+    def import_csv(self, kind, text):
+        return import_master(kind, BytesIO(text.encode()), f"{kind}.csv")
+
+    def load_masters(self):
+        self.import_csv('owner', "OWNER,DESCRIPTION\nA,Owner A\nB,Owner B\n")
+        self.import_csv('sku', "owner,sku\nA,SKU1\nB,SKU2\n")
+        self.import_csv('location', "LOCATION,DESCRIPTION\nL1,\nL2,Bay 2\n ,blank\n")
+        self.import_csv('uom', "UOM\nEA\nCS\n")
+
+    def test_empty_masters_accept_anything(self):
+        self.assertEqual(validate_capture("X", "L9", "S9", "BOX"), {})
+
+    def test_validates_every_field_without_queries_once_warm(self):
+        self.load_masters()
+        self.assertEqual(LocationMaster.objects.count(), 2)
+        master_cache.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(validate_capture("A", "L1", "SKU1", "EA"), {})
+            errors = validate_capture("A", "L9", "SKU2", "BOX")
+        self.assertEqual(sorted(errors), ['location', 'sku', 'uom'])
+
+    def test_import_updates_descriptions_and_refreshes_the_cache(self):
+        self.load_masters()
+        self.assertIn('sku', validate_capture("A", "L1", "SKU3", "EA"))
+
+        frame = pd.DataFrame({'OWNER': ['A', 'A'], 'SKU': ['SKU1', 'SKU3'], 'DESCRIPTION': ['Widget', 'Gadget']})
+        workbook = BytesIO()
+        frame.to_excel(workbook, index=False)
+        workbook.seek(0)
+        self.assertEqual(import_master('sku', workbook, "skus.xlsx"), 2)
+
+        self.assertEqual(validate_capture("A", "L1", "SKU3", "EA"), {})
+        self.assertEqual(SkuMaster.objects.count(), 3)
+        self.assertEqual(SkuMaster.objects.get(owner="A", sku="SKU1").description, "Widget")
+
+    def test_imports_in_another_process_refresh_this_copy(self):
+        self.load_masters()
+        # A copy held by another worker process, sharing only the version stamp
+        worker_copy = MasterCache()
+        self.assertNotIn('PAL', worker_copy.get()['uom'])
+        with self.assertNumQueries(0):
+            worker_copy.get()
+
+        self.import_csv('uom', "UOM\nPAL\n")
+        self.assertIn('PAL', worker_copy.get()['uom'])
+
+    def test_import_rejects_files_without_key_columns(self):
+        with self.assertRaises(ValueError):
+            self.import_csv('sku', "SKU\nSKU1\n")
+
+    def test_captures_off_the_masters_are_rejected(self):
+        self.load_masters()
+        User.objects.create_user(username="scanner", password="secret")
+        self.client.login(username="scanner", password="secret")
+        self.client.post('/owner/', {'owner': 'A'})
+
+        response = self.client.post('/inventory/', {'location': 'L1', 'sku': 'SKU2', 'uom': 'EA', 'quantity': '1'})
+        self.assertContains(response, "Unknown SKU SKU2 for owner A")
+        self.client.post('/inventory/', {'location': 'L1', 'sku': 'SKU1', 'uom': 'EA', 'quantity': '1'})
+        self.assertEqual(list(InventoryCapture.objects.values_list('sku', flat=True)), ['SKU1'])
+
+        results = save_capture_batch(
+            [{"key": "k1", "location": "L2", "sku": "SKU1", "uom": "CS", "quantity": 1},
+             {"key": "k2", "location": "L2", "sku": "SKU1", "uom": "PAL", "quantity": 1}],
+            "scanner", default_owner="A"
+        )
+        self.assertEqual([result['status'] for result in results], ['created', 'invalid'])
+        self.assertIn('uom', results[1]['errors'])
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), "set RUN_BENCHMARKS=1 to run benchmarks")
+class MasterValidationBenchmark(TestCase):
+    def test_validation_throughput(self):
+        master_cache.invalidate()
+        self.addCleanup(master_cache.invalidate)
+        OwnerMaster.objects.bulk_create([OwnerMaster(owner=f"OWNER{i}") for i in range(50)])
+        SkuMaster.objects.bulk_create([SkuMaster(owner=f"OWNER{i % 50}", sku=f"SKU{i}") for i in range(100000)])
+        LocationMaster.objects.bulk_create([LocationMaster(location=f"LOC{i}") for i in range(20000)])
+        UomMaster.objects.bulk_create([UomMaster(uom=uom) for uom in ("EA", "CS", "PL")])
+
+        started = time.perf_counter()
+        master_cache.get()
+        load = time.perf_counter() - started
+
+        count = 200000
+        started = time.perf_counter()
+        with self.assertNumQueries(0):
+            for i in range(count):
+                validate_capture(f"OWNER{i % 50}", f"LOC{i % 20000}", f"SKU{i % 100000}", "EA")
+        elapsed = time.perf_counter() - started
+        print(f"\nmaster load {load * 1000:.0f} ms; {count / elapsed:,.0f} validations/s "
+              f"({elapsed / count * 1e6:.2f} us each)")
+
+
+class DownloadInventoryJsonTests(TestCase):
+    def setUp(self):
+        make_download_lines(7)
+        DownloadInventory.objects.filter(pk__in=list(
+            DownloadInventory.objects.order_by('pk').values_list('pk', flat=True)[:2]
+        )).update(updated_datetime=datetime(2025, 1, 1, 8), download_status='yes')
+        DownloadInventory.objects.filter(updated_datetime__isnull=True).update(updated_datetime=datetime(2025, 1, 2, 8))
+
+    def test_pages_follow_the_keyset_cursor(self):
+        first = self.client.get('/download-inventory/', {'limit': 3}).json()
+        self.assertEqual(len(first['results']), 3)
+        second = self.client.get(first['next']).json()
+        third = self.client.get(second['next']).json()
+        self.assertIsNone(third['next'])
+        ids = [row['id'] for page in (first, second, third) for row in page['results']]
+        self.assertEqual(ids, list(DownloadInventory.objects.order_by('pk').values_list('pk', flat=True)))
+
+    def test_filters(self):
+        def fetch(**params):
+            return [row['case'] for row in self.client.get('/download-inventory/', params).json()['results']]
+
+        self.assertEqual(fetch(owner='B'), ['C1', 'C3', 'C5'])
+        self.assertEqual(fetch(asn_number='ASN0000002'), ['C2', 'C3'])
+        self.assertEqual(fetch(download_status='yes'), ['C0', 'C1'])
+        self.assertEqual(fetch(date_from='2025-01-02'), ['C2', 'C3', 'C4', 'C5', 'C6'])
+        self.assertEqual(fetch(date_to='2025-01-01'), ['C0', 'C1'])
+        self.assertEqual(self.client.get('/download-inventory/', {'date_to': 'soon'}).status_code, 400)
+
+    def test_ndjson_streams_every_matching_row(self):
+        response = self.client.get('/download-inventory/', {'format': 'ndjson', 'owner': 'A'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['case'] for row in rows], ['C0', 'C2', 'C4', 'C6'])
+        self.assertEqual(rows[0]['updated_datetime'], '2025-01-01T08:00:00')
+
+    def test_ndjson_reads_keyset_pages(self):
+        with override_settings(DOWNLOAD_INVENTORY_CHUNK_SIZE=3):
+            response = self.client.get('/download-inventory/', {'format': 'ndjson', 'owner': 'A'})
+            with CaptureQueriesContext(connection) as queries:
+                rows = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(rows), 4)
+        selects = [query['sql'] for query in queries.captured_queries if 'DOWNLOADINVENTORY' in query['sql']]
+        self.assertEqual(len(selects), 3)
+        self.assertTrue(all('LIMIT 3' in sql for sql in selects))
+
+
+@override_settings(LAST_LOGIN_FLUSH_INTERVAL=0)
+class LoginTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="scanner", password="secret")
+
+    def login(self):
+        return self.client.post('/', {'username': 'scanner', 'password': 'secret'})
+
+    def test_first_login_mirrors_the_auth_hash(self):
+        with mock.patch('django.contrib.auth.hashers.make_password') as make_password:
+            self.assertRedirects(self.login(), '/main/', fetch_redirect_response=False)
+        make_password.assert_not_called()
+        mirror = UserMaster.objects.get(username="scanner")
+        self.assertEqual(mirror.password, self.user.password)
+        self.assertIsNotNone(mirror.updated_datetime)
+
+    def test_repeat_login_only_bumps_last_login(self):
+        self.login()
+        UserMaster.objects.update(password="kept", created_date=datetime(2025, 1, 1), updated_datetime=datetime(2025, 1, 1))
+        self.login()
+        mirror = UserMaster.objects.get(username="scanner")
+        self.assertEqual((mirror.password, mirror.created_date), ("kept", datetime(2025, 1, 1)))
+        self.assertGreater(mirror.updated_datetime, datetime(2025, 1, 1))
+
+    def test_mirror_sync_is_one_upsert(self):
+        with self.assertNumQueries(1):
+            record_login(self.user)
+
+    def test_deferred_logins_are_coalesced(self):
+        other = User.objects.create_user(username="other", password="secret")
+        with override_settings(LAST_LOGIN_FLUSH_INTERVAL=60):
+            for user in (self.user, other, self.user):
+                record_login(user)
+            self.assertFalse(UserMaster.objects.exists())
+            with self.assertNumQueries(1):
+                self.assertEqual(flush_logins(), 2)
+        self.assertEqual(UserMaster.objects.count(), 2)
+
+    @override_settings(LAST_LOGIN_FLUSH_INTERVAL=60)
+    def test_queued_logins_are_flushed_by_one_timer(self):
+        with mock.patch('Inventoryapp.logins.threading.Timer') as timer:
+            record_login(self.user)
+            record_login(self.user)
+            timer.assert_called_once_with(60, logins.flush_on_timer)
+            logins.flush_queued()
+        self.assertTrue(UserMaster.objects.filter(username="scanner").exists())
+
+    @override_settings(LAST_LOGIN_FLUSH_INTERVAL=60)
+    def test_failed_flush_is_logged_and_retried(self):
+        with mock.patch('Inventoryapp.logins.threading.Timer') as timer:
+            record_login(self.user)
+            with mock.patch.object(UserMaster.objects, 'bulk_create', side_effect=DatabaseError("gone")), \
+                    self.assertLogs('Inventoryapp.logins', level='ERROR'):
+                logins.flush_queued()
+            self.assertEqual(timer.call_count, 2)
+            logins.flush_queued()
+        self.assertTrue(UserMaster.objects.filter(username="scanner").exists())
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), "set RUN_BENCHMARKS=1 to run benchmarks")
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginLoadTest(TransactionTestCase):
+    CONCURRENT_LOGINS = 200
+
+    def run_logins(self):
+        start = threading.Barrier(self.CONCURRENT_LOGINS)
+
+        def login(i):
+            client = Client()
+            start.wait()
+            started = time.perf_counter()
+            response = client.post('/', {'username': f"user{i}", 'password': 'secret'})
+            elapsed = time.perf_counter() - started
+            connections.close_all()
+            return response.status_code, elapsed
+
+        with ThreadPoolExecutor(self.CONCURRENT_LOGINS) as pool:
+            results = list(pool.map(login, range(self.CONCURRENT_LOGINS)))
+        self.assertTrue(all(status == 302 for status, _ in results))
+        latencies = sorted(elapsed for _, elapsed in results)
+        return latencies[int(len(latencies) * 0.95) - 1] * 1000
+
+    def test_p95_login_latency(self):
+        for i in range(self.CONCURRENT_LOGINS):
+            User.objects.create_user(username=f"user{i}", password="secret")
+
+        for interval in (0, 5):
+            with override_settings(LAST_LOGIN_FLUSH_INTERVAL=interval):
+                p95 = self.run_logins()
+                flush_logins()
+            print(f"\n{self.CONCURRENT_LOGINS} concurrent logins, flush interval {interval}s: p95 {p95:.1f} ms")
+        self.assertEqual(UserMaster.objects.count(), self.CONCURRENT_LOGINS)
+
+
+# Logins written at once, so no flush timer outlives the test
+@override_settings(LAST_LOGIN_FLUSH_INTERVAL=0)
+class LoadTestHarnessTests(LiveServerTestCase):
+    def test_scanners_capture_through_the_forms(self):
+        User.objects.create_user(username="loadtest", password="secret")
+        with self.assertLogs('Inventoryapp.requests'):
+            results = run_load_test(self.live_server_url, "loadtest", "secret", scanners=2, duration=1)
+        self.assertEqual(results['errors'], 0)
+        self.assertGreater(results['scan_latency']['count'], 0)
+        self.assertEqual(InventoryCapture.objects.filter(owner="LOADTEST").count(), results['scan_latency']['count'])
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-sessions'},
+})
+class SessionQueryTests(TestCase):
+    def scan_queries(self, engine):
+        with override_settings(SESSION_ENGINE=engine):
+            client = Client()
+            client.force_login(User.objects.get_or_create(username="scanner")[0])
+            client.post('/owner/', {'owner': 'A'})
+            client.post('/owner/', {'owner': 'A'})
+            with CaptureQueriesContext(connection) as queries:
+                response = client.post('/inventory/', {
+                    'location': 'L1', 'sku': 'S1', 'uom': 'EA', 'case': 'C1', 'quantity': '1'
+                })
+            self.assertRedirects(response, '/inventory/', fetch_redirect_response=False)
+        return [query['sql'] for query in queries.captured_queries]
+
+    def test_cached_sessions_skip_the_session_table_on_scans(self):
+        db_queries = self.scan_queries('django.contrib.sessions.backends.db')
+        cached_queries = self.scan_queries('django.contrib.sessions.backends.cached_db')
+        self.assertTrue(any('django_session' in sql for sql in db_queries))
+        self.assertFalse(any('django_session' in sql for sql in cached_queries))
+        self.assertLess(len(cached_queries), len(db_queries))
+
+
+class ScannerPageTests(TestCase):
+    JSON = {'HTTP_ACCEPT': 'application/json'}
+
+    def setUp(self):
+        master_cache.invalidate()
+        self.addCleanup(master_cache.invalidate)
+        self.client.force_login(User.objects.create_user(username="scanner"))
+        self.client.post('/owner/', {'owner': 'A'})
+
+    def test_page_uses_only_local_assets(self):
+        response = self.client.get('/inventory/')
+        self.assertNotContains(response, "googleapis")
+        self.assertContains(response, "/static/image/S3%20main%20Logopreview.png")
+
+    def test_json_capture_replies_without_redirect(self):
+        response = self.client.post('/inventory/', {
+            'location': 'L1', 'sku': 'S1', 'uom': 'EA', 'case': 'C1', 'quantity': '2'
+        }, **self.JSON)
+        self.assertEqual(response.status_code, 201)
+        capture = InventoryCapture.objects.get()
+        self.assertEqual(response.json()['id'], capture.pk)
+        self.assertEqual((capture.owner, capture.quantity, capture.username), ('A', 2, 'scanner'))
+
+    def test_json_capture_reports_field_errors(self):
+        response = self.client.post('/inventory/', {'location': 'L1', 'sku': 'S1', 'uom': 'EA', 'quantity': 'x'},
+                                    **self.JSON)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()['errors']), ['quantity'])
+
+        UomMaster.objects.create(uom="CS")
+        response = self.client.post('/inventory/', {'location': 'L1', 'sku': 'S1', 'uom': 'EA', 'quantity': '1'},
+                                    **self.JSON)
+        self.assertEqual(list(response.json()['errors']), ['uom'])
+        self.assertFalse(InventoryCapture.objects.exists())
+
+    def test_json_capture_needs_login(self):
+        self.client.logout()
+        response = self.client.post('/inventory/', {'location': 'L1'}, **self.JSON)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['login'], '/')
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root, STORAGES={
+            "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+            "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+        }):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            with open(os.path.join(root, 'staticfiles.json'), encoding='utf-8') as f:
+                hashed = json.load(f)['paths']['css/style.css']
+            self.assertRegex(hashed, r'^css/style\.[0-9a-f]{12}\.css$')
+            self.assertTrue(os.path.exists(os.path.join(root, hashed + '.gz')))
+            self.assertTrue(os.path.exists(os.path.join(root, hashed + '.br')))
+
+
+class RollupTests(TransactionTestCase):
+    databases = {'default', 'sequences'}
+
+    def setUp(self):
+        master_cache.invalidate()
+        self.addCleanup(master_cache.invalidate)
+        self.user = User.objects.create_user(username="scanner")
+        self.client.force_login(self.user)
+        self.client.post('/owner/', {'owner': 'A'})
+
+    def scan(self, sku, quantity=1):
+        self.client.post('/inventory/', {'location': 'L1', 'sku': sku, 'uom': 'EA', 'quantity': str(quantity)})
+
+    def rollup_rows(self):
+        return (
+            sorted(CaptureRollup.objects.values_list(
+                'hour', 'owner', 'sku', 'username', 'lines', 'quantity', 'processed_lines', 'processed_quantity'
+            )),
+            sorted(AsnRollup.objects.values_list('hour', 'owner', 'username', 'status', 'asns', 'lines', 'quantity')),
+        )
+
+    def test_captures_and_asn_generation_update_the_rollups(self):
+        make_nextup(number_of_lines=2)
+        self.scan("S1", 2)
+        self.scan("S1", 3)
+        self.scan("S2")
+        save_capture_batch([
+            {"key": "k1", "owner": "B", "location": "L1", "sku": "S1", "uom": "EA", "quantity": 4},
+        ], "handheld")
+        self.assertEqual(
+            sorted(CaptureRollup.objects.values_list('owner', 'sku', 'username', 'lines', 'quantity')),
+            [('A', 'S1', 'scanner', 2, 5), ('A', 'S2', 'scanner', 1, 1), ('B', 'S1', 'handheld', 1, 4)]
+        )
+
+        generate_pending_asns("supervisor")
+        self.assertEqual(
+            sorted(CaptureRollup.objects.values_list('owner', 'sku', 'processed_lines', 'processed_quantity')),
+            [('A', 'S1', 2, 5), ('A', 'S2', 1, 1), ('B', 'S1', 1, 4)]
+        )
+        self.assertEqual(
+            sorted(AsnRollup.objects.values_list('owner', 'username', 'status', 'asns', 'lines', 'quantity')),
+            [('A', 'supervisor', 1, 2, 3, 6), ('B', 'supervisor', 1, 1, 1, 4)]
+        )
+
+        incremental = self.rollup_rows()
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup_rows(), incremental)
+
+    def test_allocation_rollups_are_written_after_the_allocation_commits(self):
+        make_nextup()
+        self.scan("S1")
+        calls = []
+
+        def record(records, lines):
+            calls.append((connection.in_atomic_block, DownloadInventory.objects.count()))
+
+        with mock.patch('Inventoryapp.utils.record_allocation', record):
+            generate_pending_asns("supervisor")
+        self.assertEqual(calls, [(False, 1)])
+
+    def test_report_reads_only_the_rollups(self):
+        make_nextup()
+        for sku in ("S1", "S2", "S1"):
+            self.scan(sku, 2)
+        generate_pending_asns("supervisor")
+        self.scan("S3")
+
+        with self.assertNumQueries(2):
+            report = rollup_report(datetime(2000, 1, 1), datetime(2100, 1, 1), ['owner', 'sku'])
+        self.assertEqual(
+            [(row['sku'], row['lines'], row['quantity'], row['pending_lines']) for row in report['captures']],
+            [('S1', 2, 4, 0), ('S2', 1, 2, 0), ('S3', 1, 1, 1)]
+        )
+        self.assertEqual([(row['owner'], row['asns'], row['lines']) for row in report['asns']], [('A', 1, 3)])
+
+        response = self.client.get('/reports/rollups/', {'group_by': 'username'})
+        self.assertEqual(response.json()['captures'][0]['lines'], 4)
+        self.assertEqual(self.client.get('/reports/rollups/', {'group_by': 'location'}).status_code, 400)
+        self.assertEqual(
+            self.client.get('/reports/rollups/', {'date': '2001-01-01'}).json()['captures'], []
+        )
+
+
+class RequestMetricsTests(TestCase):
+    def test_records_queries_and_flags_repeated_statements(self):
+        with self.assertLogs('Inventoryapp.requests', level='INFO') as logs:
+            self.client.get('/nextup/')
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((line['view'], line['status'], line['queries']), ('nextup-number', 200, 1))
+        self.assertGreater(line['response_bytes'], 0)
+
+        make_download_lines(3)
+        with override_settings(REQUEST_METRICS={'REPEATED_QUERY_LIMIT': 0}):
+            with self.assertLogs('Inventoryapp.requests', level='WARNING'):
+                self.client.get('/nextup/')
+
+    def test_prometheus_endpoint_reports_per_view_totals(self):
+        with self.assertLogs('Inventoryapp.requests'):
+            self.client.get('/nextup/')
+            body = self.client.get('/metrics/').content.decode()
+        self.assertIn('# TYPE inventory_view_queries_total counter', body)
+        self.assertRegex(body, r'inventory_view_requests_total\{view="nextup-number"\} \d+')
+        self.assertIn('inventory_connections_opened_total', body)
+
+
+class BenchmarkSuiteTests(TransactionTestCase):
+    databases = {'default', 'sequences'}
+
+    def test_cases_record_throughput_and_queries(self):
+        results = []
+        client = benchmarks.scanner_client()
+        benchmarks.bench_scans(results, client, 3)
+        benchmarks.bench_size(results, client, 20)
+
+        self.assertEqual(
+            [(item['name'], item['rows']) for item in results],
+            [('scan', 3), ('generate_asns', 20), ('export', 20), ('export_stream', 20), ('redownload', 20),
+             ('export_csv', 20), ('export_ndjson', 20), ('export_parquet', 20), ('generate_and_download', 20)]
+        )
+        self.assertTrue(all(
+            item['queries'] > 0 and item['rows_per_sec'] for item in results if item['name'] != 'redownload'
+        ))
+        self.assertTrue(all(item['bytes'] > 0 for item in results if 'bytes' in item))
+        # Only the login's user lookup
+        self.assertEqual(results[4]['queries'], 1)
+        self.assertEqual(results[4]['bytes'], results[3]['bytes'])
+        self.assertFalse(InventoryCapture.objects.exists())
+
+    def test_compare_flags_slower_or_chattier_cases(self):
+        baseline = {"results": [
+            {"name": "export", "rows": 100, "rows_per_sec": 1000.0, "queries": 6},
+            {"name": "scan", "rows": 10, "rows_per_sec": 100.0, "queries": 20},
+        ]}
+        report = {"results": [
+            {"name": "export", "rows": 100, "rows_per_sec": 900.0, "queries": 6},
+            {"name": "scan", "rows": 10, "rows_per_sec": 100.0, "queries": 30},
+            {"name": "export", "rows": 1000, "rows_per_sec": 10.0, "queries": 6},
+        ]}
+        rows, regressions = benchmarks.compare(report, baseline, tolerance=0.25)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual([row['name'] for row in regressions], ['scan'])
+
+        _, regressions = benchmarks.compare(report, baseline, tolerance=0.05)
+        self.assertEqual([row['name'] for row in regressions], ['export', 'scan'])
@@ -1,92 +1,316 @@
-from .models import DownloadInventory, NextupNumber 
+from .models import (
+    AsnLineSource, DownloadInventory, InventoryCapture,
+    LINE_NUMBER_WIDTH, STATUS_NEW, STATUS_PENDING, STATUS_PROCESSED
+)
+from .masters import validate_capture
+from .rollups import record_allocation, record_captures
+from .sequences import SequenceExhausted, get_sequence
+from django.conf import settings
 from django.db import transaction, DatabaseError
 from django.utils import timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AsnGenerationError(Exception):
+    pass
+
+
+# Works out (ASN offset, line number) for each record: a new ASN starts when
+# the owner changes or NUMBEROFLINES is reached. Offset 0 is the first ASN.
+def plan_asn_lines(records, max_lines):
+    if max_lines < 1:
+        raise ValueError("NUMBEROFLINES must be at least 1")
+
+    asn_offset = 0
+    last_owner = None
+    last_line_number = 0
+    plan = []
+    for record in records:
+        if last_line_number and (last_owner != record.owner or last_line_number >= max_lines):
+            asn_offset += 1
+            last_line_number = 0
+
+        last_line_number += 1
+        last_owner = record.owner
+        plan.append((asn_offset, last_line_number))
+    return plan
+
+
+def build_inventory_lines(records, plan, asn_numbers, status, username, **fields):
+    now = timezone.now().replace(microsecond=0)
+    return [
+        DownloadInventory(
+            owner=record.owner,
+            location=record.location,
+            case=record.case,
+            sku=record.sku,
+            uom=record.uom,
+            quantity=record.quantity,
+            asn_number=asn_numbers[asn_offset],
+            line_number=f"{line_number:0{LINE_NUMBER_WIDTH}d}",
+            status=status,
+            updated_username=username,
+            updated_datetime=now,
+            **fields
+        )
+        for record, (asn_offset, line_number) in zip(records, plan)
+    ]
+
+
+# Captures that consolidate into one ASN line share all of these values
+CONSOLIDATION_KEY = ('owner', 'location', 'case', 'sku', 'uom')
+
+
+class CaptureGroup:
+    """Pending captures sharing CONSOLIDATION_KEY, allocated as one ASN line."""
+
+    def __init__(self, owner, location, case, sku, uom):
+        self.owner = owner
+        self.location = location
+        self.case = case
+        self.sku = sku
+        self.uom = uom
+        self.quantity = 0
+        self.source_ids = []
+
+
+# Sums capture records by CONSOLIDATION_KEY in one pass over the batch.
+# Groups keep the order of their first capture, so owners change at the same
+# points as they would line by line.
+def consolidate_captures(records):
+    groups = {}
+    for record in records:
+        key = tuple(getattr(record, field) for field in CONSOLIDATION_KEY)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = CaptureGroup(*key)
+        group.quantity += record.quantity
+        group.source_ids.append(record.pk)
+    return list(groups.values())
+
+
+# Sort keys of the ASN packing modes (see pack_captures)
+PACKING_MODES = {
+    '': (),
+    'owner': ('owner',),
+    'owner_location': ('owner', 'location'),
+}
+
+
+# Raises ValueError unless ``mode`` names one of PACKING_MODES
+def check_packing(mode):
+    if mode not in PACKING_MODES:
+        raise ValueError(f"ASN packing must be one of: {', '.join(repr(name) for name in PACKING_MODES)}")
+
+
+# Orders captures (or capture groups) so every owner's lines are contiguous.
+# A new ASN starts only when the owner changes or NUMBEROFLINES is reached, so
+# each owner then fills ceil(lines / NUMBEROFLINES) ASNs, the fewest possible.
+# The sort is stable: within a group, lines keep their capture order.
+def pack_captures(units, mode):
+    check_packing(mode)
+    fields = PACKING_MODES[mode]
+    if not fields:
+        return units
+    return sorted(units, key=lambda unit: tuple(getattr(unit, field) for field in fields))
+
+
+# Capture, line and ASN counts of allocated lines, the share of lines that
+# consolidation saved (0.0 line by line) and, given NUMBEROFLINES, how full
+# the ASNs are on average (1.0 when every ASN has all its lines)
+def allocation_summary(lines, max_lines=None):
+    captures = sum(len(line.source_ids) for line in lines)
+    asns = len({line.asn_number for line in lines})
+    summary = {
+        "captures": captures,
+        "lines": len(lines),
+        "asns": asns,
+        "reduction_ratio": round(1 - len(lines) / captures, 4) if captures else 0.0,
+    }
+    if max_lines:
+        summary["fill_ratio"] = round(len(lines) / (asns * max_lines), 4) if asns else 0.0
+    return summary
+
+
+# Allocates ASN lines for every new capture record and marks the captures
+# processed. Returns the created DownloadInventory lines ([] when there was
+# nothing to do); ``line_fields`` are set on every line before it is inserted,
+# and each line's ``source_ids`` lists the capture ids it was built from.
+#
+# With ``consolidate`` (default: ASN_CONSOLIDATE_CAPTURES) captures sharing
+# CONSOLIDATION_KEY become one line carrying their summed quantity, and the
+# capture -> line mapping is written to ASNLINESOURCE. ``packing`` (default:
+# ASN_PACKING) orders the lines by owner first, see pack_captures.
+#
+# The ASN numbers are reserved from the sequence first (its own autocommit
+# statement, see sequences.py); then one short transaction inserts the lines
+# and claims the captures with a single UPDATE. The reporting rollups are
+# added once it commits, in a transaction of their own, so the current hour's
+# rollup rows that every scan upserts are never locked by the allocation.
+# Callers do any slow work with the lines (such as writing an export file)
+# after it has committed, so scanners never wait on its locks.
+def allocate_pending_asns(username, batch_size=1000, consolidate=None, packing=None, **line_fields):
+    if consolidate is None:
+        consolidate = getattr(settings, 'ASN_CONSOLIDATE_CAPTURES', False)
+    if packing is None:
+        packing = getattr(settings, 'ASN_PACKING', '')
+
+    records = list(InventoryCapture.objects.filter(status=STATUS_NEW).order_by('pk'))
+    if not records:
+        return []
+    units = pack_captures(consolidate_captures(records) if consolidate else records, packing)
 
-def add_inventory(owner, location, case, sku, uom, record_count, quantity, status, username, is_export=False):
     try:
-        with transaction.atomic():
-            nextup = NextupNumber.objects.first()
-            if not nextup:
-                prefix = "ASN"
-                nextup = NextupNumber.objects.create(
-                    Starting_Number=f"{prefix}0000001",
-                    Ending_Number=f"{prefix}9999999",
-                    Current_Number=f"{prefix}0000001",
-                    Next_Number=f"{prefix}0000002",
-                    prefix=prefix,
-                    NUMBEROFLINES=3,
-                    created_username=username,
-                    updated_username=username,
-                    type="ASN"
-                )
-
-            prefix = nextup.prefix or ""
-            current_number = int(''.join(filter(str.isdigit, nextup.Current_Number)))
-            current_prefix = nextup.Current_Number[:len(prefix)]
-
-            if current_prefix != prefix:
-                current_number += 1
-                nextup.Current_Number = f"{prefix}{current_number:07d}"
-                nextup.Next_Number = f"{prefix}{current_number + 1:07d}"
-
-            last_asn_num = current_number
-            MAX_RECORDS_PER_ASN = nextup.NUMBEROFLINES
-            total_records = record_count
-
-            last_asn_obj = DownloadInventory.objects.filter(
-                asn_number=f"{prefix}{last_asn_num:07d}"
-            ).order_by('-line_number').first()
-
-            if last_asn_obj:
-                last_owner = last_asn_obj.owner
-                last_line_number = int(last_asn_obj.line_number or 0)
-                if last_owner != owner or last_line_number >= MAX_RECORDS_PER_ASN:
-                    last_asn_num += 1
-                    last_line_number = 0
-            else:
-                last_line_number = 0
-
-            while total_records > 0:
-                if last_line_number < MAX_RECORDS_PER_ASN:
-                    remaining = MAX_RECORDS_PER_ASN - last_line_number
-                    to_add = min(total_records, remaining)
-                    current_asn = f"{prefix}{last_asn_num:07d}"
-
-                    for i in range(1, to_add + 1):
-                        line_number = last_line_number + i
-                        DownloadInventory.objects.create(
-                            owner=owner,
-                            location=location,
-                            case=case,
-                            sku=sku,
-                            uom=uom,
-                            quantity=quantity,
-                            asn_number=current_asn,
-                            line_number=f"{line_number:05d}",
-                            status=status,
-                            updated_username=username,
-                            updated_datetime=timezone.now().replace(microsecond=0),
-                        )
-
-                    last_line_number += to_add
-                    total_records -= to_add
-                else:
-                    last_asn_num += 1
-                    last_line_number = 0
-
-            if is_export:
-                last_asn_num += 1
-
-            nextup.Current_Number = f"{prefix}{last_asn_num:07d}"
-            nextup.Next_Number = f"{prefix}{last_asn_num + 1:07d}"
-            nextup.updated_username = username
-            nextup.save()
+        sequence = get_sequence("ASN")
+        max_lines = sequence.get_row(username).NUMBEROFLINES
+        plan = plan_asn_lines(units, max_lines)
+        asn_numbers = sequence.take(plan[-1][0] + 1, username)
+        lines = build_inventory_lines(units, plan, asn_numbers, STATUS_PENDING, username, **line_fields)
+    except (DatabaseError, SequenceExhausted) as e:
+        raise AsnGenerationError(f"Error generating ASN for records: {e}")
+
+    for line, unit in zip(lines, units):
+        line.source_ids = unit.source_ids if consolidate else [unit.pk]
+
+    with transaction.atomic():
+        # Stamped as the insert transaction starts: incremental runs only pass
+        # lines this old (EXPORT_WATERMARK_LAG), see export_runs.py
+        now = timezone.now().replace(microsecond=0)
+        for line in lines:
+            line.updated_datetime = now
+        DownloadInventory.objects.bulk_create(lines, batch_size=batch_size)
+        if consolidate:
+            AsnLineSource.objects.bulk_create([
+                AsnLineSource(capture_id=capture_id, asn_number=line.asn_number, line_number=line.line_number)
+                for line in lines for capture_id in line.source_ids
+            ], batch_size=batch_size)
+
+        # Captures committed by a parallel run, or late arrivals below the
+        # last id we read, make the count differ: back out and let the user retry
+        claimed = InventoryCapture.objects.filter(
+            pk__lte=records[-1].pk, status=STATUS_NEW
+        ).update(status=STATUS_PROCESSED)
+        if claimed != len(records):
+            raise AsnGenerationError("Records are being processed by another ASN run, please retry.")
+        # robust: a failed rollup write is logged; rebuild_rollups repairs it
+        transaction.on_commit(lambda: record_allocation(records, lines), robust=True)
 
+    logger.info("ASN run by %s: %s", username, allocation_summary(lines, max_lines))
+    return lines
+
+
+# Generates ASNs for every new capture record and marks the captures processed.
+# Returns the number of captures processed (0 when there was nothing to do).
+def generate_pending_asns(username, consolidate=None, packing=None):
+    try:
+        lines = allocate_pending_asns(username, consolidate=consolidate, packing=packing)
+        return allocation_summary(lines)["captures"]
     except DatabaseError as e:
-        print(f"Database error in add_inventory: {e}")
-        return False
-    except Exception as e:
-        print(f"Unexpected error in add_inventory: {e}")
-        return False
+        raise AsnGenerationError(f"Error generating ASN for records: {e}")
+
+
+CAPTURE_REQUIRED_FIELDS = ('location', 'sku', 'uom')
+
+# Largest QUANTITY the (signed 32-bit) column holds
+MAX_CAPTURE_QUANTITY = 2147483647
+
+
+# Checks a cleaned text field against its column width, so an over-long value
+# is reported on its line instead of failing the whole insert (DataError on
+# MySQL strict mode)
+def check_capture_length(cleaned, errors, field):
+    max_length = InventoryCapture._meta.get_field(field).max_length
+    if field not in errors and len(cleaned[field]) > max_length:
+        errors[field] = f"{field} must be at most {max_length} characters"
+
+
+# Validates one scanner capture line; returns (cleaned fields, errors)
+def validate_capture_line(line, default_owner):
+    if not isinstance(line, dict):
+        return None, {"line": "Must be an object"}
+
+    errors = {}
+    cleaned = {}
+    key = str(line.get('key') or '').strip()
+    if not key:
+        errors['key'] = "Idempotency key is required"
+    elif len(key) > 64:
+        errors['key'] = "Idempotency key must be at most 64 characters"
+    cleaned['capture_key'] = key
+
+    owner = str(line.get('owner') or default_owner or '').strip()
+    if not owner:
+        errors['owner'] = "Owner is required"
+    cleaned['owner'] = owner
+
+    for field in CAPTURE_REQUIRED_FIELDS:
+        value = str(line.get(field) or '').strip()
+        if not value:
+            errors[field] = f"{field} is required"
+        cleaned[field] = value
+    cleaned['case'] = str(line.get('case') or '').strip()
+    for field in ('owner', 'case') + CAPTURE_REQUIRED_FIELDS:
+        check_capture_length(cleaned, errors, field)
+
+    try:
+        cleaned['quantity'] = int(line.get('quantity'))
+        if cleaned['quantity'] < 1:
+            errors['quantity'] = "Quantity must be a positive number"
+        elif cleaned['quantity'] > MAX_CAPTURE_QUANTITY:
+            errors['quantity'] = f"Quantity must be at most {MAX_CAPTURE_QUANTITY}"
+    except (TypeError, ValueError):
+        errors['quantity'] = "Please enter a valid quantity number"
+
+    if not errors:
+        errors = validate_capture(cleaned['owner'], cleaned['location'], cleaned['sku'], cleaned['uom'])
+
+    return cleaned, errors
+
+
+# Saves a batch of scanner capture lines with one bulk insert. Lines whose key
+# was already captured (an earlier upload or a repeat within this batch) are
+# reported as duplicates instead of being inserted again. Returns per-line
+# results in request order.
+def save_capture_batch(lines, username, default_owner=None, batch_size=500):
+    results = []
+    to_create = {}
+    for index, line in enumerate(lines):
+        cleaned, errors = validate_capture_line(line, default_owner)
+        result = {"index": index, "key": cleaned["capture_key"] if cleaned else None}
+        if errors:
+            result.update(status="invalid", errors=errors)
+        elif cleaned["capture_key"] in to_create:
+            result.update(status="duplicate")
+        else:
+            to_create[cleaned["capture_key"]] = cleaned
+            result.update(status="created")
+        results.append(result)
+
+    keys = list(to_create)
+    existing = set(
+        InventoryCapture.objects.filter(capture_key__in=keys).values_list('capture_key', flat=True)
+    ) if keys else set()
+
+    now = timezone.now().replace(microsecond=0)
+    captures = [
+        InventoryCapture(username=username, status=STATUS_NEW, created_date=now, **fields)
+        for key, fields in to_create.items() if key not in existing
+    ]
+    with transaction.atomic():
+        # ignore_conflicts covers a replay racing this request with the same
+        # keys (such a race can count the raced lines twice in the rollups)
+        InventoryCapture.objects.bulk_create(captures, batch_size=batch_size, ignore_conflicts=True)
+        record_captures(captures)
 
-    return True
+    ids = dict(
+        InventoryCapture.objects.filter(capture_key__in=keys).values_list('capture_key', 'pk')
+    ) if keys else {}
+    for result in results:
+        if result["status"] == "invalid":
+            continue
+        if result["status"] == "created" and result["key"] in existing:
+            result["status"] = "duplicate"
+        result["id"] = ids.get(result["key"])
+    return results
@@ -2,25 +2,40 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import JsonResponse, FileResponse, StreamingHttpResponse, HttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_date, parse_datetime
+from django.conf import settings
+from django.urls import reverse
 from django.utils import timezone
-from django.contrib.auth.hashers import make_password
 from django.db import DatabaseError, IntegrityError, transaction
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.handlers.asgi import ASGIRequest
+from django.middleware.csrf import get_token
+from asgiref.sync import sync_to_async
 
 # Importing models and utility functions
-from .models import InventoryCapture, UserMaster, NextupNumber, DownloadInventory
-from .utils import add_inventory
-from .export_excel import export_datas_to_excel
+from .models import InventoryCapture, NextupNumber, DownloadInventory, ExportJob, ExportRun, STATUS_NEW
+from .jobs import enqueue_job, artifact_path
+from .export_runs import ExportRunConflict, create_export_run, run_response
+from .utils import AsnGenerationError, allocation_summary, check_packing, save_capture_batch
+from . import export_cache
+from .export_excel import export_inventory_excel, generate_and_write_workbook, new_export_batch, release_batch
+from .export_formats import EXPORT_FORMATS, batch_export_response, batch_file_response, get_writer, stream_export
+from .metrics import connection_stats, prometheus_text
+from .logins import record_login
+from .masters import validate_capture
+from .sequences import get_sequence
+from .rollups import record_captures, rollup_report
+import asyncio
+import json
 import logging
+import threading
+import weakref
+from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
-# Status constants for tracking inventory processing
-STATUS_NEW = 0
-STATUS_PENDING = 1
-STATUS_PROCESSED = 2
-
 # Handles user login with optional auto-creation in UserMaster
 def login_view(request):
     if request.method == 'POST':
@@ -33,12 +48,7 @@ def login_view(request):
 
             if user:
                 login(request, user)
-                if not UserMaster.objects.filter(username=username).exists():
-                    hashed_password = make_password(password)
-                    UserMaster.objects.create(username=username, password=hashed_password)
-                else:
-                    user_obj = UserMaster.objects.get(username=username)
-                    user_obj.save()
+                record_login(user)
 
                 return redirect('main')
             else:
@@ -91,7 +101,9 @@ def owner_view(request):
             if not owner:
                 messages.error(request, "Sorry,Invalid Owner Name")
                 return render(request, 'owner.html')
-            request.session['owner'] = owner
+            # Only touch the session when the owner changes, so it is not re-saved
+            if request.session.get('owner') != owner:
+                request.session['owner'] = owner
             return redirect('inventory')
         return render(request, 'owner.html')
 
@@ -100,10 +112,18 @@ def owner_view(request):
         logger.exception("Owner view error")
         return render(request, 'owner.html')
 
+# Scanner pages post the capture form with fetch and ask for a JSON reply,
+# so a scan is one small request instead of a redirect and a full page
+def wants_json(request):
+    return 'application/json' in request.headers.get('Accept', '')
+
 # Handles capturing inventory item details
 def inventory_view(request):
+    as_json = wants_json(request)
     try:
         if not request.user.is_authenticated:
+            if as_json:
+                return JsonResponse({"error": "Login required", "login": reverse('login')}, status=401)
             return redirect('login')
 
         if request.method == "POST":
@@ -123,31 +143,84 @@ def inventory_view(request):
             try:
                 quantity = int(request.POST.get("quantity"))
             except (TypeError, ValueError):
-                messages.error(request, "Please enter a valid quantity number")
+                errors = {'quantity': "Please enter a valid quantity number"}
+            else:
+                # Reject values that are not on the owner/location/SKU/UOM masters
+                errors = validate_capture(owner, location, sku, uom)
+
+            if errors:
+                if as_json:
+                    return JsonResponse({"errors": errors}, status=400)
+                for error in errors.values():
+                    messages.error(request, error)
                 return render(request, "Inventory.html")
 
-            # Save inventory record
-            InventoryCapture.objects.create(
-                owner=owner,
-                location=location,
-                sku=sku,
-                uom=uom,
-                case=case,
-                quantity=quantity,
-                username=username,
-                status=status
-            )
-
+            # Save inventory record (and count it in the reporting rollups)
+            with transaction.atomic():
+                capture = InventoryCapture.objects.create(
+                    owner=owner,
+                    location=location,
+                    sku=sku,
+                    uom=uom,
+                    case=case,
+                    quantity=quantity,
+                    username=username,
+                    status=status
+                )
+                record_captures([capture])
+
+            if as_json:
+                return JsonResponse({"id": capture.pk, "message": "Inventory Captured Successfully!"}, status=201)
             messages.success(request, "Inventory Captured Successfully!")
             return redirect("inventory")
 
         return render(request, "Inventory.html")
 
     except Exception as e:
-        messages.error(request, f"Something went wrong: {str(e)}")
         logger.exception("Inventory error")
+        if as_json:
+            return JsonResponse({"error": f"Something went wrong: {str(e)}"}, status=500)
+        messages.error(request, f"Something went wrong: {str(e)}")
         return render(request, "Inventory.html")
 
+# Accepts a JSON batch of scanned capture lines from handheld scanners:
+# {"owner": "...", "lines": [{"key": "...", "location": "...", "sku": "...",
+#   "uom": "...", "case": "...", "quantity": 1, "owner": "..."}, ...]}
+# Every line needs a unique "key"; replaying a batch never captures a key twice.
+# Scanners sign in with the login form (session cookie) and stay CSRF
+# protected: a GET returns {"csrftoken": "..."} to send back in the
+# X-CSRFToken header of each POST.
+def capture_batch_view(request):
+    if request.method not in ("GET", "POST"):
+        return JsonResponse({"error": "POST required"}, status=405)
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Login required"}, status=401)
+    if request.method == "GET":
+        return JsonResponse({"csrftoken": get_token(request)})
+
+    try:
+        payload = json.loads(request.body)
+        lines = payload.get('lines') if isinstance(payload, dict) else None
+    except ValueError:
+        return JsonResponse({"error": "Body must be JSON"}, status=400)
+
+    if not isinstance(lines, list) or not lines:
+        return JsonResponse({"error": "lines must be a non-empty list"}, status=400)
+
+    max_lines = getattr(settings, 'CAPTURE_BATCH_MAX_LINES', 500)
+    if len(lines) > max_lines:
+        return JsonResponse({"error": f"At most {max_lines} lines per batch"}, status=400)
+
+    try:
+        owner = payload.get('owner') or request.session.get('owner')
+        results = save_capture_batch(lines, request.user.username, default_owner=owner)
+        summary = {status: sum(1 for r in results if r["status"] == status)
+                   for status in ("created", "duplicate", "invalid")}
+        return JsonResponse({"results": results, **summary})
+    except Exception as e:
+        logger.exception("Capture batch error")
+        return JsonResponse({"error": str(e)}, status=500)
+
 # Logs out the user and redirects to login page
 def logout_view(request):
     try:
@@ -182,63 +255,466 @@ def nextup_number_view(request):
         logger.exception("ASN JSON error")
         return JsonResponse({"error": str(e)}, status=500)
 
-# Returns all download inventory data as JSON
-def download_inventory_view(request):
+# Builds the filtered DownloadInventory queryset for download_inventory_view.
+# Raises ValueError for malformed filter values.
+def filter_download_inventory(params):
+    records = DownloadInventory.objects.all()
+    if params.get('asn_number'):
+        records = records.filter(asn_number=params['asn_number'])
+    if params.get('owner'):
+        records = records.filter(owner=params['owner'])
+    if params.get('download_status'):
+        records = records.filter(download_status=params['download_status'])
+
+    for param, lookup in (('date_from', 'updated_datetime__gte'), ('date_to', 'updated_datetime__lt')):
+        value = params.get(param)
+        if not value:
+            continue
+        parsed = parse_date(value) or parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f"{param} must be a date (YYYY-MM-DD) or datetime")
+        if param == 'date_to' and not isinstance(parsed, datetime):
+            parsed += timedelta(days=1)  # date_to is inclusive for plain dates
+        records = records.filter(**{lookup: parsed})
+
+    after = params.get('after')
+    if after:
+        records = records.filter(pk__gt=int(after))
+    return records.order_by('pk')
+
+
+# Streams ``records`` (ordered by id) in keyset pages of ``chunk_size`` rows,
+# each its own LIMIT query after the last id sent. A single iterator() query
+# would not stream on MySQL: mysqlclient buffers the whole result client-side.
+def stream_ndjson(records, chunk_size):
+    last_seen = None
+    while True:
+        page = records if last_seen is None else records.filter(pk__gt=last_seen)
+        page = list(page.values()[:chunk_size])
+        if not page:
+            return
+        for record in page:
+            yield json.dumps(record, cls=DjangoJSONEncoder) + "\n"
+        last_seen = page[-1]['id']
+
+
+async def astream_ndjson(records, chunk_size):
+    last_seen = None
+    while True:
+        page = records if last_seen is None else records.filter(pk__gt=last_seen)
+        page = [record async for record in page.values()[:chunk_size]]
+        if not page:
+            return
+        for record in page:
+            yield json.dumps(record, cls=DjangoJSONEncoder) + "\n"
+        last_seen = page[-1]['id']
+
+
+# Returns download inventory data as JSON, one keyset page at a time:
+# ?after=<last id>&limit=<n> plus optional asn_number, owner, download_status,
+# date_from and date_to filters. ?format=ndjson streams every matching row
+# as newline-delimited JSON instead.
+async def download_inventory_view(request):
+    if request.GET.get('format') != 'ndjson':
+        return await sync_to_async(download_inventory_page)(request)
+
+    try:
+        records = filter_download_inventory(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    chunk_size = getattr(settings, 'DOWNLOAD_INVENTORY_CHUNK_SIZE', 2000)
+    rows = astream_ndjson if isinstance(request, ASGIRequest) else stream_ndjson
+    return StreamingHttpResponse(rows(records, chunk_size), content_type='application/x-ndjson')
+
+
+# One keyset page of download_inventory_view
+def download_inventory_page(request):
     try:
-        records = DownloadInventory.objects.all().values()
-        return JsonResponse(list(records), safe=False)
+        records = filter_download_inventory(request.GET)
+
+        max_limit = getattr(settings, 'DOWNLOAD_INVENTORY_MAX_PAGE', 5000)
+        limit = min(int(request.GET.get('limit', 500)), max_limit)
+        if limit < 1:
+            raise ValueError("limit must be positive")
+
+        page = list(records.values()[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        next_after = page[-1]['id'] if has_more else None
+        next_url = None
+        if next_after is not None:
+            query = request.GET.copy()
+            query['after'] = next_after
+            next_url = f"{request.path}?{query.urlencode()}"
+        return JsonResponse({"results": page, "next_after": next_after, "next": next_url})
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
     except Exception as e:
         logger.exception("Download inventory error")
         return JsonResponse({"error": str(e)}, status=500)
 
+# At most EXPORT_CONCURRENCY exports render at once per process. Under ASGI
+# further export requests wait on the event loop without holding a thread.
+# Under WSGI every request runs its async view on a loop of its own, so the
+# process-wide thread semaphore does the limiting there (waiting requests
+# hold their worker thread).
+_export_slots = weakref.WeakKeyDictionary()
+# EXPORT_CONCURRENCY -> semaphore, so a changed setting gets its own
+_thread_slots = {}
+_thread_slots_lock = threading.Lock()
+
+
+def export_slots():
+    loop = asyncio.get_running_loop()
+    if loop not in _export_slots:
+        _export_slots[loop] = asyncio.Semaphore(getattr(settings, 'EXPORT_CONCURRENCY', 2))
+    return _export_slots[loop]
+
+
+def thread_slots():
+    limit = getattr(settings, 'EXPORT_CONCURRENCY', 2)
+    with _thread_slots_lock:
+        if limit not in _thread_slots:
+            _thread_slots[limit] = threading.BoundedSemaphore(limit)
+        return _thread_slots[limit]
+
+
+def run_in_thread_slot(func, request):
+    with thread_slots():
+        return func(request)
+
+
+# Runs a blocking export in this request's worker thread (sync_to_async keeps
+# it on the request's database connection), bounded by export_slots() and
+# thread_slots()
+async def run_export(func, request):
+    async with export_slots():
+        return await sync_to_async(run_in_thread_slot)(func, request)
+
+
+async def aiter_file(filelike, block_size=64 * 1024):
+    # Local temporary file: each read returns within microseconds
+    while chunk := filelike.read(block_size):
+        yield chunk
+
+
+# Under ASGI, sends a file response through an async iterator instead of
+# handing every chunk of the file to a worker thread
+def stream_async(request, response):
+    if isinstance(request, ASGIRequest) and isinstance(response, FileResponse) and response.file_to_stream:
+        response.streaming_content = aiter_file(response.file_to_stream)
+    return response
+
+
 # Exports current download data into Excel format
-def download_excel_view(request):
+async def download_excel_view(request):
+    response = await run_export(download_excel_response, request)
+    return stream_async(request, response)
+
+
+# 400 page for an unknown ?format=, or None when the format is known
+def format_error_response(request, export_format):
     try:
-        return export_datas_to_excel(request)
+        get_writer(export_format)
+    except ValueError as e:
+        messages.error(request, str(e))
+        return render(request, "main.html", status=400)
+    return None
+
+
+# Blocking part of download_excel_view. ?format=csv|ndjson|parquet streams the
+# pending rows in that format instead of the workbook.
+def download_excel_response(request):
+    export_format = request.GET.get('format', 'xlsx')
+    error = format_error_response(request, export_format)
+    if error:
+        return error
+
+    try:
+        # Incremental runs leave DOWNLOADSTATUS alone, in every format
+        if request.GET.get('mode') == 'incremental' or getattr(settings, 'EXCEL_EXPORT_INCREMENTAL', False):
+            return export_incremental(request, export_format)
+        if export_format != 'xlsx':
+            return stream_export(request, export_format)
+        return export_inventory_excel(request)
     except Exception as e:
         messages.error(request, f"Download Excel Error: {str(e)}")
         logger.exception("Excel download error")
         return render(request, "main.html")
 
+# Exports the rows added since the last incremental export as a new run
+def export_incremental(request, export_format='xlsx'):
+    try:
+        run = create_export_run(request.user.username)
+    except ExportRunConflict as e:
+        messages.error(request, str(e))
+        return redirect("inventory")
+
+    response = run_response(run, export_format) if run else None
+    if response is None:
+        messages.warning(request, "Sorry, no data found to export!")
+        return redirect("inventory")
+    return response
+
 # Generates ASN numbers from new inventory records and exports as Excel
-def generate_asn_and_download(request):
+async def generate_asn_and_download(request):
     if request.method == "POST":
-        try:
-            with transaction.atomic():
-                new_records = InventoryCapture.objects.filter(status=STATUS_NEW)
-
-                # No records found for processing
-                if not new_records.exists():
-                    messages.warning(request, "No new records to generate ASN.")
-                    return render(request, "main.html")
-
-                # Add each new record to download table
-                for record in new_records:
-                    success = add_inventory(
-                        owner=record.owner,
-                        location=record.location,
-                        case=record.case,
-                        sku=record.sku,
-                        uom=record.uom,
-                        record_count=1,
-                        quantity=record.quantity,
-                        status=STATUS_PENDING,
-                        username=request.user.username
-                    )
-                    if not success:
-                        messages.error(request, "Error generating ASN for records.")
-                        return render(request, "main.html")
-
-                # Update status to processed after successful ASN generation
-                new_records.update(status=STATUS_PROCESSED)
-
-            # Export updated records as Excel file
-            return export_datas_to_excel(request)
+        response = await run_export(generate_and_download_response, request)
+        return stream_async(request, response)
+    return redirect("main")
 
-        except Exception as e:
-            messages.error(request, f"Failed: {e}")
-            logger.exception("ASN generation failed")
+
+# Options of a generate (or export job) request, from the query string or the
+# form: ?consolidate=1 / 0 and ?pack=<mode> override ASN_CONSOLIDATE_CAPTURES
+# and ASN_PACKING for this run, ?format= picks the file format. Returns
+# ExportJob field values; raises ValueError for an unknown mode or format.
+def export_options(request):
+    def param(name, default=None):
+        return request.GET.get(name, request.POST.get(name, default))
+
+    consolidate = param('consolidate')
+    if consolidate is not None:
+        consolidate = consolidate.lower() in ('1', 'true', 'yes')
+    packing = param('pack')
+    if packing == 'none':
+        packing = ''
+    if packing is not None:
+        check_packing(packing)
+    export_format = param('format', 'xlsx')
+    get_writer(export_format)
+    return {"consolidate": consolidate, "packing": packing, "export_format": export_format}
+
+
+# Blocking part of generate_asn_and_download
+def generate_and_download_response(request):
+    try:
+        options = export_options(request)
+    except ValueError as e:
+        messages.error(request, str(e))
+        return render(request, "main.html", status=400)
+
+    # Hand the work to the export job worker and let the page poll for it
+    if getattr(settings, 'EXPORT_JOBS_ENABLED', False):
+        job = enqueue_job(ExportJob.KIND_GENERATE, request.user.username, **options)
+        return render(request, "main.html", {"job": job_payload(job)})
+
+    consolidate, packing, export_format = options["consolidate"], options["packing"], options["export_format"]
+    batch = new_export_batch()
+    source = export_cache.SourceHash(export_format)
+    output = export_cache.render_file()
+    lines = None
+    try:
+        # Generate ASNs and write them straight into the export file
+        lines = generate_and_write_workbook(
+            output, request.user.username, consolidate=consolidate, packing=packing,
+            writer=source.wrap(get_writer(export_format)), batch=batch
+        )
+        if not lines:
+            export_cache.discard(output)
+            messages.warning(request, "No new records to generate ASN.")
             return render(request, "main.html")
 
-    return redirect("main")
-    
\ No newline at end of file
+        summary = allocation_summary(lines, get_sequence("ASN").get_row().NUMBEROFLINES)
+        file = export_cache.publish_and_open(batch, export_format, source.hexdigest(), output)
+        response = batch_file_response(file, export_format, batch)
+        response['X-Capture-Count'] = summary["captures"]
+        response['X-Line-Count'] = summary["lines"]
+        response['X-Line-Reduction'] = summary["reduction_ratio"]
+        response['X-Asn-Count'] = summary["asns"]
+        response['X-Asn-Fill-Ratio'] = summary["fill_ratio"]
+        return response
+
+    except AsnGenerationError as e:
+        export_cache.discard(output)
+        messages.error(request, str(e))
+        return render(request, "main.html")
+    except Exception as e:
+        export_cache.discard(output)
+        if lines:
+            # Generated but never sent: hand the lines to the next plain export
+            release_batch(batch)
+        messages.error(request, f"Failed: {e}")
+        logger.exception("ASN generation failed")
+        return render(request, "main.html")
+
+
+def job_payload(job):
+    data = {
+        "id": job.pk,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "message": job.message,
+        "row_count": job.row_count,
+        "status_url": reverse('export_job_status', args=[job.pk]),
+        "download_url": None,
+    }
+    if job.status == ExportJob.STATUS_DONE and job.artifact:
+        data["download_url"] = reverse('export_job_download', args=[job.pk])
+    return data
+
+# Queues a background ASN generation / export job and returns its id. Takes
+# format, pack and consolidate as generate-asn-download does (see export_options)
+def export_job_create_view(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "POST required"}, status=405)
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Login required"}, status=401)
+
+    kind = request.POST.get('kind', ExportJob.KIND_GENERATE)
+    if kind not in dict(ExportJob.KIND_CHOICES):
+        return JsonResponse({"error": f"Unknown job kind: {kind}"}, status=400)
+    try:
+        options = export_options(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        job = enqueue_job(kind, request.user.username, **options)
+        return JsonResponse(job_payload(job), status=202)
+    except Exception as e:
+        logger.exception("Export job create error")
+        return JsonResponse({"error": str(e)}, status=500)
+
+# Returns status and progress of an export job as JSON
+def export_job_status_view(request, job_id):
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Login required"}, status=401)
+
+    try:
+        job = ExportJob.objects.get(pk=job_id)
+        return JsonResponse(job_payload(job))
+    except ObjectDoesNotExist:
+        return JsonResponse({"error": "Export job does not exist"}, status=404)
+    except Exception as e:
+        logger.exception("Export job status error")
+        return JsonResponse({"error": str(e)}, status=500)
+
+# Sends the finished Excel file of an export job
+def export_job_download_view(request, job_id):
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Login required"}, status=401)
+
+    try:
+        job = ExportJob.objects.get(pk=job_id, status=ExportJob.STATUS_DONE)
+        if not job.artifact:
+            return JsonResponse({"error": job.message or "Export job has no file"}, status=404)
+        return FileResponse(
+            open(artifact_path(job), 'rb'), as_attachment=True, filename=job.artifact,
+            content_type=EXPORT_FORMATS[job.export_format][0]
+        )
+    except (ObjectDoesNotExist, FileNotFoundError):
+        return JsonResponse({"error": "Export file does not exist"}, status=404)
+    except Exception as e:
+        logger.exception("Export job download error")
+        return JsonResponse({"error": str(e)}, status=500)
+
+# Lists the most recent incremental export runs as JSON
+def export_run_list_view(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Login required"}, status=401)
+
+    try:
+        runs = ExportRun.objects.order_by('-pk')[:50]
+        return JsonResponse({"runs": [
+            {
+                "id": run.pk,
+                "first_id": run.first_id,
+                "last_id": run.last_id,
+                "row_count": run.row_count,
+                "username": run.username,
+                "created_date": run.created_date,
+                "download_url": reverse('export_run_download', args=[run.pk]) if run.row_count else None,
+            }
+            for run in runs
+        ]}, encoder=DjangoJSONEncoder)
+    except Exception as e:
+        logger.exception("Export run list error")
+        return JsonResponse({"error": str(e)}, status=500)
+
+# Re-downloads the file of an earlier incremental export run, ?format= as on
+# download_excel
+def export_run_download_view(request, run_id):
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Login required"}, status=401)
+
+    try:
+        response = run_response(ExportRun.objects.get(pk=run_id), request.GET.get('format', 'xlsx'))
+        if response is None:
+            return JsonResponse({"error": "Export run has no rows"}, status=404)
+        return response
+    except ObjectDoesNotExist:
+        return JsonResponse({"error": "Export run does not exist"}, status=404)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        logger.exception("Export run download error")
+        return JsonResponse({"error": str(e)}, status=500)
+
+# Downloads an earlier export again by the batch id in its X-Export-Batch
+# header, ?format= as on download_excel. Served from the export cache without
+# reading inventory rows; rebuilt read-only from the batch's rows if evicted.
+def export_batch_download_view(request, batch):
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Login required"}, status=401)
+
+    try:
+        response = batch_export_response(batch, request.GET.get('format', 'xlsx'))
+        if response is None:
+            return JsonResponse({"error": "Export batch does not exist"}, status=404)
+        return response
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        logger.exception("Export batch download error")
+        return JsonResponse({"error": str(e)}, status=500)
+
+# Returns capture and ASN totals from the hourly rollup tables as JSON:
+# ?date=YYYY-MM-DD (default today) or date_from/date_to (dates or datetimes,
+# date_to inclusive for plain dates), group_by=<comma separated owner, sku,
+# username, hour> (default owner) and optional owner and username filters.
+def rollup_report_view(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Login required"}, status=401)
+
+    try:
+        params = request.GET
+        day = parse_date(params['date']) if params.get('date') else timezone.now().date()
+        if day is None:
+            raise ValueError("date must be YYYY-MM-DD")
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=1)
+
+        for param in ('date_from', 'date_to'):
+            value = params.get(param)
+            if not value:
+                continue
+            parsed = parse_datetime(value) or parse_date(value)
+            if parsed is None:
+                raise ValueError(f"{param} must be a date (YYYY-MM-DD) or datetime")
+            if not isinstance(parsed, datetime):
+                parsed = datetime.combine(parsed, datetime.min.time())
+                if param == 'date_to':
+                    parsed += timedelta(days=1)  # date_to is inclusive for plain dates
+            if param == 'date_from':
+                start = parsed
+            else:
+                end = parsed
+
+        group_by = [name.strip() for name in params.get('group_by', 'owner').split(',') if name.strip()]
+        report = rollup_report(start, end, group_by, owner=params.get('owner'), username=params.get('username'))
+        return JsonResponse(report, encoder=DjangoJSONEncoder)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        logger.exception("Rollup report error")
+        return JsonResponse({"error": str(e)}, status=500)
+
+# Returns database connection reuse counters for this process as JSON
+def connection_metrics_view(request):
+    return JsonResponse(connection_stats())
+
+# Returns request, query and connection counters in Prometheus text format
+def prometheus_metrics_view(request):
+    return HttpResponse(prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,43 @@
+# Gunicorn settings for serving Inventory_project in production. Every value
+# can be overridden from the environment so one image fits any host size.
+#
+#   gunicorn -c gunicorn.conf.py
+#
+# Graceful reload (new code and settings, in-flight requests finish first):
+#   kill -HUP <master pid>
+import multiprocessing
+import os
+
+# WSGI by default; set GUNICORN_APP=Inventory_project.asgi:application together
+# with GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker to serve over ASGI
+wsgi_app = os.environ.get('GUNICORN_APP', 'Inventory_project.wsgi:application')
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Process workers, each running a pool of threads: a long Excel export ties up
+# one thread while scans keep flowing through the others
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 9)))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# A request may run this long before its worker is restarted. It has to cover
+# the slowest synchronous export (generate-asn-download on a full shift of
+# captures); scan requests finish in milliseconds and never get near it.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 300))
+# On reload or shutdown, workers get this long to finish running exports
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 120))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers now and then so memory held by large pandas exports is returned
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+# Writes the last logins a worker still has queued before it exits (a
+# max_requests recycle, reload or shutdown), see Inventoryapp/logins.py
+def worker_exit(server, worker):
+    from Inventoryapp.logins import flush_queued
+    flush_queued()
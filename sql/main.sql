@@ -10,4 +10,7 @@ SELECT * FROM USERMASTER;
 SELECT * FROM NEXTUPNUMBER;
 SELECT * FROM DOWNLOADINVENTORY;
 
-
+-- Today's totals per owner from the reporting rollups (maintained by the app,
+-- no scan of INVENTORYCAPTURE/DOWNLOADINVENTORY; also served as JSON at /reports/rollups/)
+SELECT OWNER, SUM(LINECOUNT), SUM(QUANTITY), SUM(PROCESSEDLINES) FROM CAPTUREROLLUP WHERE HOUR >= CURDATE() GROUP BY OWNER;
+SELECT OWNER, STATUS, SUM(ASNCOUNT), SUM(LINECOUNT), SUM(QUANTITY) FROM ASNROLLUP WHERE HOUR >= CURDATE() GROUP BY OWNER, STATUS;